@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Async Server - Motor asyncio para el modo servidor de Clipboard Sync
+Atiende miles de clientes en un solo hilo con memoria acotada
+"""
+
+import asyncio
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from outbound import OutboundQueue
+from protocol import (CHANNEL_HEARTBEAT, CHANNEL_HELLO, CHANNEL_TRANSFER, FRAME_HEADER,
+                      PROTOCOL_VERSION, pack_frame)
+from transfer import MAX_CHUNK_SIZE
+
+
+# Tamaño máximo de una trama entrante: los contenidos grandes llegan por
+# trozos, así que cada conexión lee como mucho un trozo y su cabecera
+MAX_FRAME_SIZE = MAX_CHUNK_SIZE + 64 * 1024
+
+
+class AsyncPeerWriter:
+    """
+    Escritor de un peer para el motor asyncio: una tarea vacía la
+    OutboundQueue esperando a drain() tras cada trama, así el buffer del
+    transporte no crece y la política de la cola decide qué descartar.
+    Los trozos de las transferencias se generan (y comprimen) en un hilo
+    del executor para no bloquear el event loop.
+    Todos los métodos se llaman desde el event loop salvo close(), que
+    puede llamarse desde cualquier hilo.
+    """
+
+    def __init__(self, writer, name, maxsize, policy):
+        self.writer = writer
+        self.name = name
+        self.loop = asyncio.get_running_loop()
+        self.queue = OutboundQueue(maxsize, policy)
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    def send(self, channel, frame, received_at=None):
+        """Encola una trama. Devuelve False si hay que desconectar"""
+        if self.closed or not self.queue.push(channel, frame, received_at):
+            return False
+        self._ready.set()
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while not self.closed:
+                await self._ready.wait()
+                self._ready.clear()
+                while self.queue.pending() and not self.closed:
+                    # Las tramas encoladas van antes que el siguiente trozo
+                    item = self.queue.pop() if self.queue else None
+                    if item is None:
+                        frame = await loop.run_in_executor(None, next, self.queue.stream, None)
+                        if frame is None:
+                            self.queue.end_stream()
+                            continue
+                        self.writer.write(frame)
+                        await self.writer.drain()
+                        self.queue.record_chunk(len(frame))
+                        continue
+
+                    channel, frame, queued_at, relayed = item
+                    if not isinstance(frame, (bytes, bytearray)):
+                        self.queue.start_stream(frame, self.writer, queued_at, relayed)
+                        continue
+                    self.writer.write(frame)
+                    await self.writer.drain()
+                    self.queue.record_sent(len(frame), queued_at, relayed, channel)
+        except (ConnectionError, OSError):
+            # El lector de la conexión detecta el cierre y la limpia
+            self.writer.close()
+
+    def close(self):
+        self.closed = True
+        # asyncio.Event no es seguro entre hilos: se despierta desde el event loop
+        try:
+            self.loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # El event loop ya se ha cerrado y la tarea con él
+            pass
+
+
+class AsyncClipboardServer:
+    """
+    Servidor basado en asyncio streams.
+
+    La lógica por cliente es la misma que en el motor de hilos: cada trama
+    se entrega a ClipboardSync.handle_frame. Como el acceso al portapapeles
+    bloquea, se ejecuta en un único hilo auxiliar; el cliente no lee la
+    siguiente trama hasta que la anterior se ha aplicado, así que cada
+    conexión tiene como mucho una trama en memoria.
+    """
+
+    def __init__(self, sync, max_frame_size=MAX_FRAME_SIZE):
+        self.sync = sync
+        self.max_frame_size = max_frame_size
+        self.loop = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clipboard")
+
+    def run(self):
+        """Ejecuta el servidor hasta Ctrl+C o hasta que sync.running sea False"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\n[*] Deteniendo servidor...")
+        finally:
+            self.sync.running = False
+            self.executor.shutdown(wait=False)
+            self.sync.print_stats()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(
+            self.handle_client, self.sync.host, self.sync.port,
+            backlog=socket.SOMAXCONN, reuse_address=True
+        )
+
+        self.sync.log(f"Servidor asyncio escuchando en {self.sync.host}:{self.sync.port}", "success")
+        self.sync.log("Los clientes deben conectarse a esta IP")
+        self.sync.client_count_status()
+        self.sync.show_local_ip()
+
+        # El monitor del portapapeles sigue en su propio hilo
+        clipboard_thread = threading.Thread(
+            target=self.sync.monitor_clipboard,
+            args=(self.sync.broadcast_to_clients,),
+            daemon=True
+        )
+        clipboard_thread.start()
+
+        async with server:
+            while self.sync.running:
+                await asyncio.sleep(1)
+
+            for writer in list(self.sync.writers):
+                writer.close()
+
+    async def handle_client(self, reader, writer):
+        """Maneja la conexión de un cliente"""
+        addr = writer.get_extra_info('peername')
+        self.sync.log(f"Cliente conectado desde {addr[0]}:{addr[1]}", "success")
+        # Los escritores se registran en sync.writers, igual que en el motor de hilos
+        self.sync.writers[writer] = AsyncPeerWriter(writer, f"{addr[0]}:{addr[1]}",
+                                                    self.sync.queue_size,
+                                                    self.sync.slow_policy)
+        self.sync.heartbeat.activity(writer)
+        self.sync.client_count_status()
+
+        try:
+            self.sync.send_frame(writer, CHANNEL_HELLO, self.sync.hello_frame())
+
+            while self.sync.running:
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                except asyncio.IncompleteReadError as e:
+                    if e.partial:
+                        raise ConnectionError("Conexión cerrada a mitad de la cabecera")
+                    break
+
+                version, channel, flags, msg_size = FRAME_HEADER.unpack(header)
+                if version != PROTOCOL_VERSION:
+                    raise ValueError(f"Versión de protocolo no soportada: {version}")
+                if msg_size > self.max_frame_size:
+                    raise ValueError(f"Trama demasiado grande ({msg_size} bytes)")
+
+                data = await reader.readexactly(msg_size)
+                if channel == CHANNEL_HEARTBEAT:
+                    # Los latidos no esperan al hilo del portapapeles: el RTT mide la red
+                    self.sync.handle_frame(channel, flags, data, writer)
+                    continue
+                await self.loop.run_in_executor(self.executor, self.sync.handle_frame,
+                                                channel, flags, data, writer)
+
+        except Exception as e:
+            self.sync.log(f"Error con cliente {addr[0]}:{addr[1]}: {e}", "error")
+        finally:
+            self.sync.remove_connection(writer)
+            self.sync.log(f"Cliente {addr[0]}:{addr[1]} desconectado", "warning")
+            self.sync.client_count_status()
+
+    def broadcast_channel(self, channel, payload, peers=None, received_at=None, frames=None):
+        """
+        Envía un payload a todos los clientes (o a `peers`). Se llama desde
+        el hilo emisor, así que la compresión (una vez por códec) no bloquea
+        el event loop. `frames` puede traer tramas ya codificadas por códec.
+        """
+        frames = dict(frames or {})
+        targets = []
+        for writer in list(self.sync.writers) if peers is None else peers:
+            codec = self.sync.compressor.choose(self.sync.peer_codecs.get(writer))
+            if codec not in frames:
+                flags, data = self.sync.compressor.compress(payload, codec)
+                frames[codec] = pack_frame(channel, data, flags)
+            targets.append((writer, frames[codec]))
+        self.loop.call_soon_threadsafe(self.write_all, channel, targets, received_at)
+
+    def broadcast_transfer(self, transfer, peers=None, received_at=None):
+        """Encola una transferencia por trozos en todos los clientes (o en `peers`)"""
+        peers = list(self.sync.writers) if peers is None else peers
+        targets = [(writer, transfer) for writer in peers]
+        self.loop.call_soon_threadsafe(self.write_all, CHANNEL_TRANSFER, targets, received_at)
+
+    def write_all(self, channel, targets, received_at=None):
+        """Encola las tramas en la cola de cada cliente, dentro del event loop"""
+        for writer, frame in targets:
+            self.sync.send_frame(writer, channel, frame, received_at)
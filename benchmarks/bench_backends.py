@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark del acceso al portapapeles
+Compara la latencia por llamada de paste() y copy() de cada backend: el
+proceso auxiliar persistente, pyperclip (un xclip/xsel por llamada en
+Linux) y el portapapeles en memoria como referencia
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clipboard_backends import BACKENDS, FakeBackend
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for suffix, unit in (('K', 1024), ('M', 1024 * 1024)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * unit)
+    return int(text)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def measure(call, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    return {
+        'mean_ms': sum(times) / len(times) * 1000,
+        'p50_ms': percentile(times, 50) * 1000,
+        'p99_ms': percentile(times, 99) * 1000,
+    }
+
+
+def run(name, backend, size, repeat):
+    content = 'x' * size
+    copy = measure(lambda: backend.copy(content), repeat)
+    assert backend.paste() == content
+    paste = measure(backend.paste, repeat)
+    return {
+        'backend': name,
+        'size': size,
+        'repeat': repeat,
+        'copy': copy,
+        'paste': paste,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del acceso al portapapeles')
+    parser.add_argument('--backends', default='fake,' + ','.join(BACKENDS),
+                       help='Backends a medir (default: fake,' + ','.join(BACKENDS) + ')')
+    parser.add_argument('--sizes', default='10,10K,1M',
+                       help='Tamaños del texto, admite K y M (default: 10,10K,1M)')
+    parser.add_argument('--repeat', type=int, default=50,
+                       help='Llamadas por medición (default: 50)')
+    parser.add_argument('--json', action='store_true', help='Salida en JSON')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.backends.split(','):
+        try:
+            backend = FakeBackend() if name == 'fake' else BACKENDS[name]()
+        except Exception as e:
+            print(f"[!] Backend {name} no disponible: {e}", file=sys.stderr)
+            continue
+        try:
+            for size in (parse_size(size) for size in args.sizes.split(',')):
+                results.append(run(name, backend, size, args.repeat))
+        finally:
+            backend.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'Backend':<10} {'Tamaño':>9} {'copy p50':>10} {'copy p99':>10} "
+          f"{'paste p50':>10} {'paste p99':>10}")
+    for r in results:
+        print(f"{r['backend']:<10} {r['size']:>9} {r['copy']['p50_ms']:>8.3f}ms "
+              f"{r['copy']['p99_ms']:>8.3f}ms {r['paste']['p50_ms']:>8.3f}ms "
+              f"{r['paste']['p99_ms']:>8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark del envío diferencial (delta_sync)
+Mide los bytes ahorrados frente al envío completo con ediciones típicas
+de logs y documentos grandes
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delta_sync import DeltaSync
+from protocol import ClipboardState, encode_clipboard
+
+
+WORDS = ("servicio petición usuario conexión error tiempo respuesta cliente servidor "
+         "portapapeles sincronización archivo proceso memoria red paquete").split()
+
+
+def make_log(rng, lines):
+    return [f"2024-05-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d} "
+            f"{rng.choice(('INFO', 'WARN', 'DEBUG'))} "
+            f"{' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 14)))} "
+            f"id={rng.getrandbits(40)}\n" for _ in range(lines)]
+
+
+def append_lines(rng, lines):
+    """Un log que crece un 1%"""
+    return lines + make_log(rng, max(1, len(lines) // 100))
+
+
+def edit_lines(rng, lines):
+    """Diez líneas corregidas en sitios al azar"""
+    lines = lines[:]
+    for _ in range(10):
+        i = rng.randrange(len(lines))
+        lines[i] = lines[i].replace(' ', ' corregido ', 1)
+    return lines
+
+
+def insert_block(rng, lines):
+    """Un párrafo de 50 líneas insertado en medio"""
+    middle = len(lines) // 2
+    return lines[:middle] + make_log(rng, 50) + lines[middle:]
+
+
+def delete_block(rng, lines):
+    """100 líneas borradas"""
+    start = rng.randrange(len(lines) - 100)
+    return lines[:start] + lines[start + 100:]
+
+
+def move_section(rng, lines):
+    """Una sección de 500 líneas movida al final"""
+    start = rng.randrange(len(lines) - 500)
+    return lines[:start] + lines[start + 500:] + lines[start:start + 500]
+
+
+def reformat_all(rng, lines):
+    """Todas las líneas cambian (el delta no compensa: envío completo)"""
+    return [line.upper() for line in lines]
+
+
+EDITS = {
+    'append_lines': append_lines,
+    'edit_lines': edit_lines,
+    'insert_block': insert_block,
+    'delete_block': delete_block,
+    'move_section': move_section,
+    'reformat_all': reformat_all,
+}
+
+
+def run(name, edit, base_lines, seed):
+    # Otra semilla que la del log de partida: las líneas nuevas no deben repetirlo
+    rng = random.Random(seed + 1)
+    target_lines = edit(rng, base_lines)
+    state = ClipboardState()
+    base = state.new_message(''.join(base_lines).encode('utf-8'))
+    target = state.new_message(''.join(target_lines).encode('utf-8'))
+
+    sender = DeltaSync()
+    receiver = DeltaSync()
+    sender.remember(base)
+    receiver.remember(base)
+
+    full = encode_clipboard(target)
+    start = time.perf_counter()
+    delta = sender.encode(target)
+    encode_time = time.perf_counter() - start
+
+    apply_time = 0.0
+    if delta:
+        start = time.perf_counter()
+        message = receiver.apply(delta)
+        apply_time = time.perf_counter() - start
+        assert bytes(message.data) == target.data
+
+    sent = delta or full
+    return {
+        'edit': name,
+        'mode': 'delta' if delta else 'full',
+        'size': len(target.data),
+        'full_bytes': len(full),
+        'full_zlib': len(zlib.compress(full)),
+        'sent_bytes': len(sent),
+        'sent_zlib': len(zlib.compress(sent)),
+        'encode_ms': encode_time * 1000,
+        'apply_ms': apply_time * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del envío diferencial')
+    parser.add_argument('--lines', type=int, default=50000,
+                       help='Líneas del log de partida (default: 50000)')
+    parser.add_argument('--seed', type=int, default=1, help='Semilla (default: 1)')
+    parser.add_argument('--json', action='store_true', help='Salida en JSON')
+    args = parser.parse_args()
+
+    base_lines = make_log(random.Random(args.seed), args.lines)
+    results = [run(name, edit, base_lines, args.seed) for name, edit in EDITS.items()]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'Edición':<14} {'Modo':<6} {'Completo':>10} {'zlib':>9} {'Enviado':>9} "
+          f"{'zlib':>8} {'Ahorro':>7} {'Cod ms':>7} {'Apl ms':>7}")
+    for r in results:
+        saved = 1 - r['sent_zlib'] / r['full_zlib']
+        print(f"{r['edit']:<14} {r['mode']:<6} {r['full_bytes']:>10} {r['full_zlib']:>9} "
+              f"{r['sent_bytes']:>9} {r['sent_zlib']:>8} {saved:>6.1%} "
+              f"{r['encode_ms']:>7.1f} {r['apply_ms']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark de recepción de tramas por loopback
+Compara el bucle antiguo (data += packet, 4096 bytes) con FrameReader
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import CHANNEL_CLIPBOARD, FRAME_HEADER, FrameReader, pack_frame
+
+
+def legacy_read_frame(sock):
+    """Bucle de recepción original de handle_client/receive_from_server"""
+    size_data = sock.recv(FRAME_HEADER.size)
+    if not size_data:
+        return None
+    msg_size = FRAME_HEADER.unpack(size_data)[-1]
+    data = b''
+    while len(data) < msg_size:
+        packet = sock.recv(min(msg_size - len(data), 4096))
+        if not packet:
+            break
+        data += packet
+    return data
+
+
+_readers = {}
+
+
+def frame_reader_read(sock):
+    """Lectura con FrameReader (un lector por socket, como en handle_client)"""
+    reader = _readers.get(sock)
+    if reader is None:
+        reader = _readers[sock] = FrameReader(sock)
+    return reader.read_frame().payload
+
+
+def loopback_pair():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    client = socket.create_connection(server.getsockname())
+    conn, _ = server.accept()
+    server.close()
+    return client, conn
+
+
+def run(read_frame, payload, repeat):
+    sender, receiver = loopback_pair()
+    frame = pack_frame(CHANNEL_CLIPBOARD, payload)
+
+    def send():
+        for _ in range(repeat):
+            sender.sendall(frame)
+
+    thread = threading.Thread(target=send, daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    for _ in range(repeat):
+        data = read_frame(receiver)
+        assert len(data) == len(payload)
+    elapsed = time.perf_counter() - start
+    thread.join()
+    sender.close()
+    receiver.close()
+    return elapsed / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de recepción de tramas')
+    parser.add_argument('--sizes', default='1,10,100',
+                       help='Tamaños de payload en MB separados por comas (default: 1,10,100)')
+    parser.add_argument('--repeat', type=int, default=3,
+                       help='Tramas por medición (default: 3)')
+    parser.add_argument('--legacy-max', type=int, default=16,
+                       help='Tamaño máximo en MB para medir el bucle antiguo, que es '
+                            'cuadrático (default: 16)')
+    parser.add_argument('--json', action='store_true',
+                       help='Salida en JSON')
+    args = parser.parse_args()
+
+    results = []
+    for size_mb in (float(x) for x in args.sizes.split(',')):
+        payload = os.urandom(int(size_mb * 1024 * 1024))
+        result = {'size_mb': size_mb}
+
+        reader_time = run(frame_reader_read, payload, args.repeat)
+        result['frame_reader_s'] = reader_time
+        result['frame_reader_mb_s'] = size_mb / reader_time
+
+        if size_mb <= args.legacy_max:
+            legacy_time = run(legacy_read_frame, payload, args.repeat)
+            result['legacy_s'] = legacy_time
+            result['legacy_mb_s'] = size_mb / legacy_time
+            result['speedup'] = legacy_time / reader_time
+
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'MB':>8} {'FrameReader MB/s':>18} {'Antiguo MB/s':>14} {'Mejora':>8}")
+    for r in results:
+        legacy = f"{r['legacy_mb_s']:.1f}" if 'legacy_s' in r else '-'
+        speedup = f"{r['speedup']:.1f}x" if 'legacy_s' in r else '-'
+        print(f"{r['size_mb']:>8g} {r['frame_reader_mb_s']:>18.1f} {legacy:>14} {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark del códec de eventos KVM
+Compara el doble JSON anterior (evento + sobre) con kvm_codec. Los eventos
+viajan con la hora de captura (stamp_event, 8 bytes más), así que se mide
+el evento tal como va por la red; "Evento B" es el tamaño sin la hora.
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kvm_codec import (EVENT_KEY_PRESS, KEY_CHAR, decode_event, encode_key,
+                       encode_mouse_click, encode_mouse_move, event_timestamp, stamp_event)
+
+
+def json_roundtrip(event):
+    """Camino anterior: send_event + send_kvm_event y su inverso al recibir"""
+    wire = json.dumps({'protocol': 'kvm', 'data': json.dumps(event)}).encode('utf-8')
+    message = json.loads(wire.decode('utf-8'))
+    return wire, json.loads(message['data'])
+
+
+def binary_roundtrip(encode):
+    """Camino actual: evento con la hora de captura y su inverso al recibir"""
+    wire = stamp_event(encode())
+    return wire, decode_event(wire), event_timestamp(wire)
+
+
+CASES = {
+    'mouse_move': (
+        {'type': 'mouse_move', 'x': 0.5123456789, 'y': 0.2987654321},
+        lambda: encode_mouse_move(0.5123456789, 0.2987654321),
+    ),
+    'mouse_click': (
+        {'type': 'mouse_click', 'button': 'left', 'pressed': True},
+        lambda: encode_mouse_click(1, True),
+    ),
+    'key_press': (
+        {'type': 'key_press', 'key': {'type': 'char', 'value': 'a'}},
+        lambda: encode_key(EVENT_KEY_PRESS, KEY_CHAR, ord('a')),
+    ),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del códec KVM')
+    parser.add_argument('--number', type=int, default=100000,
+                       help='Eventos por medición (default: 100000)')
+    parser.add_argument('--json', action='store_true', help='Salida en JSON')
+    args = parser.parse_args()
+
+    results = []
+    for name, (event, encode) in CASES.items():
+        json_bytes = len(json_roundtrip(event)[0])
+        event_bytes = len(encode())
+        binary_bytes = len(binary_roundtrip(encode)[0])
+        json_time = timeit.timeit(lambda: json_roundtrip(event), number=args.number)
+        binary_time = timeit.timeit(lambda: binary_roundtrip(encode), number=args.number)
+        results.append({
+            'event': name,
+            'json_bytes': json_bytes,
+            'event_bytes': event_bytes,
+            'binary_bytes': binary_bytes,
+            'json_us': json_time / args.number * 1e6,
+            'binary_us': binary_time / args.number * 1e6,
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'Evento':<12} {'JSON B':>7} {'Evento B':>9} {'Bin B':>6} {'JSON us':>8} "
+          f"{'Bin us':>7} {'Mejora':>7}")
+    for r in results:
+        print(f"{r['event']:<12} {r['json_bytes']:>7} {r['event_bytes']:>9} {r['binary_bytes']:>6} "
+              f"{r['json_us']:>8.2f} {r['binary_us']:>7.2f} "
+              f"{r['json_us'] / r['binary_us']:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Benchmark de extremo a extremo de la sincronización por loopback
+Levanta un servidor y un cliente ClipboardSync en el mismo proceso, con
+portapapeles en memoria (FakeBackend), y mide cuánto tarda una copia en un
+extremo en aparecer en el otro: percentiles de latencia y caudal para cada
+tamaño de contenido y ritmo de copias
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clipboard_backends import FakeBackend
+from clipboard_sync import ClipboardSync
+
+
+# Tamaños por defecto: de 1 byte a 100 MB
+DEFAULT_SIZES = '1,100,10K,100K,1M,10M,100M'
+
+# Sufijos aceptados en --sizes
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+
+# Caracteres del principio de cada contenido que lo identifican en el receptor
+TAG_WIDTH = 12
+
+# Número de copia, seguido entre mediciones: dos copias seguidas nunca son
+# iguales (la segunda no se enviaría)
+_copy_numbers = itertools.count(1)
+
+
+def parse_size(text):
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for suffix in ('G', 'M', 'K'):
+        unit = SIZE_SUFFIXES[suffix]
+        if size >= unit and size % unit == 0:
+            return f"{size // unit}{suffix}"
+    return str(size)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_content(index, size):
+    """
+    Texto de `size` caracteres distinto en cada copia (para que no se envíe
+    como delta), que empieza por el número de copia en hexadecimal
+    """
+    width = min(size, TAG_WIDTH)
+    tag = format(index, 'x').rjust(width, '0')[-width:]
+    filler = size - width
+    if not filler:
+        return tag
+    return tag + os.urandom((filler + 1) // 2).hex()[:filler]
+
+
+def percentile(values, q):
+    """Percentil q (0-100) por el método del rango más cercano"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class Receiver:
+    """
+    Vigila el portapapeles del extremo receptor y apunta cuándo aparece cada
+    contenido enviado (por su etiqueta)
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.sent = {}
+        self.latencies = []
+        self.delivered_bytes = 0
+        self.last_delivery = None
+        self.changed = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self.watch, daemon=True, name="bench-receiver")
+        self.thread.start()
+
+    def expect(self, content, sent_at):
+        with self.changed:
+            self.sent[content[:TAG_WIDTH]] = (sent_at, len(content))
+
+    def watch(self):
+        condition = self.backend._condition
+        sequence = self.backend.sequence
+        while self.running:
+            with condition:
+                condition.wait_for(lambda: self.backend._sequence != sequence or not self.running,
+                                   timeout=0.5)
+                if self.backend._sequence == sequence:
+                    continue
+                sequence = self.backend._sequence
+                content = self.backend._content
+            now = time.perf_counter()
+            with self.changed:
+                sent = self.sent.pop(content[:TAG_WIDTH], None)
+                if sent is None:
+                    continue
+                sent_at, size = sent
+                self.latencies.append(now - sent_at)
+                self.delivered_bytes += size
+                self.last_delivery = now
+                self.changed.notify_all()
+
+    def reset(self):
+        with self.changed:
+            self.sent.clear()
+            self.latencies = []
+            self.delivered_bytes = 0
+            self.last_delivery = None
+
+    def wait_delivered(self, count, timeout):
+        """Espera a que lleguen `count` contenidos. False si vence el plazo"""
+        with self.changed:
+            return self.changed.wait_for(lambda: len(self.latencies) >= count, timeout)
+
+    def wait_arrived(self, content, timeout):
+        """
+        Espera a que llegue `content` (la última copia: las anteriores que no
+        hayan llegado ya se fundieron con ella)
+        """
+        tag = content[:TAG_WIDTH]
+        with self.changed:
+            return self.changed.wait_for(lambda: tag not in self.sent, timeout)
+
+    def stop(self):
+        self.running = False
+        with self.backend._condition:
+            self.backend._condition.notify_all()
+
+
+def start_pair(args):
+    """Servidor y cliente conectados por loopback. Devuelve (servidor, cliente)"""
+    port = args.port or free_port()
+    options = dict(engine=args.engine, compression=args.compression, delta=not args.no_delta,
+                   heartbeat_interval=0, log_callback=lambda message, level: None)
+    server = ClipboardSync('server', '127.0.0.1', port, backend=FakeBackend(), **options)
+    threading.Thread(target=server.run_server, daemon=True).start()
+    client = ClipboardSync('client', '127.0.0.1', port, backend=FakeBackend(), **options)
+
+    # El cliente reintenta mientras el servidor termina de arrancar
+    threading.Thread(target=client.run_client, daemon=True).start()
+    return server, client
+
+
+def run(source, receiver, size, rate, count, timeout):
+    """
+    Copia `count` contenidos de `size` caracteres en `source`.
+
+    Con rate 0 cada copia espera a que llegue la anterior (latencia sin
+    cola); con rate > 0 se copian a ese ritmo por segundo sin esperar, y
+    las copias que se solapan pueden fundirse en una (solo se sincroniza el
+    último contenido), como pasa con el portapapeles real.
+    """
+    receiver.reset()
+    interval = 1 / rate if rate else 0
+    start = time.perf_counter()
+    next_copy = start
+    content = None
+    generating = 0.0
+    for index in range(count):
+        # Generar 100 MB aleatorios cuesta tiempo: en serie no cuenta para el caudal
+        generate_start = time.perf_counter()
+        content = make_content(next(_copy_numbers), size)
+        if not interval:
+            generating += time.perf_counter() - generate_start
+        if interval:
+            delay = next_copy - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_copy += interval
+        sent_at = time.perf_counter()
+        receiver.expect(content, sent_at)
+        source.copy(content)
+        if not interval and not receiver.wait_delivered(index + 1, timeout):
+            break
+    copy_time = time.perf_counter() - start - generating
+    if content is not None:
+        receiver.wait_arrived(content, timeout)
+
+    latencies = receiver.latencies[:]
+    elapsed = (receiver.last_delivery or time.perf_counter()) - start - generating
+    result = {
+        'size': size,
+        'rate': rate,
+        'copies': count,
+        'delivered': len(latencies),
+        'copy_time_s': copy_time,
+        'elapsed_s': elapsed,
+        'throughput_mb_s': receiver.delivered_bytes / elapsed / (1024 * 1024) if elapsed else 0.0,
+        'copies_s': len(latencies) / elapsed if elapsed else 0.0,
+    }
+    for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)):
+        value = percentile(latencies, q)
+        result[f'{name}_ms'] = value * 1000 if value is not None else None
+    result['mean_ms'] = sum(latencies) / len(latencies) * 1000 if latencies else None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de extremo a extremo por loopback')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                       help=f'Tamaños del contenido en bytes, admite K y M '
+                            f'(default: {DEFAULT_SIZES})')
+    parser.add_argument('--rates', default='0',
+                       help='Copias por segundo separadas por comas; 0 = cada copia espera '
+                            'a la anterior (default: 0)')
+    parser.add_argument('--count', type=int, default=50,
+                       help='Copias por medición como máximo (default: 50)')
+    parser.add_argument('--budget-mb', type=float, default=300,
+                       help='MiB copiados por medición como máximo; limita las copias de '
+                            'los tamaños grandes, con un mínimo de 3 (default: 300)')
+    parser.add_argument('--direction', default='client', choices=['client', 'server'],
+                       help='Extremo en el que se copia (default: client)')
+    parser.add_argument('--engine', default='threads', choices=['threads', 'asyncio'],
+                       help='Motor del servidor (default: threads)')
+    parser.add_argument('--compression', default='auto',
+                       help='Códec de compresión (default: auto)')
+    parser.add_argument('--no-delta', action='store_true',
+                       help='Desactivar el envío diferencial')
+    parser.add_argument('--timeout', type=float, default=60,
+                       help='Segundos de espera por una copia (default: 60)')
+    parser.add_argument('--port', type=int, default=0,
+                       help='Puerto del servidor (default: uno libre)')
+    parser.add_argument('--json', action='store_true', help='Salida en JSON')
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    rates = [float(rate) for rate in args.rates.split(',')]
+
+    server, client = start_pair(args)
+    source, target = (client, server) if args.direction == 'client' else (server, client)
+    receiver = Receiver(target.clipboard)
+
+    # Primera copia: espera a que el cliente conecte y se negocien los códecs
+    deadline = time.perf_counter() + args.timeout
+    while not run(source.clipboard, receiver, 1, 0, 1, 0.5)['delivered']:
+        if time.perf_counter() > deadline:
+            sys.exit("[!] El cliente no llegó a conectar con el servidor")
+
+    results = []
+    try:
+        for size in sizes:
+            count = max(3, min(args.count, int(args.budget_mb * 1024 * 1024 // size)))
+            for rate in rates:
+                result = run(source.clipboard, receiver, size, rate, count, args.timeout)
+                result.update(engine=args.engine, direction=args.direction,
+                              compression=args.compression, delta=not args.no_delta)
+                results.append(result)
+                if not args.json:
+                    print_result(result, header=len(results) == 1)
+    finally:
+        receiver.stop()
+        client.stop()
+        server.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+def print_result(r, header=False):
+    if header:
+        print(f"{'Tamaño':>7} {'Ritmo':>6} {'Llegan':>9} {'p50 ms':>9} {'p90 ms':>9} "
+              f"{'p99 ms':>9} {'máx ms':>9} {'MB/s':>8} {'copias/s':>9}")
+    rate = f"{r['rate']:g}/s" if r['rate'] else 'serie'
+    latencies = ' '.join(f"{r[name]:>9.2f}" if r[name] is not None else f"{'-':>9}"
+                         for name in ('p50_ms', 'p90_ms', 'p99_ms', 'max_ms'))
+    print(f"{format_size(r['size']):>7} {rate:>6} {r['delivered']:>4}/{r['copies']:<4} "
+          f"{latencies} {r['throughput_mb_s']:>8.1f} {r['copies_s']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Benchmark del arranque
+Mide, lanzando cada vez un intérprete nuevo, cuánto tarda cada punto de
+entrada en importarse y en sincronizar su primer contenido con un servidor
+por loopback (portapapeles en memoria, FakeBackend):
+
+- cli: clipboard_sync.py client
+- daemon: el servicio (clipboard_sync.py daemon) arrancado con la configuración
+- gui: la interfaz, que lanza el servicio en otro proceso como hace al pulsar
+  Iniciar (con pantalla también se mide la creación de la ventana)
+
+El primer contenido es una marca que el proceso copia nada más arrancar y
+que llega al servidor en cuanto la sesión queda establecida.
+
+También comprueba que importar el punto de entrada no carga los módulos que
+se importan al usarlos (LAZY_MODULES): el motor, el historial y las métricas.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENTRIES = ('cli', 'daemon', 'gui')
+
+# Módulos que importa cada punto de entrada antes de poder sincronizar
+ENTRY_MODULES = {
+    'cli': 'clipboard_sync',
+    # El subcomando daemon carga clipboard_sync (argumentos) y luego el servicio
+    'daemon': 'clipboard_sync, daemon',
+    'gui': 'clipboard_sync_gui',
+}
+
+# Módulos que ningún punto de entrada debe cargar al importarse: se cargan
+# al crear el motor, con el primer saludo o en el subcomando que los usa
+LAZY_MODULES = ('history_store', 'sqlite3', 'metrics', 'compression', 'zstandard',
+                'delta_sync', 'lazy_pull', 'heartbeat', 'relay', 'session', 'transfer',
+                'outbound')
+
+# Arranque del proceso medido: solo sys y time antes del punto de entrada,
+# para que los módulos del benchmark no se cuenten como ya importados
+BOOTSTRAP = ("import sys, time; start = time.time(); sys.path.insert(0, {root!r}); "
+             "import {modules}; imported = time.time(); "
+             "sys.path.insert(0, {here!r}); import bench_startup; "
+             "bench_startup.run_child({entry!r}, {port}, {marker!r}, start, imported)")
+
+# Presupuesto de arranque en ms (mediana): importación y primer contenido
+# sincronizado. --check termina con error si alguno se supera
+STARTUP_BUDGET = {
+    'cli': {'import_ms': 150, 'first_sync_ms': 1000},
+    'daemon': {'import_ms': 150, 'first_sync_ms': 1000},
+    'gui': {'import_ms': 150, 'first_sync_ms': 1500},
+}
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def quiet(message, level="info"):
+    pass
+
+
+# === PROCESO HIJO ===
+
+def spawn(entry, port, marker, **options):
+    """Lanza un punto de entrada en un intérprete nuevo"""
+    code = BOOTSTRAP.format(root=ROOT, here=os.path.dirname(os.path.abspath(__file__)),
+                            modules=ENTRY_MODULES[entry], entry=entry, port=port, marker=marker)
+    return subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, **options)
+
+
+def report(**fields):
+    print(json.dumps(fields), flush=True)
+
+
+def child_cli(port, marker):
+    from clipboard_backends import FakeBackend
+    from clipboard_sync import ClipboardSync
+
+    backend = FakeBackend()
+    sync = ClipboardSync('client', '127.0.0.1', port, backend=backend, log_callback=quiet)
+    threading.Thread(target=sync.run_client, daemon=True).start()
+    backend.copy(marker)
+
+
+def child_daemon(port, marker):
+    from clipboard_backends import FakeBackend
+    from daemon import SyncDaemon
+
+    service = SyncDaemon(os.path.join(tempfile.gettempdir(), f"bench-{os.getpid()}.sock"))
+    service.log = quiet
+    service.clipboard = FakeBackend()
+    service.start_sync({'mode': 'client', 'host': '127.0.0.1', 'port': str(port)})
+    service.clipboard.copy(marker)
+
+
+def child_gui(port, marker, start, imported, eager):
+    import clipboard_sync_gui
+
+    window = None
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception:
+        # Sin pantalla solo se mide la importación
+        root = None
+    if root is not None:
+        clipboard_sync_gui.ClipboardSyncGUI(root)
+        root.update()
+        window = time.time()
+
+    # La interfaz lanza el servicio en otro proceso y le pide iniciar
+    service = spawn('daemon', port, marker)
+    report(start=start, imported=imported, window=window, eager=eager)
+    try:
+        sys.stdin.read()
+    finally:
+        service.stdin.close()
+        service.wait()
+
+
+def run_child(entry, port, marker, start, imported):
+    # Antes de arrancar nada: solo lo que cargó la importación
+    eager = [name for name in LAZY_MODULES if name in sys.modules]
+    if entry == 'gui':
+        child_gui(port, marker, start, imported, eager)
+        return
+    {'cli': child_cli, 'daemon': child_daemon}[entry](port, marker)
+    report(start=start, imported=imported, eager=eager)
+    # Hasta que el benchmark cierre la entrada
+    sys.stdin.read()
+
+
+# === BENCHMARK ===
+
+class Server:
+    """Servidor por loopback que espera la marca de cada proceso"""
+
+    def __init__(self, port):
+        from clipboard_backends import FakeBackend
+        from clipboard_sync import ClipboardSync
+
+        self.backend = FakeBackend()
+        self.sync = ClipboardSync('server', '127.0.0.1', port, backend=self.backend,
+                                  log_callback=quiet)
+        threading.Thread(target=self.sync.run_server, daemon=True).start()
+
+    def wait_for(self, marker, timeout):
+        condition = self.backend._condition
+        with condition:
+            if not condition.wait_for(lambda: self.backend._content == marker, timeout):
+                return None
+        return time.time()
+
+    def stop(self):
+        self.sync.stop()
+
+
+def measure(entry, server, port, index, timeout, workdir):
+    marker = f"bench-startup-{entry}-{os.getpid()}-{index}"
+    launched = time.time()
+    process = spawn(entry, port, marker, cwd=workdir)
+    try:
+        synced = server.wait_for(marker, timeout)
+        line = process.stdout.readline()
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    child = json.loads(line) if line else {}
+    result = {
+        'entry': entry,
+        'interpreter_ms': (child['start'] - launched) * 1000 if child else None,
+        'import_ms': (child['imported'] - child['start']) * 1000 if child else None,
+        'window_ms': ((child['window'] - child['imported']) * 1000
+                      if child.get('window') else None),
+        'first_sync_ms': (synced - launched) * 1000 if synced else None,
+        'eager': child.get('eager', []),
+    }
+    return result
+
+
+def summarize(entry, runs):
+    summary = {'entry': entry, 'runs': len(runs)}
+    for key in ('interpreter_ms', 'import_ms', 'window_ms', 'first_sync_ms'):
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = {
+            'median': median(values),
+            'min': min(values),
+            'max': max(values),
+        } if values else None
+    summary['failed'] = sum(1 for run in runs if run['first_sync_ms'] is None)
+    summary['eager'] = sorted({name for run in runs for name in run['eager']})
+    summary['over_budget'] = [
+        key for key, budget in STARTUP_BUDGET.get(entry, {}).items()
+        if summary[key] is None or summary[key]['median'] > budget
+    ]
+    return summary
+
+
+def print_summary(summaries):
+    def cell(value):
+        return f"{value['median']:>9.1f}" if value else f"{'-':>9}"
+
+    print(f"{'Entrada':<8} {'Python':>9} {'Import':>9} {'Ventana':>9} {'1er sync':>9}  (ms, mediana)")
+    for s in summaries:
+        line = (f"{s['entry']:<8} {cell(s['interpreter_ms'])} {cell(s['import_ms'])} "
+                f"{cell(s['window_ms'])} {cell(s['first_sync_ms'])}")
+        if s['failed']:
+            line += f"  [!] {s['failed']}/{s['runs']} sin sincronizar"
+        if s['over_budget']:
+            line += f"  [!] fuera de presupuesto: {', '.join(s['over_budget'])}"
+        if s['eager']:
+            line += f"  [!] importados al arrancar: {', '.join(s['eager'])}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del arranque')
+    parser.add_argument('--entries', default=','.join(ENTRIES),
+                        help=f"Puntos de entrada a medir (default: {','.join(ENTRIES)})")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Arranques por punto de entrada (default: 10)')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='Segundos de espera por el primer contenido (default: 30)')
+    parser.add_argument('--check', action='store_true',
+                        help='Termina con error si se supera el presupuesto de arranque '
+                             'o la importación carga alguno de LAZY_MODULES')
+    parser.add_argument('--json', action='store_true', help='Salida en JSON')
+    args = parser.parse_args()
+
+    port = free_port()
+    server = Server(port)
+    # Historial y configuración de los procesos medidos, fuera del proyecto
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    summaries = []
+    try:
+        for entry in args.entries.split(','):
+            runs = [measure(entry, server, port, index, args.timeout, workdir)
+                    for index in range(args.repeat)]
+            summaries.append(summarize(entry, runs))
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    else:
+        print_summary(summaries)
+
+    if args.check and any(s['over_budget'] or s['failed'] or s['eager'] for s in summaries):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,7 @@
 Script para compilar Clipboard Sync a un ejecutable .exe
 """
 
+import argparse
 import os
 import sys
 import subprocess
@@ -53,7 +54,22 @@ def create_icon():
         return None
 
 
-def build_exe():
+def create_tray_icon():
+    """Pre-renderiza el ícono de la bandeja para no dibujarlo en cada inicio"""
+    try:
+        from clipboard_sync_gui import TRAY_ICON_FILE, render_tray_icon
+
+        render_tray_icon().save(TRAY_ICON_FILE)
+        print(f"[OK] Icono de la bandeja creado: {TRAY_ICON_FILE}")
+        return TRAY_ICON_FILE
+
+    except Exception as e:
+        print(f"[!] No se pudo crear el icono de la bandeja: {e}")
+        print("  Se dibujará al iniciar la aplicación...")
+        return None
+
+
+def build_exe(onedir=False):
     """Compila la aplicación a un ejecutable"""
     print("=" * 60)
     print("  Compilando Clipboard Sync a .exe")
@@ -72,12 +88,15 @@ def build_exe():
 
     # Crear ícono
     icon_path = create_icon()
+    tray_icon_path = create_tray_icon()
 
     # Construir comando de PyInstaller
     cmd = [
         "pyinstaller",
         "--name=ClipboardSync",
-        "--onefile",
+        # onedir no descomprime nada al iniciar (la interfaz y el servicio
+        # arrancan antes); onefile es un único archivo más fácil de copiar
+        "--onedir" if onedir else "--onefile",
         "--windowed",  # Sin consola
         "--clean",
     ]
@@ -85,6 +104,8 @@ def build_exe():
     # Agregar ícono si existe
     if icon_path and os.path.exists(icon_path):
         cmd.append(f"--icon={icon_path}")
+    if tray_icon_path and os.path.exists(tray_icon_path):
+        cmd.append(f"--add-data={tray_icon_path}{os.pathsep}.")
 
     # Archivo principal
     cmd.append("clipboard_sync_gui.py")
@@ -104,9 +125,14 @@ def build_exe():
         print("=" * 60)
         print()
         print(f"El archivo ejecutable se encuentra en:")
-        print(f"  -> dist/ClipboardSync.exe")
-        print()
-        print("Puedes copiar este archivo a cualquier ubicacion y ejecutarlo.")
+        if onedir:
+            print(f"  -> dist/ClipboardSync/ClipboardSync.exe")
+            print()
+            print("Copia la carpeta dist/ClipboardSync completa, no solo el .exe.")
+        else:
+            print(f"  -> dist/ClipboardSync.exe")
+            print()
+            print("Puedes copiar este archivo a cualquier ubicacion y ejecutarlo.")
         print("No necesitaras Python instalado en la maquina donde lo uses.")
         print()
 
@@ -120,4 +146,9 @@ def build_exe():
 
 
 if __name__ == "__main__":
-    build_exe()
+    parser = argparse.ArgumentParser(description='Compila Clipboard Sync a un ejecutable')
+    parser.add_argument('--onedir', action='store_true',
+                        help='Carpeta con el .exe y sus dependencias: arranca más rápido '
+                             'que un único .exe, que se descomprime en cada inicio')
+    args = parser.parse_args()
+    build_exe(onedir=args.onedir)
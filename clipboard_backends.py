@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+Clipboard Backends - Acceso al portapapeles y detección de cambios
+Acceso por un proceso auxiliar persistente en X11 o por pyperclip; detección
+por X11 (XFixes), Wayland (wl-paste --watch) y polling como respaldo
+"""
+
+import ctypes
+import os
+import select
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from clipboard_formats import CommandRichClipboard
+from clipboard_helper import HELPER_HEADER, OP_COPY, OP_PASTE, OP_TARGETS, STATUS_OK
+
+
+# Polling adaptativo: intervalo tras actividad, techo cuando no pasa nada
+# y factor con el que crece el intervalo en cada lectura sin cambios
+DEFAULT_POLL_MIN = 0.1
+DEFAULT_POLL_MAX = 2.0
+POLL_BACKOFF = 1.5
+
+
+# === ACCESO AL PORTAPAPELES ===
+
+class PyperclipBackend:
+    """Lee y escribe el portapapeles usando pyperclip"""
+
+    name = "pyperclip"
+
+    def __init__(self):
+        import pyperclip
+        self._pyperclip = pyperclip
+
+    def paste(self):
+        return self._pyperclip.paste()
+
+    def copy(self, content):
+        self._pyperclip.copy(content)
+
+    def close(self):
+        pass
+
+
+class HelperBackend:
+    """
+    X11: lee y escribe el portapapeles a través de un proceso auxiliar
+    (clipboard_helper.py) que mantiene una sola conexión con X, en lugar de
+    lanzar xclip/xsel en cada llamada como pyperclip. Si el auxiliar deja de
+    responder se termina y se lanza otro en la siguiente llamada.
+    """
+
+    name = "helper"
+
+    def __init__(self, timeout=5.0):
+        if getattr(sys, 'frozen', False):
+            raise OSError("el proceso auxiliar no está disponible en el ejecutable")
+        if not os.environ.get('DISPLAY'):
+            raise OSError("no hay display X11")
+        self.timeout = timeout
+        self._process = None
+        self._lock = threading.Lock()
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        helper = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clipboard_helper.py')
+        self._process = subprocess.Popen(
+            [sys.executable, helper],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        # El auxiliar responde en cuanto tiene abierta la conexión con X
+        self._response()
+
+    def _stop(self):
+        process, self._process = self._process, None
+        if process and process.poll() is None:
+            process.kill()
+            process.wait()
+
+    def _read(self, size):
+        fd = self._process.stdout.fileno()
+        deadline = time.monotonic() + self.timeout
+        data = bytearray()
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            readable, _, _ = select.select([fd], [], [], max(0, remaining))
+            if not readable:
+                raise OSError("el proceso auxiliar del portapapeles no responde")
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                raise OSError("el proceso auxiliar del portapapeles terminó")
+            data += chunk
+        return data
+
+    def _response(self):
+        try:
+            status, size = HELPER_HEADER.unpack(self._read(HELPER_HEADER.size))
+            data = self._read(size)
+        except OSError:
+            self._stop()
+            raise
+        if status != STATUS_OK:
+            raise OSError(data.decode('utf-8', 'replace'))
+        return data
+
+    def _call(self, op, data=b''):
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            try:
+                self._process.stdin.write(HELPER_HEADER.pack(op, len(data)) + data)
+                self._process.stdin.flush()
+            except OSError:
+                self._stop()
+                raise
+            return self._response()
+
+    def paste(self):
+        return self._call(OP_PASTE).decode('utf-8', 'surrogatepass')
+
+    def copy(self, content):
+        self._call(OP_COPY, content.encode('utf-8', 'surrogatepass'))
+
+    def targets(self):
+        """Tipos MIME (y demás targets) que ofrece ahora el portapapeles"""
+        return set(self._call(OP_TARGETS).decode('utf-8', 'replace').split())
+
+    def create_rich_clipboard(self):
+        # La lista de tipos, que se pide en cada cambio, sale del auxiliar;
+        # xclip solo se lanza para leer o escribir una imagen
+        return CommandRichClipboard(list_types=self.targets)
+
+    def close(self):
+        """Cierra la conexión; el auxiliar sigue sirviendo lo último copiado"""
+        with self._lock:
+            process, self._process = self._process, None
+        if process:
+            process.stdin.close()
+
+
+class FakeBackend:
+    """
+    Portapapeles en memoria para pruebas y benchmarks.
+
+    Cada copy() incrementa un número de secuencia; el notificador asociado
+    despierta en cuanto cambia, igual que haría un backend por eventos.
+    """
+
+    name = "fake"
+
+    def __init__(self, content=""):
+        self._content = content
+        self._formats = {}
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def paste(self):
+        with self._condition:
+            return self._content
+
+    def copy(self, content):
+        self.copy_formats({}, content)
+
+    def paste_formats(self):
+        """Formatos no textuales (tipo MIME -> bytes) del contenido actual"""
+        with self._condition:
+            return dict(self._formats)
+
+    def copy_formats(self, formats, content=""):
+        """Reemplaza el contenido por texto más otros formatos"""
+        with self._condition:
+            self._content = content
+            self._formats = dict(formats)
+            self._sequence += 1
+            self._condition.notify_all()
+
+    @property
+    def sequence(self):
+        with self._condition:
+            return self._sequence
+
+    def wait_for_sequence(self, seen, timeout=None):
+        """Espera a que la secuencia sea distinta de `seen`"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence != seen, timeout)
+            return self._sequence
+
+    def create_notifier(self):
+        return FakeNotifier(self)
+
+    def create_rich_clipboard(self):
+        from clipboard_formats import FakeRichClipboard
+        return FakeRichClipboard(self)
+
+    def close(self):
+        with self._condition:
+            self._condition.notify_all()
+
+
+# === NOTIFICADORES DE CAMBIOS ===
+
+class ChangeNotifier:
+    """
+    Interfaz base para detectar cambios en el portapapeles.
+
+    wait(timeout) bloquea hasta que el portapapeles pudo haber cambiado y
+    devuelve True, o devuelve False si se agotó el timeout. La primera
+    llamada siempre devuelve True para leer el contenido inicial.
+    """
+
+    name = "base"
+    event_driven = False
+
+    def __init__(self):
+        self._initial = True
+
+    def wait(self, timeout=None):
+        if self._initial:
+            self._initial = False
+            return True
+        return self._wait(timeout)
+
+    def _wait(self, timeout):
+        raise NotImplementedError
+
+    def activity(self):
+        """Hubo un cambio (local o recibido): solo lo usa el polling"""
+
+    def summary(self):
+        """Resumen para las estadísticas, o None si no hay nada que contar"""
+        return None
+
+    def close(self):
+        pass
+
+
+class PollingNotifier(ChangeNotifier):
+    """
+    Respaldo: no sabe cuándo cambia y pide leer periódicamente. Tras
+    actividad lee cada `min_interval` segundos; cada lectura sin cambios
+    alarga el intervalo (x POLL_BACKOFF) hasta `max_interval`.
+    """
+
+    name = "polling"
+
+    def __init__(self, min_interval=DEFAULT_POLL_MIN, max_interval=DEFAULT_POLL_MAX):
+        super().__init__()
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min_interval
+        self.polls = 0
+        self.started = time.monotonic()
+        self._next_poll = self.started + self.interval
+        self._wake = threading.Event()
+        # activity() llega desde el hilo receptor; _wait corre en el monitor
+        self._lock = threading.Lock()
+
+    def _wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                next_poll = self._next_poll
+            if now >= next_poll:
+                break
+            remaining = next_poll - now
+            if deadline is not None:
+                if now >= deadline:
+                    # Sin leer todavía: el que espera vuelve a comprobar si debe seguir
+                    return False
+                remaining = min(remaining, deadline - now)
+            # Un aviso de activity() solo acorta la espera: se recalcula el plazo
+            self._wake.wait(remaining)
+            self._wake.clear()
+        with self._lock:
+            self.polls += 1
+            # Se supone que no cambió nada; activity() lo corrige
+            self.interval = min(self.max_interval, self.interval * POLL_BACKOFF)
+            self._next_poll = time.monotonic() + self.interval
+        return True
+
+    def activity(self):
+        """Vuelve al intervalo mínimo y adelanta la próxima lectura a ahora + min_interval"""
+        with self._lock:
+            self.interval = self.min_interval
+            next_poll = time.monotonic() + self.min_interval
+            if next_poll >= self._next_poll:
+                return
+            self._next_poll = next_poll
+        self._wake.set()
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        # Lecturas ahorradas frente a leer siempre al intervalo mínimo
+        fixed = int(elapsed / self.min_interval)
+        return {
+            'interval': self.interval,
+            'polls': self.polls,
+            'avoided': max(0, fixed - self.polls),
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"intervalo actual {stats['interval']:.2f} s, {stats['polls']} lecturas, "
+                f"{stats['avoided']} evitadas frente a leer cada {self.min_interval:g} s")
+
+
+class FakeNotifier(ChangeNotifier):
+    """Notificador del FakeBackend: despierta en cada copy()"""
+
+    name = "fake"
+    event_driven = True
+
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+        self._seen = backend.sequence
+
+    def _wait(self, timeout):
+        sequence = self.backend.wait_for_sequence(self._seen, timeout)
+        if sequence == self._seen:
+            return False
+        self._seen = sequence
+        return True
+
+
+class WindowsSequenceNotifier(ChangeNotifier):
+    """
+    Windows: consulta GetClipboardSequenceNumber, que es una llamada
+    barata sin abrir el portapapeles. Solo pide leer cuando cambia.
+    """
+
+    name = "windows"
+    event_driven = True
+
+    def __init__(self, interval=0.05):
+        super().__init__()
+        self.interval = interval
+        self._user32 = ctypes.windll.user32
+        self._user32.GetClipboardSequenceNumber.restype = ctypes.c_uint32
+        self._seen = self._user32.GetClipboardSequenceNumber()
+
+    def _wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            sequence = self._user32.GetClipboardSequenceNumber()
+            if sequence != self._seen:
+                self._seen = sequence
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.interval)
+
+
+class XFixesNotifier(ChangeNotifier):
+    """
+    X11: se suscribe a los eventos XFixesSelectionNotify del propietario
+    de la selección CLIPBOARD. El hilo duerme en select() sobre el socket
+    de X hasta que otra aplicación (o nosotros) copia algo.
+    """
+
+    name = "xfixes"
+    event_driven = True
+
+    # Máscaras de XFixesSelectSelectionInput
+    SET_SELECTION_OWNER_MASK = 1 << 0
+    SELECTION_WINDOW_DESTROY_MASK = 1 << 1
+    SELECTION_CLIENT_CLOSE_MASK = 1 << 2
+    SELECTION_NOTIFY = 0
+
+    def __init__(self, selection=b"CLIPBOARD"):
+        super().__init__()
+        import ctypes.util
+        xlib_path = ctypes.util.find_library("X11")
+        xfixes_path = ctypes.util.find_library("Xfixes")
+        if not xlib_path or not xfixes_path:
+            raise OSError("libX11/libXfixes no disponibles")
+
+        self._xlib = xlib = ctypes.cdll.LoadLibrary(xlib_path)
+        self._xfixes = xfixes = ctypes.cdll.LoadLibrary(xfixes_path)
+
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        xlib.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        xlib.XInternAtom.restype = ctypes.c_ulong
+        xlib.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        xlib.XPending.argtypes = [ctypes.c_void_p]
+        xlib.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        xlib.XFlush.argtypes = [ctypes.c_void_p]
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xfixes.XFixesQueryExtension.argtypes = [
+            ctypes.c_void_p, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)
+        ]
+        xfixes.XFixesSelectSelectionInput.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong
+        ]
+
+        self._display = xlib.XOpenDisplay(None)
+        if not self._display:
+            raise OSError("No se pudo abrir el display X11")
+
+        event_base = ctypes.c_int()
+        error_base = ctypes.c_int()
+        if not xfixes.XFixesQueryExtension(self._display, ctypes.byref(event_base),
+                                           ctypes.byref(error_base)):
+            xlib.XCloseDisplay(self._display)
+            raise OSError("El servidor X no soporta XFixes")
+        self._notify_type = event_base.value + self.SELECTION_NOTIFY
+
+        root = xlib.XDefaultRootWindow(self._display)
+        atom = xlib.XInternAtom(self._display, selection, 0)
+        xfixes.XFixesSelectSelectionInput(
+            self._display, root, atom,
+            self.SET_SELECTION_OWNER_MASK
+            | self.SELECTION_WINDOW_DESTROY_MASK
+            | self.SELECTION_CLIENT_CLOSE_MASK
+        )
+        xlib.XFlush(self._display)
+        self._fd = xlib.XConnectionNumber(self._display)
+        # XEvent es una unión de 24 longs
+        self._event = ctypes.create_string_buffer(24 * ctypes.sizeof(ctypes.c_long))
+
+    def _drain(self):
+        changed = False
+        while self._xlib.XPending(self._display):
+            self._xlib.XNextEvent(self._display, self._event)
+            event_type = ctypes.c_int.from_buffer(self._event).value
+            if event_type == self._notify_type:
+                changed = True
+        return changed
+
+    def _wait(self, timeout):
+        if self._drain():
+            return True
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return False
+        return self._drain()
+
+    def close(self):
+        if self._display:
+            self._xlib.XCloseDisplay(self._display)
+            self._display = None
+
+
+class WaylandNotifier(ChangeNotifier):
+    """
+    Wayland: mantiene un `wl-paste --watch` que imprime una línea por cada
+    cambio de la selección. Se espera con select() sobre su stdout.
+    """
+
+    name = "wayland"
+    event_driven = True
+
+    def __init__(self):
+        super().__init__()
+        if not shutil.which("wl-paste"):
+            raise OSError("wl-paste no está instalado (paquete wl-clipboard)")
+        self._process = subprocess.Popen(
+            ["wl-paste", "--watch", "echo"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._fd = self._process.stdout.fileno()
+
+    def _wait(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return False
+        data = os.read(self._fd, 4096)
+        if not data:
+            raise OSError("wl-paste --watch terminó inesperadamente")
+        return True
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+
+# === SELECCIÓN AUTOMÁTICA ===
+
+NOTIFIERS = {
+    'polling': PollingNotifier,
+    'xfixes': XFixesNotifier,
+    'wayland': WaylandNotifier,
+    'windows': WindowsSequenceNotifier,
+}
+
+
+BACKENDS = {
+    'helper': HelperBackend,
+    'pyperclip': PyperclipBackend,
+}
+
+
+def _auto_backends():
+    # En Wayland, xclip no ve el portapapeles nativo: pyperclip usa wl-clipboard
+    if sys.platform.startswith('linux') and os.environ.get('DISPLAY') \
+            and not os.environ.get('WAYLAND_DISPLAY'):
+        return ['helper', 'pyperclip']
+    return ['pyperclip']
+
+
+def create_backend(kind='auto', log_callback=None):
+    """
+    Crea el backend de acceso al portapapeles.
+
+    Con kind='auto' se usa el proceso auxiliar persistente en X11 y
+    pyperclip en el resto de casos o si el auxiliar no arranca.
+    """
+    if kind != 'auto':
+        return BACKENDS[kind]()
+    candidates = _auto_backends()
+    for candidate in candidates[:-1]:
+        try:
+            return BACKENDS[candidate]()
+        except Exception as e:
+            if log_callback:
+                log_callback(f"Portapapeles {candidate} no disponible: {e}", "warning")
+    return BACKENDS[candidates[-1]]()
+
+
+def _auto_candidates():
+    if sys.platform == 'win32':
+        return ['windows']
+    if os.environ.get('WAYLAND_DISPLAY'):
+        return ['wayland', 'xfixes']
+    if os.environ.get('DISPLAY'):
+        return ['xfixes']
+    return []
+
+
+def create_notifier(kind='auto', backend=None, poll_min=DEFAULT_POLL_MIN,
+                    poll_max=DEFAULT_POLL_MAX, log_callback=None):
+    """
+    Crea el notificador de cambios.
+
+    Con kind='auto' se usa el backend por eventos disponible en la
+    plataforma y, si ninguno funciona, polling adaptativo entre `poll_min`
+    y `poll_max` segundos.
+    """
+    if kind == 'auto':
+        if backend is not None and hasattr(backend, 'create_notifier'):
+            return backend.create_notifier()
+        for candidate in _auto_candidates():
+            try:
+                return NOTIFIERS[candidate]()
+            except Exception as e:
+                if log_callback:
+                    log_callback(f"Notificador {candidate} no disponible: {e}", "warning")
+        return PollingNotifier(poll_min, poll_max)
+
+    if kind == 'polling':
+        return PollingNotifier(poll_min, poll_max)
+    if kind == 'fake':
+        return backend.create_notifier()
+    return NOTIFIERS[kind]()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Clipboard Formats - Contenido del portapapeles en varios formatos (MIME)
+Texto, HTML e imágenes PNG en un paquete binario sin base64 ni JSON, y
+acceso a esos formatos en Windows (Win32), X11 (xclip) y Wayland (wl-clipboard)
+"""
+
+import ctypes
+import importlib.util
+import io
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+
+
+FORMAT_TEXT = 'text/plain'
+FORMAT_HTML = 'text/html'
+FORMAT_PNG = 'image/png'
+FORMATS = (FORMAT_TEXT, FORMAT_HTML, FORMAT_PNG)
+
+# Paquete: número de formatos, y por cada uno (longitud del tipo MIME,
+# tamaño de los datos) seguido del tipo MIME; después los datos de todos
+FORMAT_COUNT = struct.Struct('>B')
+FORMAT_ENTRY = struct.Struct('>BQ')
+
+# Nivel de compresión PNG al convertir imágenes: las capturas de pantalla
+# comprimen casi igual con el nivel 1 y se codifican varias veces más rápido
+PNG_COMPRESS_LEVEL = 1
+
+# Tiempo máximo de las herramientas externas (xclip, wl-paste, wl-copy)
+COMMAND_TIMEOUT = 5
+
+
+def encode_formats(formats):
+    """Serializa un dict {tipo MIME: bytes} en un paquete binario"""
+    header = [FORMAT_COUNT.pack(len(formats))]
+    for mime, data in formats.items():
+        name = mime.encode('ascii')
+        header.append(FORMAT_ENTRY.pack(len(name), len(data)))
+        header.append(name)
+    return b''.join(header + [bytes(data) for data in formats.values()])
+
+
+def decode_formats(payload):
+    """
+    Deserializa un paquete de formatos. Los datos se devuelven como vistas
+    del payload, sin copiarlos.
+    """
+    view = memoryview(payload)
+    (count,) = FORMAT_COUNT.unpack_from(view)
+    pos = FORMAT_COUNT.size
+    entries = []
+    for _ in range(count):
+        name_size, size = FORMAT_ENTRY.unpack_from(view, pos)
+        pos += FORMAT_ENTRY.size
+        entries.append((bytes(view[pos:pos + name_size]).decode('ascii'), size))
+        pos += name_size
+
+    formats = {}
+    for mime, size in entries:
+        if pos + size > len(view):
+            raise ValueError("Paquete de formatos truncado")
+        formats[mime] = view[pos:pos + size]
+        pos += size
+    return formats
+
+
+def formats_hello(formats):
+    """Formatos que acepta este extremo, para el saludo"""
+    return ','.join(formats).encode('ascii')
+
+
+def parse_formats(payload):
+    """
+    Formatos anunciados en el saludo del otro extremo. El saludo es una
+    lista separada por comas que también lleva los códecs; los extremos
+    que no anuncian formatos solo aceptan texto.
+    """
+    names = bytes(payload).decode('ascii', 'ignore').split(',')
+    return (FORMAT_TEXT,) + tuple(name for name in names
+                                  if name in FORMATS and name != FORMAT_TEXT)
+
+
+def describe_formats(formats):
+    """Descripción corta para el log: 'text/plain 12 B, image/png 340 KiB'"""
+    parts = []
+    for mime, data in formats.items():
+        size = len(data)
+        parts.append(f"{mime} {size // 1024} KiB" if size >= 1024 else f"{mime} {size} B")
+    return ', '.join(parts)
+
+
+# === IMÁGENES (Pillow) ===
+
+def pillow_available():
+    # Solo se busca el paquete: PIL se importa al convertir la primera imagen
+    return importlib.util.find_spec('PIL') is not None
+
+
+def dib_to_png(dib):
+    """Convierte un DIB del portapapeles de Windows (CF_DIB) a PNG"""
+    from PIL import BmpImagePlugin
+    image = BmpImagePlugin.DibImageFile(io.BytesIO(dib))
+    output = io.BytesIO()
+    image.save(output, 'PNG', compress_level=PNG_COMPRESS_LEVEL)
+    return output.getvalue()
+
+
+def png_to_dib(png):
+    """Convierte un PNG a DIB (un BMP sin la cabecera de fichero de 14 bytes)"""
+    from PIL import Image
+    image = Image.open(io.BytesIO(png))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, 'BMP')
+    return output.getvalue()[14:]
+
+
+# === ACCESO A LOS FORMATOS ===
+
+class WindowsRichClipboard:
+    """
+    Formatos del portapapeles de Windows con la API Win32 (ctypes).
+
+    Las imágenes se leen del formato registrado "PNG" si alguna aplicación
+    lo puso (sin recodificar) o de CF_DIB convirtiéndolas con Pillow; al
+    escribir se ponen ambos para que las acepten todas las aplicaciones.
+    """
+
+    name = "win32"
+
+    CF_UNICODETEXT = 13
+    CF_DIB = 8
+    GMEM_MOVEABLE = 0x0002
+
+    def __init__(self):
+        from ctypes import wintypes
+        self.user32 = user32 = ctypes.windll.user32
+        self.kernel32 = kernel32 = ctypes.windll.kernel32
+
+        user32.OpenClipboard.argtypes = [wintypes.HWND]
+        user32.GetClipboardData.restype = ctypes.c_void_p
+        user32.SetClipboardData.argtypes = [wintypes.UINT, ctypes.c_void_p]
+        user32.SetClipboardData.restype = ctypes.c_void_p
+        user32.RegisterClipboardFormatW.argtypes = [wintypes.LPCWSTR]
+        kernel32.GlobalAlloc.argtypes = [wintypes.UINT, ctypes.c_size_t]
+        kernel32.GlobalAlloc.restype = ctypes.c_void_p
+        kernel32.GlobalLock.argtypes = [ctypes.c_void_p]
+        kernel32.GlobalLock.restype = ctypes.c_void_p
+        kernel32.GlobalUnlock.argtypes = [ctypes.c_void_p]
+        kernel32.GlobalSize.argtypes = [ctypes.c_void_p]
+        kernel32.GlobalSize.restype = ctypes.c_size_t
+        kernel32.GlobalFree.argtypes = [ctypes.c_void_p]
+
+        self.cf_html = user32.RegisterClipboardFormatW("HTML Format")
+        self.cf_png = user32.RegisterClipboardFormatW("PNG")
+
+        # Sin Pillow no se puede crear el CF_DIB que esperan casi todas las
+        # aplicaciones, así que no se aceptan imágenes
+        self.formats = (FORMAT_HTML, FORMAT_PNG) if pillow_available() else (FORMAT_HTML,)
+
+    def _open(self):
+        # Otro proceso puede tener el portapapeles abierto un instante
+        for _ in range(10):
+            if self.user32.OpenClipboard(None):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _get(self, fmt):
+        if not self.user32.IsClipboardFormatAvailable(fmt):
+            return None
+        handle = self.user32.GetClipboardData(fmt)
+        if not handle:
+            return None
+        pointer = self.kernel32.GlobalLock(handle)
+        if not pointer:
+            return None
+        try:
+            return ctypes.string_at(pointer, self.kernel32.GlobalSize(handle))
+        finally:
+            self.kernel32.GlobalUnlock(handle)
+
+    def _set(self, fmt, data):
+        handle = self.kernel32.GlobalAlloc(self.GMEM_MOVEABLE, len(data))
+        pointer = self.kernel32.GlobalLock(handle)
+        ctypes.memmove(pointer, data, len(data))
+        self.kernel32.GlobalUnlock(handle)
+        # Si SetClipboardData tiene éxito el sistema pasa a ser el dueño
+        if not self.user32.SetClipboardData(fmt, handle):
+            self.kernel32.GlobalFree(handle)
+
+    def read(self, wanted):
+        """Formatos no textuales de `wanted` presentes en el portapapeles"""
+        html = png = dib = None
+        if not self._open():
+            return {}
+        try:
+            if FORMAT_HTML in wanted:
+                html = self._get(self.cf_html)
+            if FORMAT_PNG in wanted:
+                png = self._get(self.cf_png)
+                if png is None:
+                    dib = self._get(self.CF_DIB)
+        finally:
+            self.user32.CloseClipboard()
+
+        # Las conversiones se hacen con el portapapeles ya cerrado
+        formats = {}
+        if html:
+            formats[FORMAT_HTML] = cf_html_fragment(html)
+        if dib and pillow_available():
+            png = dib_to_png(dib)
+        if png:
+            formats[FORMAT_PNG] = png
+        return formats
+
+    def write(self, formats):
+        """Reemplaza el portapapeles por todos los formatos del paquete"""
+        entries = []
+        if FORMAT_TEXT in formats:
+            text = str(formats[FORMAT_TEXT], 'utf-8', 'ignore')
+            entries.append((self.CF_UNICODETEXT, text.encode('utf-16-le') + b'\0\0'))
+        if FORMAT_HTML in formats:
+            entries.append((self.cf_html, build_cf_html(bytes(formats[FORMAT_HTML]))))
+        if FORMAT_PNG in formats:
+            png = bytes(formats[FORMAT_PNG])
+            entries.append((self.cf_png, png))
+            entries.append((self.CF_DIB, png_to_dib(png)))
+
+        if not self._open():
+            raise OSError("No se pudo abrir el portapapeles")
+        try:
+            self.user32.EmptyClipboard()
+            for fmt, data in entries:
+                self._set(fmt, data)
+        finally:
+            self.user32.CloseClipboard()
+
+
+CF_HTML_HEADER = ("Version:0.9\r\nStartHTML:{:010d}\r\nEndHTML:{:010d}\r\n"
+                  "StartFragment:{:010d}\r\nEndFragment:{:010d}\r\n")
+
+
+def build_cf_html(fragment):
+    """Envuelve un fragmento HTML (UTF-8) con la cabecera de "HTML Format" de Windows"""
+    prefix = b"<html><body><!--StartFragment-->"
+    suffix = b"<!--EndFragment--></body></html>"
+    header_size = len(CF_HTML_HEADER.format(0, 0, 0, 0))
+    start_fragment = header_size + len(prefix)
+    end_fragment = start_fragment + len(fragment)
+    end_html = end_fragment + len(suffix)
+    header = CF_HTML_HEADER.format(header_size, end_html, start_fragment, end_fragment)
+    return header.encode('ascii') + prefix + fragment + suffix
+
+
+def cf_html_fragment(data):
+    """Extrae el fragmento copiado de un "HTML Format" de Windows"""
+    offsets = {}
+    for line in data[:512].split(b'\r\n'):
+        key, _, value = line.partition(b':')
+        if value.isdigit():
+            offsets[key] = int(value)
+    start = offsets.get(b'StartFragment', offsets.get(b'StartHTML'))
+    end = offsets.get(b'EndFragment', offsets.get(b'EndHTML'))
+    if start is None or end is None:
+        return data.rstrip(b'\0')
+    return data[start:end]
+
+
+class CommandRichClipboard:
+    """
+    Formatos del portapapeles en Linux con xclip (X11) o wl-paste/wl-copy
+    (Wayland). Estas herramientas ofrecen un solo tipo por escritura: una
+    imagen reemplaza al texto, así que solo se acepta texto o PNG (escribir
+    HTML dejaría sin texto a las aplicaciones que no lo entienden).
+    """
+
+    formats = (FORMAT_PNG,)
+
+    def __init__(self, list_types=None):
+        # list_types: función que devuelve los tipos disponibles sin lanzar
+        # un proceso (el auxiliar persistente de X11); si no, xclip/wl-paste
+        self.list_types = None
+        if (os.environ.get('WAYLAND_DISPLAY') and shutil.which('wl-paste')
+                and shutil.which('wl-copy')):
+            self.name = "wl-clipboard"
+            self.list_command = ['wl-paste', '--list-types']
+            self.read_command = ['wl-paste', '--no-newline', '--type']
+            self.write_command = ['wl-copy', '--type']
+        elif os.environ.get('DISPLAY') and shutil.which('xclip'):
+            self.name = "xclip"
+            self.list_command = ['xclip', '-selection', 'clipboard', '-t', 'TARGETS', '-o']
+            self.read_command = ['xclip', '-selection', 'clipboard', '-o', '-t']
+            self.write_command = ['xclip', '-selection', 'clipboard', '-i', '-t']
+            self.list_types = list_types
+        else:
+            raise RuntimeError("Se necesita xclip (X11) o wl-clipboard (Wayland)")
+
+    def _run(self, command, data=None):
+        result = subprocess.run(command, input=data, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, timeout=COMMAND_TIMEOUT)
+        return result.stdout if result.returncode == 0 else None
+
+    def read(self, wanted):
+        """Formatos no textuales de `wanted` presentes en el portapapeles"""
+        wanted = [mime for mime in wanted if mime != FORMAT_TEXT]
+        if not wanted:
+            return {}
+        if self.list_types:
+            available = self.list_types()
+        else:
+            targets = self._run(self.list_command)
+            if not targets:
+                return {}
+            available = set(targets.decode('ascii', 'ignore').split())
+        formats = {}
+        for mime in wanted:
+            if mime in available:
+                data = self._run(self.read_command + [mime])
+                if data:
+                    formats[mime] = data
+        return formats
+
+    def write(self, formats):
+        """Escribe el formato más rico del paquete (imagen, si no texto)"""
+        for mime in (FORMAT_PNG, FORMAT_HTML, FORMAT_TEXT):
+            if mime in formats:
+                # xclip y wl-copy quedan en segundo plano sirviendo la selección
+                subprocess.run(self.write_command + [mime], input=bytes(formats[mime]),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               timeout=COMMAND_TIMEOUT, check=True)
+                return
+
+
+class FakeRichClipboard:
+    """Formatos en memoria sobre un FakeBackend, para pruebas y benchmarks"""
+
+    name = "fake"
+    formats = (FORMAT_HTML, FORMAT_PNG)
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def read(self, wanted):
+        return {mime: data for mime, data in self.backend.paste_formats().items()
+                if mime in wanted}
+
+    def write(self, formats):
+        text = str(formats.get(FORMAT_TEXT, b''), 'utf-8', 'ignore')
+        self.backend.copy_formats({mime: bytes(data) for mime, data in formats.items()
+                                   if mime != FORMAT_TEXT}, text)
+
+
+def create_rich_clipboard(backend=None):
+    """
+    Crea el acceso a los formatos no textuales de la plataforma. Lanza una
+    excepción si no hay ninguno disponible (solo se sincroniza texto).
+    """
+    if backend is not None and hasattr(backend, 'create_rich_clipboard'):
+        return backend.create_rich_clipboard()
+    if sys.platform == 'win32':
+        return WindowsRichClipboard()
+    return CommandRichClipboard()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Clipboard Helper - Proceso auxiliar que mantiene abierto el portapapeles de X11
+Lo lanza HelperBackend (clipboard_backends) y atiende sus peticiones por
+stdin/stdout con una sola conexión a X (Tk), en lugar de lanzar xclip/xsel
+en cada lectura o escritura. Mientras es el propietario del portapapeles
+sirve su contenido a las demás aplicaciones, incluso después de que termine
+el proceso principal, hasta que otra aplicación copia algo.
+
+Protocolo: cada mensaje es HELPER_HEADER (operación o estado, longitud)
+seguido de esa cantidad de bytes UTF-8.
+"""
+
+import os
+import struct
+import sys
+
+
+HELPER_HEADER = struct.Struct('>cI')
+
+# Peticiones
+OP_PASTE = b'P'
+OP_COPY = b'C'
+OP_TARGETS = b'T'   # tipos que ofrece el propietario del portapapeles, uno por línea
+
+# Respuestas: contenido (o vacío) y error con su descripción
+STATUS_OK = b'+'
+STATUS_ERROR = b'-'
+
+# Cada cuánto se comprueba, tras cerrarse stdin, si otra aplicación ya es
+# la propietaria del portapapeles (en milisegundos)
+OWNER_CHECK_MS = 1000
+
+
+def read_exactly(fd, size):
+    # Sin buffer: lo que se lea de más no despertaría al bucle de Tk
+    data = bytearray()
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+class ClipboardHelper:
+    """Bucle de Tk con stdin registrado como fuente de eventos"""
+
+    def __init__(self):
+        import tkinter as tk
+        self.tk = tk
+        self.root = tk.Tk()
+        self.root.withdraw()
+        self.stdin = sys.stdin.fileno()
+        self.stdout = sys.stdout.buffer
+
+    def reply(self, status, data=b''):
+        self.stdout.write(HELPER_HEADER.pack(status, len(data)) + data)
+        self.stdout.flush()
+
+    def handle(self, op, data):
+        if op == OP_PASTE:
+            try:
+                text = self.root.clipboard_get()
+            except self.tk.TclError:
+                # Portapapeles vacío o sin texto
+                text = ''
+            self.reply(STATUS_OK, text.encode('utf-8', 'surrogatepass'))
+        elif op == OP_COPY:
+            self.root.clipboard_clear()
+            self.root.clipboard_append(data.decode('utf-8', 'surrogatepass'))
+            # Publicar la propiedad de la selección antes de responder
+            self.root.update()
+            self.reply(STATUS_OK)
+        elif op == OP_TARGETS:
+            try:
+                targets = self.root.tk.splitlist(self.root.tk.call(
+                    'selection', 'get', '-selection', 'CLIPBOARD', '-type', 'TARGETS'))
+            except self.tk.TclError:
+                # Sin propietario o no responde a TARGETS
+                targets = ()
+            self.reply(STATUS_OK, '\n'.join(targets).encode('utf-8', 'replace'))
+        else:
+            self.reply(STATUS_ERROR, f"Operación desconocida: {op!r}".encode('utf-8'))
+
+    def on_request(self, fd, mask):
+        header = read_exactly(self.stdin, HELPER_HEADER.size)
+        data = None
+        if header:
+            op, size = HELPER_HEADER.unpack(header)
+            data = read_exactly(self.stdin, size)
+        if data is None:
+            # El proceso principal terminó
+            self.root.deletefilehandler(self.stdin)
+            self.wait_for_new_owner()
+            return
+        try:
+            self.handle(op, data)
+        except Exception as e:
+            self.reply(STATUS_ERROR, str(e).encode('utf-8', 'replace'))
+
+    def owns_clipboard(self):
+        try:
+            return bool(self.root.tk.call('selection', 'own', '-selection', 'CLIPBOARD'))
+        except self.tk.TclError:
+            return False
+
+    def wait_for_new_owner(self):
+        """Sigue sirviendo lo último copiado hasta que otra aplicación copie algo"""
+        if self.owns_clipboard():
+            self.root.after(OWNER_CHECK_MS, self.wait_for_new_owner)
+        else:
+            self.root.destroy()
+
+    def run(self):
+        self.root.createfilehandler(self.stdin, self.tk.READABLE, self.on_request)
+        # Listo: el proceso principal espera esta respuesta antes de usarlo
+        self.reply(STATUS_OK)
+        self.root.mainloop()
+
+
+def main():
+    try:
+        helper = ClipboardHelper()
+    except Exception as e:
+        message = str(e).encode('utf-8', 'replace')
+        sys.stdout.buffer.write(HELPER_HEADER.pack(STATUS_ERROR, len(message)) + message)
+        sys.stdout.buffer.flush()
+        return 1
+    helper.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,114 +8,1079 @@ import socket
 import threading
 import time
 import sys
-import pyperclip
 import argparse
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from clipboard_backends import DEFAULT_POLL_MAX, DEFAULT_POLL_MIN, create_backend, create_notifier
+from clipboard_formats import (FORMAT_TEXT, create_rich_clipboard, decode_formats,
+                               describe_formats, encode_formats, formats_hello, parse_formats)
+from daemon import DEFAULT_CONFIG_PATH
+from kvm_codec import event_timestamp
+from protocol import (CHANNEL_CLIPBOARD, CHANNEL_DELTA, CHANNEL_FORMATS, CHANNEL_HEARTBEAT,
+                      CHANNEL_HELLO,
+                      CHANNEL_PULL, CHANNEL_SESSION, CHANNEL_TRANSFER, CLIPBOARD_META, CONTENT_FORMATS, CONTENT_TEXT,
+                      FLAG_CODEC_MASK, FRAME_HEADER,
+                      MAX_PAYLOAD_SIZE, ClipboardState, FrameReader, content_digest,
+                      decode_clipboard, encode_clipboard, pack_frame)
+
+# El motor (colas, transferencias, deltas, sesiones, latidos, compresión),
+# el historial y las métricas se importan donde se usan: al crear el motor,
+# con el primer saludo o en el subcomando que los necesita. Importar este
+# módulo (la interfaz y el servicio lo hacen al arrancar) no carga sqlite3,
+# lzma ni zstandard
+
+# Espera tras un error leyendo el portapapeles: se duplica si se repite
+ERROR_RETRY_INITIAL = 0.25
+ERROR_RETRY_MAX = 30.0
+
+# Copias locales recientes cuya confirmación de aplicado se espera
+DETECTED_HISTORY = 256
+
+# Prefijos de la salida por consola según el nivel del mensaje
+LOG_PREFIXES = {
+    'info': '[*]',
+    'success': '[+]',
+    'warning': '[-]',
+    'error': '[!]',
+}
 
 class ClipboardSync:
-    def __init__(self, mode, host='0.0.0.0', port=5555):
+    def __init__(self, mode, host='0.0.0.0', port=5555, backend=None, clipboard='auto',
+                 watcher='auto', poll_min=DEFAULT_POLL_MIN, poll_max=DEFAULT_POLL_MAX,
+                 engine='threads', compression='auto', compression_threshold=None,
+                 link_mbps=None, queue_size=None, slow_policy=None, chunk_size=None,
+                 max_transfer_size=None, delta=True, history=None, rich=True,
+                 lazy_threshold=None, auto_pull=True, pull_idle=None, relay=False,
+                 reconnect=True, reconnect_max=None, heartbeat_interval=None,
+                 heartbeat_misses=None, log_callback=None, status_callback=None):
+        """
+        Las opciones a None toman el valor por defecto (DEFAULT_*) del
+        módulo que las usa, que se importa aquí y no al cargar este módulo
+        """
+        from delta_sync import DeltaSync
+        from heartbeat import DEFAULT_HEARTBEAT_INTERVAL, DEFAULT_HEARTBEAT_MISSES, HeartbeatMonitor
+        from lazy_pull import DEFAULT_PULL_IDLE, LazyPull
+        from outbound import DEFAULT_POLICY, DEFAULT_QUEUE_SIZE
+        from relay import RelayTracker
+        from session import DEFAULT_RECONNECT_MAX, Backoff, ClientSession, SessionRegistry
+        from transfer import (DEFAULT_CHUNK_SIZE, DEFAULT_MAX_TRANSFER_SIZE, MAX_CHUNK_SIZE,
+                              TransferReceiver)
+
         self.mode = mode
         self.host = host
         self.port = port
-        self.last_clipboard = ""
+        self.engine = engine
         self.running = True
         self.connections = []
+        self.connections_lock = threading.Lock()
+        self.client_socket = None
+        self.server_socket = None
+        self.async_server = None
+
+        # Salida: consola por defecto, o los callbacks de la GUI
+        self.log_callback = log_callback
+        self.status_callback = status_callback
+
+        # Acceso al portapapeles y detección de cambios
+        self.clipboard = backend or create_backend(clipboard, log_callback=self.log)
+        self.watcher = watcher
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        # Notificador del hilo monitor (para avisarle de la actividad remota)
+        self.notifier = None
+
+        # Formatos además del texto (HTML, imágenes); None = solo texto.
+        # Cada peer anuncia en su saludo los formatos que acepta
+        self.rich = None
+        if rich:
+            try:
+                self.rich = create_rich_clipboard(self.clipboard)
+            except Exception as e:
+                self.log(f"Solo se sincronizará texto: {e}", "warning")
+        self.peer_formats = {}
+
+        # Digest del último contenido, origen e IDs vistos (sin guardar el texto)
+        self.state = ClipboardState()
+
+        # Aplicar un mensaje recibido (accept + copy) y leer un cambio local
+        # (paste + new_message) no se intercalan: si no, el monitor podría
+        # leer el contenido anterior y reenviarlo como si fuera nuevo
+        self.apply_lock = threading.Lock()
+
+        # Compresión negociada: códecs anunciados por cada peer en su saludo.
+        # El compresor (lzma, zstandard) se crea con el primer saludo
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.link_mbps = link_mbps
+        self._compressor = None
+        self.compressor_lock = threading.Lock()
+        self.peer_codecs = {}
+
+        # Hilo emisor: la compresión y el envío no bloquean al monitor
+        self.sender = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sender")
+
+        # Cola de salida acotada y escritor propio por peer (conexión -> escritor)
+        self.queue_size = DEFAULT_QUEUE_SIZE if queue_size is None else queue_size
+        self.slow_policy = DEFAULT_POLICY if slow_policy is None else slow_policy
+        self.writers = {}
+
+        # Contenidos mayores que chunk_size se envían por trozos; solo hay
+        # una transferencia saliente activa y un contenido nuevo la cancela
+        self.chunk_size = min(DEFAULT_CHUNK_SIZE if chunk_size is None else chunk_size,
+                              MAX_CHUNK_SIZE)
+        self.outgoing = []
+        self.next_transfer_id = 0
+        self.transfers = TransferReceiver(DEFAULT_MAX_TRANSFER_SIZE if max_transfer_size is None
+                                          else max_transfer_size)
+
+        # Envío diferencial respecto al último contenido (la base)
+        self.delta = DeltaSync(enabled=delta)
+
+        # Contenidos de al menos lazy_threshold bytes solo se anuncian; los
+        # anunciados por el otro extremo se descargan al pedirlos (pull()) o,
+        # con auto_pull, tras pull_idle segundos sin actividad
+        self.lazy = LazyPull(lazy_threshold)
+        self.auto_pull = auto_pull
+        self.pull_idle = DEFAULT_PULL_IDLE if pull_idle is None else pull_idle
+        self.pull_timer = None
+
+        # Modo hub (solo servidor): lo que llega de un cliente se reenvía a
+        # los demás, por el hilo emisor para conservar el orden
+        self.relay = relay and mode == 'server'
+        self.relay_tracker = RelayTracker()
+
+        # Sesiones: el servidor numera los cambios de su portapapeles; el
+        # cliente se reconecta solo y presenta el último número recibido
+        # para que le reenvíen el último estado solo si se perdió alguno
+        self.sessions = SessionRegistry()
+        self.session = ClientSession()
+        self.reconnect = reconnect
+        self.backoff = Backoff(maximum=DEFAULT_RECONNECT_MAX if reconnect_max is None
+                               else reconnect_max)
+        self.stopped = threading.Event()
+
+        # Latidos: miden el RTT de cada peer y desconectan a los que dejan
+        # de responder sin cerrar la conexión (suspensión, NAT caducado)
+        self.heartbeat = HeartbeatMonitor(
+            DEFAULT_HEARTBEAT_INTERVAL if heartbeat_interval is None else heartbeat_interval,
+            DEFAULT_HEARTBEAT_MISSES if heartbeat_misses is None else heartbeat_misses)
+
+        # Instante en que se detectó cada copia local reciente (id -> perf_counter),
+        # para medir hasta que el peer confirma que la aplicó
+        self.detected_at = OrderedDict()
+
+        # Historial persistente (HistoryStore opcional); se escribe en su
+        # propio hilo para no retrasar la detección ni la aplicación de cambios
+        self.history = history
+        self.history_writer = None
+        if history:
+            self.history_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+
+        # Tabla de despacho: canal de la trama -> manejador(data, peer)
+        self.handlers = {
+            CHANNEL_HELLO: self.handle_hello,
+            CHANNEL_CLIPBOARD: self.handle_clipboard,
+            CHANNEL_TRANSFER: self.handle_transfer,
+            CHANNEL_DELTA: self.handle_delta,
+            CHANNEL_FORMATS: self.handle_formats,
+            CHANNEL_PULL: self.handle_pull,
+            CHANNEL_SESSION: self.handle_session,
+            CHANNEL_HEARTBEAT: self.handle_heartbeat,
+        }
+
+    @property
+    def compressor(self):
+        """Compresor negociado; se crea la primera vez que se saluda a un peer"""
+        if self._compressor is None:
+            with self.compressor_lock:
+                if self._compressor is None:
+                    from compression import DEFAULT_LINK_MBPS, DEFAULT_THRESHOLD, PayloadCompressor
+                    threshold = self.compression_threshold
+                    self._compressor = PayloadCompressor(
+                        self.compression, DEFAULT_THRESHOLD if threshold is None else threshold,
+                        link_mbps=DEFAULT_LINK_MBPS if self.link_mbps is None else self.link_mbps)
+        return self._compressor
+
+    def log(self, message, level="info"):
+        """Muestra un mensaje por consola o lo entrega al callback de log"""
+        if self.log_callback:
+            self.log_callback(message, level)
+        else:
+            print(f"{LOG_PREFIXES.get(level, '[*]')} {message}")
+
+    def set_status(self, status):
+        """Notifica un cambio de estado (solo si hay callback, p. ej. la GUI)"""
+        if self.status_callback:
+            self.status_callback(status)
 
     def monitor_clipboard(self, send_callback):
         """Monitorea cambios en el portapapeles y los envía"""
-        print("[*] Monitoreando portapapeles...")
-        while self.running:
-            try:
-                current_clipboard = pyperclip.paste()
+        from metrics import BACKEND_DURATION
+        from session import Backoff
 
-                # Si hay un cambio en el portapapeles
-                if current_clipboard != self.last_clipboard and current_clipboard:
-                    print(f"[+] Nuevo contenido detectado ({len(current_clipboard)} caracteres)")
-                    self.last_clipboard = current_clipboard
-                    send_callback(current_clipboard)
+        notifier = create_notifier(self.watcher, self.clipboard, poll_min=self.poll_min,
+                                   poll_max=self.poll_max, log_callback=self.log)
+        self.notifier = notifier
+        self.log(f"Monitoreando portapapeles ({self.clipboard.name}, {notifier.name})...")
+        # Espera tras un error: crece si el error se repite
+        errors = Backoff(ERROR_RETRY_INITIAL, ERROR_RETRY_MAX)
+        try:
+            while self.running:
+                try:
+                    # Bloquea hasta que haya un cambio (o expire el timeout)
+                    if not notifier.wait(timeout=1.0):
+                        continue
+                    detected_at = time.perf_counter()
+                    errors.reset()
 
-                time.sleep(0.5)  # Revisar cada 0.5 segundos
+                    with self.apply_lock:
+                        start = time.perf_counter()
+                        current_clipboard = self.clipboard.paste()
+                        BACKEND_DURATION.labels('paste').observe(time.perf_counter() - start)
+                        data, kind = self.read_local(current_clipboard)
 
-            except Exception as e:
-                print(f"[!] Error monitoreando portapapeles: {e}")
-                time.sleep(1)
+                        if not data:
+                            continue
 
-    def update_clipboard(self, content):
-        """Actualiza el portapapeles local"""
+                        # Solo se envía si el digest cambió (descarta ecos propios)
+                        message = self.state.new_message(data, kind)
+                        if message:
+                            self.session.set_local(message)
+                            self.detected_at[message.msg_id] = detected_at
+                            if len(self.detected_at) > DETECTED_HISTORY:
+                                self.detected_at.popitem(last=False)
+                    if message:
+                        notifier.activity()
+                        # Un contenido local deja obsoleto lo anunciado por otros
+                        self.lazy.discard()
+                        if kind == CONTENT_FORMATS:
+                            detail = describe_formats(decode_formats(data))
+                        else:
+                            detail = f"{len(current_clipboard)} caracteres"
+                        self.log(f"Nuevo contenido detectado ({detail})", "success")
+                        self.sender.submit(send_callback, message)
+                        if self.mode == 'server':
+                            self.sender.submit(self.publish_state, message)
+                        if current_clipboard:
+                            digest = message.digest if kind == CONTENT_TEXT else None
+                            self.record_history(current_clipboard, digest, 'local')
+
+                except Exception as e:
+                    if self.running:
+                        self.log(f"Error monitoreando portapapeles: {e}", "error")
+                    self.stopped.wait(errors.next_delay())
+        finally:
+            notifier.close()
+
+    def update_clipboard(self, message, peer=None):
+        """
+        Actualiza el portapapeles local con un mensaje recibido y confirma a
+        `peer` (de quien llegó) que se aplicó
+        """
+        from heartbeat import encode_applied
+        from metrics import BACKEND_DURATION
+
+        try:
+            # Duplicados, ecos y contenido idéntico se descartan sin decodificar
+            with self.apply_lock:
+                if not self.state.accept(message):
+                    return
+                self.session.set_local(None)
+                self.lazy.discard()
+                if message.kind == CONTENT_FORMATS:
+                    formats = decode_formats(message.data)
+                    start = time.perf_counter()
+                    self.apply_formats(formats)
+                    BACKEND_DURATION.labels('copy_formats').observe(time.perf_counter() - start)
+                    text_message = self.text_message(message, formats)
+                    detail = describe_formats(formats)
+                else:
+                    content = str(message.data, 'utf-8', 'ignore')
+                    start = time.perf_counter()
+                    self.clipboard.copy(content)
+                    BACKEND_DURATION.labels('copy').observe(time.perf_counter() - start)
+                    text_message = message
+                    detail = f"{len(content)} caracteres"
+            self.lazy.remember(message)
+            if text_message:
+                self.delta.remember(text_message)
+                self.record_history(str(text_message.data, 'utf-8', 'ignore'),
+                                    text_message.digest, 'remote')
+            self.log(f"Portapapeles actualizado ({detail})", "success")
+            # Quien recibe algo suele copiar o pegar enseguida
+            if self.notifier:
+                self.notifier.activity()
+            if peer is not None:
+                payload = encode_applied(message.origin, message.msg_id)
+                self.queue_to_peer(peer, CHANNEL_HEARTBEAT, pack_frame(CHANNEL_HEARTBEAT, payload))
+            if self.mode == 'server':
+                self.sender.submit(self.publish_state,
+                                   message._replace(data=bytes(message.data)))
+        except Exception as e:
+            self.state.forget(message.digest)
+            self.log(f"Error actualizando portapapeles: {e}", "error")
+
+    # === FORMATOS ===
+
+    def accepted_formats(self):
+        """Formatos que este extremo puede escribir en su portapapeles"""
+        return (FORMAT_TEXT,) + (self.rich.formats if self.rich else ())
+
+    def wanted_formats(self):
+        """Formatos no textuales que acepta al menos un peer conectado"""
+        if not self.rich:
+            return set()
+        wanted = set()
+        for formats in list(self.peer_formats.values()):
+            wanted.update(formats)
+        wanted.discard(FORMAT_TEXT)
+        return wanted
+
+    def read_local(self, text):
+        """
+        Contenido local a enviar: (datos, tipo). Texto UTF-8, o un paquete
+        de formatos si el portapapeles tiene HTML o una imagen que algún
+        peer acepta. Se llama con apply_lock tomado.
+        """
+        wanted = self.wanted_formats()
+        rich = self.rich.read(wanted) if wanted else {}
+        if not rich:
+            return text.encode('utf-8'), CONTENT_TEXT
+        formats = {FORMAT_TEXT: text.encode('utf-8')} if text else {}
+        formats.update(rich)
+        return encode_formats(formats), CONTENT_FORMATS
+
+    def apply_formats(self, formats):
+        """
+        Escribe un paquete de formatos en el portapapeles. Las aplicaciones
+        o el sistema pueden guardarlo transformado, así que se relee y se
+        toma como último digest lo que el monitor va a leer.
+        Se llama con apply_lock tomado.
+        """
+        if self.rich is None:
+            self.clipboard.copy(str(formats.get(FORMAT_TEXT, b''), 'utf-8', 'ignore'))
+            return
+        self.rich.write(formats)
+        data, kind = self.read_local(self.clipboard.paste())
+        if data:
+            self.state.settle(content_digest(data))
+
+    @staticmethod
+    def text_message(message, formats):
+        """Versión de solo texto de un mensaje de formatos (None si no lleva texto)"""
+        if FORMAT_TEXT not in formats:
+            return None
+        data = bytes(formats[FORMAT_TEXT])
+        return message._replace(data=data, digest=content_digest(data), kind=CONTENT_TEXT)
+
+    def split_message(self, message, peers):
+        """
+        Agrupa los peers según la versión del mensaje que aceptan: cada uno
+        recibe solo los formatos que anunció, y los que solo aceptan texto
+        el texto. Devuelve [(peers, mensaje)]; los peers que no aceptan
+        ningún formato del mensaje se omiten.
+
+        Los dos extremos usan la parte de texto como base de los deltas,
+        la haya recibido un peer como texto o dentro del paquete.
+        """
+        if message.kind == CONTENT_TEXT:
+            return [(peers, message)]
+
+        formats = decode_formats(message.data)
+        groups = {}
+        for peer in peers:
+            accepted = self.peer_formats.get(peer, (FORMAT_TEXT,))
+            key = tuple(mime for mime in formats if mime in accepted)
+            if key:
+                groups.setdefault(key, []).append(peer)
+
+        text_message = self.text_message(message, formats)
+        variants = []
+        for key, members in groups.items():
+            if key == (FORMAT_TEXT,):
+                variants.append((members, text_message))
+            elif len(key) == len(formats):
+                variants.append((members, message))
+            else:
+                data = encode_formats({mime: formats[mime] for mime in key})
+                variants.append((members, message._replace(data=data,
+                                                           digest=content_digest(data))))
+
+        # Sin peers de solo texto prepare_message no calcula el delta de la
+        # parte de texto: se guarda como base aquí
+        if text_message and (FORMAT_TEXT,) not in groups:
+            self.delta.remember(text_message)
+        return variants
+
+    def record_history(self, text, digest, origin):
+        """Guarda un contenido sincronizado en el historial, si está activo"""
+        if self.history_writer:
+            self.history_writer.submit(self.store_history, text, digest, origin)
+
+    def store_history(self, text, digest, origin):
         try:
-            if content != self.last_clipboard:
-                pyperclip.copy(content)
-                self.last_clipboard = content
-                print(f"[+] Portapapeles actualizado ({len(content)} caracteres)")
+            self.history.add(text, origin, digest)
         except Exception as e:
-            print(f"[!] Error actualizando portapapeles: {e}")
+            self.log(f"Error guardando en el historial: {e}", "error")
+
+    # === TRAMAS ===
+
+    def handle_frame(self, channel, flags, data, peer=None):
+        """Procesa una trama recibida (común a todos los motores)"""
+        from metrics import count_received
+        from relay import CUT_THROUGH_CHANNELS
+
+        self.heartbeat.activity(peer)
+        count_received(channel, FRAME_HEADER.size + len(data))
+        raw = data
+        codec_id = flags & FLAG_CODEC_MASK
+        if codec_id:
+            data = self.compressor.decompress(codec_id, data, MAX_PAYLOAD_SIZE)
+
+        if self.relay and channel in CUT_THROUGH_CHANNELS and data:
+            self.relay_frame(channel, flags, raw, data, peer)
+
+        handler = self.handlers.get(channel)
+        if handler:
+            handler(data, peer)
+        # Los canales desconocidos (versiones futuras) se ignoran
+
+    def handle_hello(self, data, peer):
+        """Guarda los códecs y formatos que anuncia el peer"""
+        self.peer_codecs[peer] = self.compressor.parse_hello(data)
+        self.peer_formats[peer] = parse_formats(data)
+
+    def handle_clipboard(self, data, peer):
+        """Aplica un mensaje de portapapeles"""
+        if data:
+            message = decode_clipboard(data)
+            if self.relay and self.lazy.announces(len(message.data)):
+                self.relay_message(message._replace(data=bytes(message.data)), peer)
+            self.update_clipboard(message, peer)
+
+    def handle_formats(self, data, peer):
+        """Aplica un mensaje con varios formatos"""
+        if data:
+            message = decode_clipboard(data, CONTENT_FORMATS)
+            if self.relay:
+                self.relay_message(message._replace(data=bytes(message.data)), peer)
+            self.update_clipboard(message, peer)
+
+    def handle_transfer(self, data, peer):
+        """Añade un trozo a la transferencia del peer y aplica el contenido al completarse"""
+        message = self.transfers.feed(data, peer)
+        if message:
+            if self.relay:
+                self.relay_message(message, peer)
+            self.update_clipboard(message, peer)
+
+    def handle_delta(self, data, peer):
+        """Aplica un delta, o atiende la petición de contenido completo de un peer"""
+        from delta_sync import DELTA_NACK, DELTA_PATCH, DeltaBaseMismatch, DeltaSync
+
+        kind = data[0]
+        if kind == DELTA_PATCH:
+            try:
+                message = self.delta.apply(data)
+            except DeltaBaseMismatch as e:
+                self.log("Delta sin base local, pidiendo el contenido completo", "warning")
+                self.queue_to_peer(peer, CHANNEL_DELTA,
+                                   self.build_frame(CHANNEL_DELTA, DeltaSync.nack(e), peer))
+                return
+            self.update_clipboard(message, peer)
+        elif kind == DELTA_NACK:
+            origin, msg_id = DeltaSync.parse_nack(data)
+            self.sender.submit(self.resend_full, peer, origin, msg_id)
+
+    def handle_pull(self, data, peer):
+        """Anuncios de contenidos grandes y peticiones de descarga"""
+        from lazy_pull import PULL_ANNOUNCE, PULL_MISSING, PULL_REQUEST, decode_hash
+
+        kind = data[0]
+        if kind == PULL_ANNOUNCE:
+            message = self.lazy.receive(data, peer)
+            if message:
+                self.log("Contenido anunciado ya en caché, aplicado sin descargarlo")
+                if self.relay:
+                    self.relay_message(message, peer)
+                self.update_clipboard(message, peer)
+                return
+            pending = self.lazy.pending
+            if pending is None:
+                return
+            if pending.digest == self.state.last_digest:
+                self.lazy.discard(peer)
+                return
+            detail = f"{pending.digest.size // 1024} KiB, {', '.join(pending.formats)}"
+            if self.auto_pull:
+                self.log(f"Contenido disponible ({detail}), se descargará al quedar inactivo")
+                self.schedule_pull(pending)
+            else:
+                self.log(f"Contenido disponible ({detail}), pulsa Descargar o escribe 'pull'")
+        elif kind == PULL_REQUEST:
+            self.sender.submit(self.serve_pull, peer, decode_hash(data))
+        elif kind == PULL_MISSING:
+            self.lazy.discard(peer, decode_hash(data))
+            self.log("El contenido anunciado ya no está disponible", "warning")
+
+    def handle_session(self, data, peer):
+        """Reanudación de sesión (servidor) y números de secuencia (cliente)"""
+        from metrics import RECONNECTS
+        from session import (SESSION_KIND, SESSION_RESUME, SESSION_RESUMED, SESSION_SEQ,
+                             decode_resume, decode_resumed, decode_seq)
+
+        (kind,) = SESSION_KIND.unpack_from(data)
+        if kind == SESSION_RESUME and self.mode == 'server':
+            token, origin, last_seq, local_id = decode_resume(data)
+            self.sender.submit(self.resume_session, peer, token, origin, last_seq, local_id)
+        elif kind == SESSION_SEQ:
+            self.session.last_seq = decode_seq(data)
+        elif kind == SESSION_RESUMED:
+            seq, replayed, seen = decode_resumed(data)
+            elapsed = self.session.resumed(seq)
+            if elapsed is not None:
+                RECONNECTS.inc()
+                detail = ", recibido el último contenido" if replayed else ""
+                self.log(f"Sesión reanudada en {elapsed * 1000:.0f} ms{detail}", "success")
+            # Lo copiado aquí mientras no había conexión, si el servidor no
+            # lo vio y no tiene nada más nuevo
+            local = self.session.local
+            if local and not replayed and not seen:
+                self.log("Enviando lo copiado durante la desconexión")
+                self.sender.submit(self.send_to_server, local)
+
+    def handle_heartbeat(self, data, peer):
+        """
+        Responde a los latidos del peer, mide el RTT de los propios y la
+        latencia hasta que el peer aplicó una copia local
+        """
+        from heartbeat import (HEARTBEAT_APPLIED, HEARTBEAT_KIND, HEARTBEAT_PING,
+                               HEARTBEAT_PONG, decode_applied, decode_heartbeat,
+                               encode_heartbeat)
+        from metrics import COPY_TO_APPLY
+
+        (kind,) = HEARTBEAT_KIND.unpack_from(data)
+        if kind == HEARTBEAT_APPLIED:
+            origin, msg_id = decode_applied(data)
+            detected_at = self.detected_at.get(msg_id) if origin == self.state.origin else None
+            if detected_at is not None:
+                # La confirmación tarda en volver la mitad del RTT
+                latency = time.perf_counter() - detected_at - self.heartbeat.rtt(peer) / 2
+                COPY_TO_APPLY.observe(max(0.0, latency))
+            return
+
+        kind, seq, sent_ns, wall_ns = decode_heartbeat(data)
+        if kind == HEARTBEAT_PING:
+            payload = encode_heartbeat(HEARTBEAT_PONG, seq, sent_ns, time.time_ns())
+            self.queue_to_peer(peer, CHANNEL_HEARTBEAT, pack_frame(CHANNEL_HEARTBEAT, payload))
+        elif kind == HEARTBEAT_PONG:
+            self.heartbeat.pong(peer, sent_ns, wall_ns)
+
+    def observe_kvm(self, payload, peer):
+        """
+        Registra la latencia de un evento KVM ya reproducido, con la hora de
+        captura que lleva el evento corregida con la diferencia de relojes
+        """
+        from metrics import KVM_CAPTURE_TO_REPLAY
+
+        captured_ns = event_timestamp(payload)
+        offset_ns = self.heartbeat.clock_offset(peer)
+        if captured_ns is None or offset_ns is None:
+            return
+        latency = (time.time_ns() - (captured_ns - offset_ns)) / 1e9
+        KVM_CAPTURE_TO_REPLAY.observe(max(0.0, latency))
+
+    def schedule_pull(self, announcement):
+        """Programa la descarga automática de un anuncio"""
+        if self.pull_timer:
+            self.pull_timer.cancel()
+        self.pull_timer = threading.Timer(self.pull_idle, self.pull_when_idle, (announcement,))
+        self.pull_timer.daemon = True
+        self.pull_timer.start()
+
+    def pull_when_idle(self, announcement):
+        """Descarga el anuncio si sigue pendiente y el enlace con el peer está libre"""
+        if not self.running or self.lazy.pending is not announcement:
+            return
+        if not self.link_idle(announcement.peer):
+            self.schedule_pull(announcement)
+            return
+        self.pull(announcement)
+
+    def link_idle(self, peer):
+        """True si no hay nada pendiente de enviar a `peer` ni recibiéndose de él"""
+        writer = self.writers.get(peer)
+        if writer and writer.queue.pending():
+            return False
+        return not self.transfers.active(peer)
+
+    def pull(self, announcement=None):
+        """
+        Pide el contenido anunciado pendiente (botón de la GUI, consola o
+        descarga automática). Devuelve False si no había nada pendiente.
+        """
+        from lazy_pull import PULL_REQUEST, encode_hash
+
+        pending = self.lazy.take_pending(announcement)
+        if pending is None:
+            if announcement is None:
+                self.log("No hay contenido pendiente de descargar")
+            return False
+        self.log(f"Descargando contenido anunciado ({pending.digest.size // 1024} KiB)")
+        payload = encode_hash(PULL_REQUEST, pending.digest.hash)
+        self.queue_to_peer(pending.peer, CHANNEL_PULL,
+                           self.build_frame(CHANNEL_PULL, payload, pending.peer))
+        return True
+
+    def serve_pull(self, peer, digest_hash):
+        """Envía a un peer un contenido que anunciamos. Se ejecuta en el hilo emisor"""
+        from lazy_pull import PULL_MISSING, encode_hash
+
+        message = self.lazy.cache.get(digest_hash)
+        if message is None:
+            payload = encode_hash(PULL_MISSING, digest_hash)
+            self.queue_to_peer(peer, CHANNEL_PULL, self.build_frame(CHANNEL_PULL, payload, peer))
+        else:
+            self.send_full(peer, message)
+
+    def send_full(self, peer, message):
+        """Envía un mensaje completo a un peer: por trozos o en una sola trama"""
+        if len(message.data) > self.chunk_size:
+            # Varios peers pueden pedir el mismo mensaje: comparten transferencia
+            outgoing = next((transfer for transfer in self.outgoing
+                             if transfer.message.digest == message.digest), None)
+            if outgoing is None:
+                outgoing = self.new_transfer(message)
+            self.queue_to_peer(peer, CHANNEL_TRANSFER, outgoing)
+        else:
+            channel = CHANNEL_CLIPBOARD if message.kind == CONTENT_TEXT else CHANNEL_FORMATS
+            self.queue_to_peer(peer, channel,
+                               self.build_frame(channel, encode_clipboard(message), peer))
+
+    def cancel_outgoing(self):
+        """Un contenido nuevo cancela las transferencias salientes anteriores"""
+        for transfer in self.outgoing:
+            transfer.cancel()
+        self.outgoing = []
+
+    def prepare_message(self, message, use_delta=True):
+        """
+        Decide cómo enviar un mensaje local: delta (solo texto), anuncio
+        (contenidos grandes en modo bajo demanda), transferencia por trozos
+        o trama única. Devuelve (canal, payload o transferencia).
+        Se ejecuta en el hilo emisor.
+        """
+        if use_delta and message.kind == CONTENT_TEXT:
+            delta = self.delta.encode(message)
+            # Un delta mayor que un trozo iría en una sola trama: mejor por trozos
+            if delta and len(delta) <= self.chunk_size:
+                return CHANNEL_DELTA, delta
+        if self.lazy.should_announce(message):
+            return CHANNEL_PULL, self.lazy.announce(message)
+        if len(message.data) > self.chunk_size:
+            return CHANNEL_TRANSFER, self.new_transfer(message)
+        channel = CHANNEL_CLIPBOARD if message.kind == CONTENT_TEXT else CHANNEL_FORMATS
+        return channel, encode_clipboard(message)
+
+    def new_transfer(self, message):
+        """Crea la transferencia por trozos de un mensaje y la añade a las activas"""
+        from transfer import OutgoingTransfer
+
+        self.next_transfer_id += 1
+        transfer = OutgoingTransfer(self.next_transfer_id, message, self.build_frame,
+                                    self.chunk_size)
+        self.outgoing.append(transfer)
+        return transfer
+
+    def resend_full(self, peer, origin, msg_id):
+        """
+        Reenvía completo a un peer el mensaje cuyo delta no pudo aplicar,
+        si sigue siendo el contenido actual. Se ejecuta en el hilo emisor.
+        """
+        message = self.delta.last_message()
+        if message is None or (message.origin, message.msg_id) != (origin, msg_id):
+            return
+
+        self.send_state(peer, message)
+
+    def send_state(self, peer, message):
+        """
+        Envía a un peer un mensaje completo con los formatos que acepta:
+        anunciado si es grande en modo bajo demanda. Hilo emisor.
+        """
+        for peers, variant in self.split_message(message, [peer]):
+            if self.lazy.should_announce(variant):
+                payload = self.lazy.announce(variant)
+                self.queue_to_peer(peer, CHANNEL_PULL,
+                                   self.build_frame(CHANNEL_PULL, payload, peer))
+            else:
+                self.send_full(peer, variant)
+
+    def hello_frame(self):
+        """Trama de saludo con los códecs y formatos que acepta este extremo"""
+        return pack_frame(CHANNEL_HELLO, b','.join((self.compressor.hello(),
+                                                    formats_hello(self.accepted_formats()))))
+
+    def build_frame(self, channel, payload, peer):
+        """Comprime el payload con el códec negociado con `peer` y crea la trama"""
+        codec = self.compressor.choose(self.peer_codecs.get(peer))
+        flags, data = self.compressor.compress(payload, codec)
+        return pack_frame(channel, data, flags)
+
+    def open_writer(self, conn, name):
+        """Crea la cola de salida y el hilo escritor de una conexión"""
+        from outbound import PeerWriter
+
+        self.heartbeat.activity(conn)
+        self.writers[conn] = PeerWriter(conn, name, self.queue_size, self.slow_policy,
+                                        on_error=self.writer_failed)
+
+    def writer_failed(self, writer, error):
+        """El escritor de un peer no pudo enviar: se cierra la conexión"""
+        if self.running:
+            self.log(f"Error enviando a {writer.name}: {error}", "error")
+        self.remove_connection(writer.conn)
+
+    def send_frame(self, conn, channel, frame, received_at=None):
+        """
+        Encola una trama en la cola de salida de `conn` sin bloquear. Si el
+        peer no consume y la política es 'disconnect', se desconecta.
+        received_at: instante en que llegó al hub, si es una trama reenviada.
+        """
+        writer = self.writers.get(conn)
+        if writer is None:
+            return
+        if not writer.send(channel, frame, received_at):
+            self.log(f"{writer.name} no consume datos, desconectando", "error")
+            self.remove_connection(conn)
+
+    def queue_to_peer(self, peer, channel, item):
+        """Encola una trama o transferencia en un peer concreto desde cualquier hilo"""
+        if self.async_server:
+            self.async_server.loop.call_soon_threadsafe(self.send_frame, peer, channel, item)
+        else:
+            self.send_frame(peer, channel, item)
+
+    def send_channel(self, channel, payload):
+        """Envía un payload por un canal: a todos los clientes o al servidor"""
+        if self.mode == 'server':
+            self.broadcast_channel(channel, payload)
+        else:
+            self.send_channel_to_server(channel, payload)
+
+    def start_heartbeat(self):
+        """Arranca el hilo de latidos, si están activados"""
+        if self.heartbeat.enabled:
+            thread = threading.Thread(target=self.heartbeat_loop, daemon=True, name="heartbeat")
+            thread.start()
+
+    def heartbeat_loop(self):
+        """Cada intervalo expulsa a los peers callados y envía un latido al resto"""
+        from metrics import EVICTIONS, PEERS, RTT
+
+        while not self.stopped.wait(self.heartbeat.interval):
+            for conn in list(self.writers):
+                if self.heartbeat.expired(conn):
+                    EVICTIONS.inc()
+                    writer = self.writers.get(conn)
+                    name = writer.name if writer else "peer"
+                    silent = self.heartbeat.interval * self.heartbeat.misses
+                    self.log(f"{name} no responde desde hace más de {silent:g} s, "
+                             f"desconectando", "warning")
+                    self.evict_peer(conn)
+                    continue
+                payload = self.heartbeat.ping(conn)
+                self.queue_to_peer(conn, CHANNEL_HEARTBEAT, pack_frame(CHANNEL_HEARTBEAT, payload))
+            PEERS.set(len(self.writers))
+            rtt = self.heartbeat.average_rtt()
+            RTT.set(rtt[0] / 1000 if rtt else 0.0)
+            self.show_rtt_status()
+
+    def evict_peer(self, conn):
+        """
+        Corta la conexión con un peer que no responde. El lector de la
+        conexión lo detecta y la limpia (o reconecta, en el cliente).
+        """
+        if self.async_server:
+            self.async_server.loop.call_soon_threadsafe(conn.transport.abort)
+            return
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def rtt_status(self):
+        """Texto con el RTT y jitter medios para la barra de estado, o ''"""
+        rtt = self.heartbeat.average_rtt()
+        if rtt is None:
+            return ""
+        return f" - RTT {rtt[0]:.1f} ms (jitter {rtt[1]:.1f} ms)"
+
+    def show_rtt_status(self):
+        if self.mode == 'server':
+            self.client_count_status()
+        elif self.client_socket in self.writers:
+            self.set_status("Conectado" + self.rtt_status())
+
+    def print_stats(self):
+        """Muestra las estadísticas de compresión acumuladas"""
+        stats = self.compressor.stats
+        if stats.frames or stats.skipped:
+            self.log(f"Compresión: {stats.summary()}")
+        delta = self.delta.stats
+        if delta.deltas or delta.fallbacks or delta.nacks:
+            self.log(f"Delta: {delta.summary()}")
+        pulls = self.lazy.stats
+        if pulls.announced or pulls.received:
+            self.log(f"Bajo demanda: {pulls.summary()}")
+        if self.sessions.resumed:
+            self.log(f"Sesiones: {self.sessions.summary()}")
+        if self.session.reconnects:
+            self.log(f"Reconexión: {self.session.summary()}")
+        for conn, writer in list(self.writers.items()):
+            self.log(f"Envío a {writer.name}: {writer.queue.summary()}")
+            rtt = self.heartbeat.summary(conn)
+            if rtt:
+                self.log(f"Latidos con {writer.name}: {rtt}")
+        detection = self.notifier.summary() if self.notifier else None
+        if detection:
+            self.log(f"Detección de cambios: {detection}")
+        if self.heartbeat.evicted:
+            self.log(f"Peers desconectados por no responder: {self.heartbeat.evicted}")
+
+    def peer_stats(self):
+        """Profundidad de cola y latencia de envío de cada peer conectado"""
+        return {writer.name: writer.queue.stats() for writer in list(self.writers.values())}
+
+    # === SERVIDOR ===
+
+    def client_count_status(self):
+        # Un escritor por cliente conectado, con cualquiera de los dos motores
+        count = len(self.writers)
+        self.set_status(f"Servidor activo - {count} cliente(s){self.rtt_status()}")
 
     def handle_client(self, conn, addr):
         """Maneja la conexión de un cliente"""
-        print(f"[+] Cliente conectado desde {addr}")
-        self.connections.append(conn)
+        self.log(f"Cliente conectado desde {addr[0]}:{addr[1]}", "success")
+        self.open_writer(conn, f"{addr[0]}:{addr[1]}")
+        with self.connections_lock:
+            self.connections.append(conn)
+        self.client_count_status()
+        reader = FrameReader(conn)
 
         try:
+            self.send_frame(conn, CHANNEL_HELLO, self.hello_frame())
+
             while self.running:
-                # Recibir tamaño del mensaje
-                size_data = conn.recv(4)
-                if not size_data:
+                # Recibir trama completa (cabecera + contenido)
+                frame = reader.read_frame()
+                if frame is None:
                     break
 
-                msg_size = int.from_bytes(size_data, byteorder='big')
-
-                # Recibir el contenido
-                data = b''
-                while len(data) < msg_size:
-                    packet = conn.recv(min(msg_size - len(data), 4096))
-                    if not packet:
-                        break
-                    data += packet
-
-                if data:
-                    content = data.decode('utf-8', errors='ignore')
-                    self.update_clipboard(content)
+                self.handle_frame(*frame, peer=conn)
 
         except Exception as e:
-            print(f"[!] Error con cliente {addr}: {e}")
+            if self.running:
+                self.log(f"Error con cliente {addr[0]}:{addr[1]}: {e}", "error")
         finally:
+            self.remove_connection(conn)
+            self.log(f"Cliente {addr[0]}:{addr[1]} desconectado", "warning")
+            self.client_count_status()
+
+    def broadcast_to_clients(self, message, source=None, received_at=None):
+        """
+        Envía un mensaje de portapapeles a todos los clientes conectados, o
+        en modo hub reenvía el de un cliente (`source`) a los demás.
+        """
+        self.cancel_outgoing()
+        if source is None:
+            peers = None if message.kind == CONTENT_TEXT else self.client_peers()
+        else:
+            peers = self.relay_tracker.targets(self.client_peers(), source, message.origin)
+        if message.kind == CONTENT_TEXT:
+            variants = [(peers, message)]
+        else:
+            variants = self.split_message(message, peers)
+        for peers, variant in variants:
+            # Al reenviar, el hub ya tomó el mensaje como base de los deltas
+            channel, item = self.prepare_message(variant, use_delta=source is None)
+            if channel == CHANNEL_TRANSFER:
+                self.broadcast_transfer(item, peers, received_at)
+            else:
+                self.broadcast_channel(channel, item, peers, received_at)
+
+    def publish_state(self, message):
+        """
+        Numera un cambio del portapapeles del servidor y envía el número a
+        los clientes, detrás del contenido. Hilo emisor.
+        """
+        from session import encode_seq
+
+        seq = self.sessions.advance(message)
+        self.broadcast_channel(CHANNEL_SESSION, encode_seq(seq))
+
+    def resume_session(self, peer, token, origin, last_seq, local_id):
+        """
+        Responde a un cliente que se (re)conecta: le reenvía el último
+        estado si se perdió algún cambio y le dice si vimos su último
+        mensaje local. Hilo emisor.
+        """
+        from session import encode_resumed
+
+        replay, seq = self.sessions.resume(token, origin, last_seq)
+        if replay is not None:
+            self.send_state(peer, replay)
+        payload = encode_resumed(seq, replay is not None, self.state.seen(origin, local_id))
+        self.queue_to_peer(peer, CHANNEL_SESSION, self.build_frame(CHANNEL_SESSION, payload, peer))
+
+    # === MODO HUB ===
+
+    def relay_frame(self, channel, flags, raw, data, peer):
+        """
+        Reenvía a los demás clientes una trama de texto tal cual llegó: se
+        crea una sola vez y el mismo buffer se encola en todos los peers que
+        usan su códec. Se llama en el hilo receptor, antes de aplicarla.
+        """
+        from compression import CODEC_NAMES, available_codecs
+        from delta_sync import DELTA_KIND, DELTA_PATCH
+
+        offset = 0
+        if channel == CHANNEL_DELTA:
+            if data[0] != DELTA_PATCH:
+                return
+            offset = DELTA_KIND.size
+        elif self.lazy.announces(len(data) - CLIPBOARD_META.size):
+            # En modo bajo demanda se anuncia desde handle_clipboard
+            return
+        origin, msg_id = CLIPBOARD_META.unpack_from(data, offset)[:2]
+        if not self.relay_tracker.should_relay(origin, msg_id, peer):
+            return
+
+        received_at = time.perf_counter()
+        frame = pack_frame(channel, raw, flags)
+        codec = CODEC_NAMES.get(flags & FLAG_CODEC_MASK)
+        if codec is None:
+            # Sin comprimir: la misma trama sirve para todos los peers
+            frames = {name: frame for name in [None] + available_codecs()}
+            payload = None
+        else:
+            frames = {codec: frame}
+            payload = bytes(data)
+        self.sender.submit(self.forward_frame, channel, payload, frames, peer, origin,
+                           received_at)
+
+    def forward_frame(self, channel, payload, frames, source, origin, received_at):
+        """Encola una trama reenviada en los demás clientes. Hilo emisor"""
+        peers = self.relay_tracker.targets(self.client_peers(), source, origin)
+        self.broadcast_channel(channel, payload, peers, received_at, frames)
+
+    def relay_message(self, message, source):
+        """
+        Reenvía un mensaje completo (formatos, transferencias, contenidos
+        anunciados) a los demás clientes, con los formatos que acepta cada
+        uno. `message` debe tener sus propios datos, no una vista del buffer
+        de lectura.
+        """
+        if self.relay_tracker.should_relay(message.origin, message.msg_id, source):
+            self.sender.submit(self.broadcast_to_clients, message, source,
+                               time.perf_counter())
+
+    def client_peers(self):
+        """Clientes conectados (sockets, o escritores en el motor asyncio)"""
+        if self.async_server:
+            return list(self.writers)
+        with self.connections_lock:
+            return self.connections[:]
+
+    def broadcast_transfer(self, transfer, peers=None, received_at=None):
+        """Encola una transferencia por trozos en todos los clientes (o en `peers`)"""
+        if self.async_server:
+            self.async_server.broadcast_transfer(transfer, peers, received_at)
+            return
+
+        for conn in self.client_peers() if peers is None else peers:
+            self.send_frame(conn, CHANNEL_TRANSFER, transfer, received_at)
+
+    def broadcast_channel(self, channel, payload, peers=None, received_at=None, frames=None):
+        """
+        Envía un payload a todos los clientes conectados (o a `peers`).
+        `frames` puede traer tramas ya codificadas por códec (modo hub).
+        """
+        if self.async_server:
+            self.async_server.broadcast_channel(channel, payload, peers, received_at, frames)
+            return
+
+        connections = self.client_peers() if peers is None else peers
+
+        # Cada códec se aplica una sola vez aunque lo usen varios clientes;
+        # las tramas solo se encolan, cada escritor las envía a su ritmo
+        frames = dict(frames or {})
+        for conn in connections:
+            codec = self.compressor.choose(self.peer_codecs.get(conn))
+            if codec not in frames:
+                flags, data = self.compressor.compress(payload, codec)
+                frames[codec] = pack_frame(channel, data, flags)
+            self.send_frame(conn, channel, frames[codec], received_at)
+
+    def remove_connection(self, conn):
+        """Quita una conexión de la lista y la cierra"""
+        with self.connections_lock:
             if conn in self.connections:
                 self.connections.remove(conn)
-            conn.close()
-            print(f"[-] Cliente {addr} desconectado")
+        self.peer_codecs.pop(conn, None)
+        self.peer_formats.pop(conn, None)
+        self.transfers.discard(conn)
+        self.lazy.discard(conn)
+        self.relay_tracker.forget(conn)
+        rtt = self.heartbeat.summary(conn)
+        self.heartbeat.forget(conn)
+        writer = self.writers.pop(conn, None)
+        if writer:
+            writer.close()
+            if self.running:
+                self.log(f"Envío a {writer.name}: {writer.queue.summary()}")
+                if rtt:
+                    self.log(f"Latidos con {writer.name}: {rtt}")
+        conn.close()
 
-    def broadcast_to_clients(self, content):
-        """Envía contenido a todos los clientes conectados"""
-        msg = content.encode('utf-8')
-        msg_size = len(msg).to_bytes(4, byteorder='big')
+    def get_local_ip(self):
+        """Obtiene la IP local del dispositivo, o None si no hay red"""
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.connect(("8.8.8.8", 80))
+            local_ip = s.getsockname()[0]
+            s.close()
+            return local_ip
+        except:
+            return None
 
-        for conn in self.connections[:]:  # Copia de la lista
-            try:
-                conn.sendall(msg_size + msg)
-            except Exception as e:
-                print(f"[!] Error enviando a cliente: {e}")
-                if conn in self.connections:
-                    self.connections.remove(conn)
-                conn.close()
+    def show_local_ip(self):
+        """Muestra la IP local para que los clientes sepan a dónde conectarse"""
+        local_ip = self.get_local_ip()
+        if local_ip:
+            self.log(f"IP local: {local_ip}", "success")
 
     def run_server(self):
         """Ejecuta el modo servidor"""
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.start_heartbeat()
+        if self.engine == 'asyncio':
+            from async_server import AsyncClipboardServer
+            self.async_server = AsyncClipboardServer(self)
+            self.async_server.run()
+            return
+
+        self.server_socket = server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind((self.host, self.port))
-        server.listen(5)
+        server.listen(socket.SOMAXCONN)
 
-        print(f"[*] Servidor escuchando en {self.host}:{self.port}")
-        print(f"[*] Los clientes deben conectarse a esta IP")
+        self.log(f"Servidor escuchando en {self.host}:{self.port}", "success")
+        self.log("Los clientes deben conectarse a esta IP")
+        self.client_count_status()
 
         # Obtener y mostrar la IP local
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            local_ip = s.getsockname()[0]
-            s.close()
-            print(f"[*] IP local: {local_ip}")
-        except:
-            pass
+        self.show_local_ip()
 
         # Iniciar monitoreo del portapapeles
         clipboard_thread = threading.Thread(
@@ -139,120 +1104,615 @@ class ClipboardSync:
                     client_thread.start()
                 except socket.timeout:
                     continue
+                except OSError:
+                    # El socket se cerró desde stop()
+                    break
 
         except KeyboardInterrupt:
             print("\n[*] Deteniendo servidor...")
         finally:
-            self.running = False
-            for conn in self.connections:
-                conn.close()
-            server.close()
+            self.stop()
+            self.print_stats()
 
-    def send_to_server(self, content):
-        """Envía contenido al servidor"""
-        if hasattr(self, 'client_socket') and self.client_socket:
+    # === CLIENTE ===
+
+    def send_to_server(self, message):
+        """Envía un mensaje de portapapeles al servidor"""
+        self.cancel_outgoing()
+        conn = self.client_socket
+        if conn is None or conn not in self.writers:
+            # Sin conexión: se envía al reanudar la sesión si sigue siendo lo último
+            return
+        for peers, variant in self.split_message(message, [conn]):
+            channel, item = self.prepare_message(variant)
+            if channel == CHANNEL_TRANSFER:
+                self.send_frame(conn, CHANNEL_TRANSFER, item)
+            else:
+                self.send_channel_to_server(channel, item)
+
+    def send_channel_to_server(self, channel, payload):
+        """Envía un payload al servidor por el canal indicado"""
+        if self.client_socket:
             try:
-                msg = content.encode('utf-8')
-                msg_size = len(msg).to_bytes(4, byteorder='big')
-                self.client_socket.sendall(msg_size + msg)
+                frame = self.build_frame(channel, payload, self.client_socket)
+                self.send_frame(self.client_socket, channel, frame)
             except Exception as e:
-                print(f"[!] Error enviando al servidor: {e}")
+                self.log(f"Error enviando al servidor: {e}", "error")
 
     def receive_from_server(self):
-        """Recibe contenido del servidor"""
+        """Recibe contenido del servidor hasta que se cierre la conexión"""
+        reader = FrameReader(self.client_socket)
         try:
             while self.running:
-                # Recibir tamaño del mensaje
-                size_data = self.client_socket.recv(4)
-                if not size_data:
+                # Recibir trama completa (cabecera + contenido)
+                frame = reader.read_frame()
+                if frame is None:
                     break
 
-                msg_size = int.from_bytes(size_data, byteorder='big')
-
-                # Recibir el contenido
-                data = b''
-                while len(data) < msg_size:
-                    packet = self.client_socket.recv(min(msg_size - len(data), 4096))
-                    if not packet:
-                        break
-                    data += packet
-
-                if data:
-                    content = data.decode('utf-8', errors='ignore')
-                    self.update_clipboard(content)
+                self.handle_frame(*frame, peer=self.client_socket)
 
         except Exception as e:
-            print(f"[!] Error recibiendo del servidor: {e}")
+            if self.running:
+                self.log(f"Error recibiendo del servidor: {e}", "error")
         finally:
-            print("[*] Conexión con servidor cerrada")
+            if self.running:
+                self.session.connection_lost()
+                self.log("Conexión con servidor cerrada", "warning")
+                self.set_status("Desconectado")
+
+    def connect_to_server(self):
+        """Abre la conexión con el servidor y presenta la sesión. False si falla"""
+        from session import DEFAULT_CONNECT_TIMEOUT
+
+        self.log(f"Conectando a {self.host}:{self.port}...")
+        self.set_status("Conectando...")
+        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            conn.settimeout(DEFAULT_CONNECT_TIMEOUT)
+            conn.connect((self.host, self.port))
+            conn.settimeout(None)
+        except OSError as e:
+            conn.close()
+            if self.running:
+                self.log(f"Error de conexión: {e}", "error")
+                self.set_status("Error de conexión")
+            return False
+
+        self.client_socket = conn
+        self.open_writer(conn, f"{self.host}:{self.port}")
+        self.send_frame(conn, CHANNEL_HELLO, self.hello_frame())
+        self.send_frame(conn, CHANNEL_SESSION,
+                        pack_frame(CHANNEL_SESSION, self.session.resume_payload(self.state.origin)))
+        self.backoff.reset()
+        self.log("Conectado al servidor", "success")
+        self.set_status("Conectado")
+        return True
+
+    def client_loop(self):
+        """
+        Conecta y recibe del servidor; si la conexión se pierde (o no se
+        pudo abrir) vuelve a intentarlo con espera exponencial y jitter
+        """
+        while self.running:
+            if self.connect_to_server():
+                self.receive_from_server()
+                conn, self.client_socket = self.client_socket, None
+                self.remove_connection(conn)
+
+            if not self.reconnect:
+                self.running = False
+                break
+            if self.running:
+                delay = self.backoff.next_delay()
+                self.log(f"Reintentando en {delay:.1f} s...")
+                self.set_status("Reconectando...")
+                self.stopped.wait(delay)
 
     def run_client(self):
         """Ejecuta el modo cliente"""
-        print(f"[*] Conectando a {self.host}:{self.port}...")
+        # Iniciar monitoreo del portapapeles (sigue activo entre reconexiones)
+        clipboard_thread = threading.Thread(
+            target=self.monitor_clipboard,
+            args=(self.send_to_server,)
+        )
+        clipboard_thread.daemon = True
+        clipboard_thread.start()
+
+        self.start_heartbeat()
 
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Conexión y reconexiones en su propio hilo
+        connection_thread = threading.Thread(target=self.client_loop)
+        connection_thread.daemon = True
+        connection_thread.start()
 
+        # Mantener el programa corriendo
         try:
-            self.client_socket.connect((self.host, self.port))
-            print("[+] Conectado al servidor")
-
-            # Iniciar hilo para recibir del servidor
-            receive_thread = threading.Thread(target=self.receive_from_server)
-            receive_thread.daemon = True
-            receive_thread.start()
-
-            # Iniciar monitoreo del portapapeles
-            clipboard_thread = threading.Thread(
-                target=self.monitor_clipboard,
-                args=(self.send_to_server,)
-            )
-            clipboard_thread.daemon = True
-            clipboard_thread.start()
-
-            # Mantener el programa corriendo
+            while self.running:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\n[*] Deteniendo cliente...")
+        finally:
+            self.stop()
+            self.print_stats()
+
+    def stop(self):
+        """Detiene la sincronización y cierra todos los sockets"""
+        self.running = False
+        self.stopped.set()
+
+        if self.pull_timer:
+            self.pull_timer.cancel()
+
+        for writer in list(self.writers.values()):
+            writer.close()
+
+        if self.server_socket:
             try:
-                while self.running:
-                    time.sleep(1)
-            except KeyboardInterrupt:
-                print("\n[*] Deteniendo cliente...")
+                self.server_socket.close()
+            except:
+                pass
 
-        except Exception as e:
-            print(f"[!] Error de conexión: {e}")
-        finally:
-            self.running = False
-            self.client_socket.close()
+        if self.client_socket:
+            try:
+                # Sin shutdown, close() no despierta al hilo que está en recv_into()
+                self.client_socket.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
+            try:
+                self.client_socket.close()
+            except:
+                pass
 
-def main():
-    parser = argparse.ArgumentParser(
-        description='Clipboard Sync - Sincronizador de portapapeles',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
+        with self.connections_lock:
+            connections = self.connections[:]
+        for conn in connections:
+            try:
+                # shutdown avisa al cliente aunque otro hilo esté en recv()
+                conn.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
+            try:
+                conn.close()
+            except:
+                pass
+
+EPILOG = """
 Ejemplos de uso:
   Modo servidor:
     python clipboard_sync.py server
     python clipboard_sync.py server --port 6000
+    python clipboard_sync.py server --engine asyncio
+    python clipboard_sync.py server --relay
 
   Modo cliente:
     python clipboard_sync.py client --host 192.168.1.100
     python clipboard_sync.py client --host 192.168.1.100 --port 6000
-        """
+    python clipboard_sync.py client --host 192.168.1.100 --reconnect-max 10
+
+  Detección de cambios:
+    python clipboard_sync.py server --watcher polling
+
+  Compresión:
+    python clipboard_sync.py client --host 192.168.1.100 --compression lzma
+
+  Clientes lentos:
+    python clipboard_sync.py server --queue-size 16 --slow-policy latest
+
+  Contenidos grandes:
+    python clipboard_sync.py client --host 192.168.1.100 --chunk-size 1048576 --max-transfer-mb 4096
+    python clipboard_sync.py server --no-delta
+    python clipboard_sync.py server --lazy-mb 16
+    python clipboard_sync.py client --host 192.168.1.100 --manual-pull
+
+  Métricas:
+    python clipboard_sync.py server --metrics-port 9464
+    python clipboard_sync.py stats --metrics-port 9464
+
+  Servicio (la interfaz gráfica lo lanza y se conecta a él):
+    python clipboard_sync.py daemon --autostart
+    python clipboard_sync.py ctl status
+    python clipboard_sync.py ctl logs
+
+  Historial:
+    python clipboard_sync.py history
+    python clipboard_sync.py history "texto a buscar"
+    python clipboard_sync.py history --copy 42
+"""
+
+
+def add_history_db_argument(parser):
+    from history_store import DEFAULT_HISTORY_PATH
+
+    parser.add_argument('--history-db', default=DEFAULT_HISTORY_PATH,
+                              help=f'Archivo del historial (default: {DEFAULT_HISTORY_PATH})')
+
+
+def format_entry(entry, width=60):
+    """Una línea de la lista del historial: id, fecha, origen, tamaño y vista previa"""
+    when = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.last_used))
+    preview = ' '.join(entry.preview.split())
+    if len(preview) > width:
+        preview = preview[:width - 3] + '...'
+    return f"{entry.id:>7}  {when}  {entry.origin:<6} {entry.size:>9} B  {preview}"
+
+
+def run_history(args):
+    """Subcomando history: buscar, mostrar, copiar o borrar entradas"""
+    from history_store import HistoryStore
+
+    store = HistoryStore(args.history_db)
+    try:
+        if args.clear:
+            store.clear()
+            print("[+] Historial borrado")
+        elif args.delete is not None:
+            if not store.delete(args.delete):
+                print(f"[!] No existe la entrada {args.delete}")
+                return 1
+            print(f"[+] Entrada {args.delete} eliminada")
+        elif args.stats:
+            stats = store.stats()
+            print(f"[*] {stats['entries']} entradas, {stats['bytes']} bytes "
+                  f"(límites: {stats['max_entries']} entradas, {stats['max_bytes']} bytes)")
+        elif args.show is not None or args.copy is not None:
+            entry_id = args.show if args.show is not None else args.copy
+            content = store.get(entry_id)
+            if content is None:
+                print(f"[!] No existe la entrada {entry_id}")
+                return 1
+            if args.show is not None:
+                print(content)
+            else:
+                create_backend().copy(content)
+                print(f"[+] Entrada {entry_id} copiada al portapapeles ({len(content)} caracteres)")
+        else:
+            start = time.perf_counter()
+            entries = store.search(' '.join(args.query), args.limit)
+            elapsed = (time.perf_counter() - start) * 1000
+            for entry in entries:
+                print(format_entry(entry))
+            print(f"[*] {len(entries)} resultado(s) en {elapsed:.1f} ms")
+    finally:
+        store.close()
+    return 0
+
+
+def run_stats(args):
+    """Subcomando stats: lee el endpoint de métricas de un proceso en marcha"""
+    import urllib.request
+    from metrics import histogram_quantile, parse_metrics
+
+    url = f"http://{args.host}:{args.metrics_port}/metrics"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            text = response.read().decode('utf-8')
+    except OSError as e:
+        print(f"[!] No se pudo leer {url}: {e}")
+        return 1
+    if args.raw:
+        print(text, end='')
+        return 0
+
+    samples = parse_metrics(text)
+    prefix = 'clipboard_sync_'
+
+    channels = {}
+    for name, field in (('frames_received_total', 'rx'), ('bytes_received_total', 'rx_bytes'),
+                        ('frames_sent_total', 'tx'), ('bytes_sent_total', 'tx_bytes')):
+        for labels, value in samples.get(prefix + name, []):
+            channels.setdefault(labels.get('channel', '?'), {})[field] = int(value)
+    print(f"{'canal':<10} {'tramas rx':>10} {'bytes rx':>14} {'tramas tx':>10} {'bytes tx':>14}")
+    for channel, counts in sorted(channels.items()):
+        print(f"{channel:<10} {counts.get('rx', 0):>10} {counts.get('rx_bytes', 0):>14} "
+              f"{counts.get('tx', 0):>10} {counts.get('tx_bytes', 0):>14}")
+    print()
+
+    for name in ('peers', 'rtt_seconds', 'frames_dropped_total', 'reconnects_total',
+                 'evictions_total'):
+        for _, value in samples.get(prefix + name, []):
+            print(f"{name:<24} {value:g}")
+    print()
+
+    # Histogramas: una línea por serie (nombre y etiquetas salvo 'le')
+    histograms = {}
+    for name, series in samples.items():
+        if not name.endswith('_bucket'):
+            continue
+        for labels, value in series:
+            bound = float(labels.pop('le'))
+            key = (name[len(prefix):-len('_bucket')],
+                   ','.join(f"{k}={v}" for k, v in sorted(labels.items())))
+            histograms.setdefault(key, []).append((bound, value))
+    print(f"{'histograma':<40} {'n':>8} {'media':>10} {'p50':>10} {'p90':>10} {'p99':>10}")
+    for (name, labels), buckets in sorted(histograms.items()):
+        buckets.sort()
+        count = buckets[-1][1]
+        total = sum(value for sample_labels, value in samples.get(prefix + name + '_sum', [])
+                    if ','.join(f"{k}={v}" for k, v in sorted(sample_labels.items())) == labels)
+        label = f"{name}{{{labels}}}" if labels else name
+        if not count:
+            print(f"{label:<40} {0:>8}")
+            continue
+        quantiles = [histogram_quantile(buckets, q) * 1000 for q in (0.5, 0.9, 0.99)]
+        print(f"{label:<40} {int(count):>8} {total / count * 1000:>8.2f}ms "
+              + ' '.join(f"{value:>8.2f}ms" for value in quantiles))
+    return 0
+
+
+def add_control_argument(parser):
+    parser.add_argument('--control',
+                        help='Socket de control del servicio: ruta de un socket Unix o puerto '
+                             'de 127.0.0.1 (default: uno por usuario en el directorio temporal)')
+
+
+def add_config_argument(parser):
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH,
+                        help=f'Configuración de la interfaz gráfica (default: {DEFAULT_CONFIG_PATH})')
+
+
+def load_config(path):
+    """Configuración guardada por la interfaz gráfica ({} si no existe)"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def run_ctl(args):
+    """Subcomando ctl: órdenes al servicio por su socket de control"""
+    from daemon import DaemonClient
+    client = DaemonClient(args.control)
+    try:
+        if args.command == 'logs':
+            state, events = client.subscribe()
+            for event in state['logs']:
+                print(format_log_event(event))
+            for event in events:
+                if event['event'] == 'log':
+                    print(format_log_event(event))
+                elif event['event'] == 'status':
+                    print(f"[*] Estado: {event['status']}")
+            return 0
+
+        fields = {'config': load_config(args.config)} if args.command == 'start' else {}
+        reply = client.request(args.command, **fields)
+    except KeyboardInterrupt:
+        return 0
+    except (OSError, RuntimeError, ValueError) as e:
+        # ValueError: línea de control que no es JSON
+        print(f"[!] {e}")
+        return 1
+
+    if args.command == 'status':
+        config = reply['config']
+        running = f"activa ({config.get('mode')}, puerto {config.get('port')})" \
+            if reply['running'] else "detenida"
+        print(f"[*] Sincronización {running}: {reply['status']}")
+        print(f"[*] KVM {'activado' if reply['kvm'] else 'desactivado'}")
+        for name, stats in reply.get('peers', {}).items():
+            print(f"    {name}: cola {stats['depth']}/{stats['maxsize']}, {stats['sent']} enviadas, "
+                  f"{stats['dropped']} descartadas, latencia media {stats['avg_latency_ms']:.1f} ms")
+    elif args.command == 'pull' and not reply.get('pulled'):
+        print("[*] No hay contenido pendiente de descargar")
+    else:
+        print("[+] Hecho")
+    return 0
+
+
+def format_log_event(event):
+    when = time.strftime('%H:%M:%S', time.localtime(event['time']))
+    return f"{LOG_PREFIXES.get(event['level'], '[*]')} [{when}] {event['message']}"
+
+
+def read_console_commands(sync):
+    """Órdenes escritas en la consola mientras se sincroniza ('pull', 'stats')"""
+    for line in sys.stdin:
+        command = line.strip()
+        if command in ('p', 'pull'):
+            sync.pull()
+        elif command in ('s', 'stats'):
+            sync.print_stats()
+
+
+def main():
+    # Valores por defecto de las opciones de sincronización
+    from compression import DEFAULT_LINK_MBPS, DEFAULT_THRESHOLD, available_codecs
+    from heartbeat import DEFAULT_HEARTBEAT_INTERVAL, DEFAULT_HEARTBEAT_MISSES
+    from history_store import DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES
+    from lazy_pull import DEFAULT_PULL_IDLE
+    from metrics import DEFAULT_METRICS_PORT
+    from outbound import DEFAULT_POLICY, DEFAULT_QUEUE_SIZE, POLICIES
+    from session import DEFAULT_RECONNECT_MAX
+    from transfer import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_TRANSFER_SIZE, MAX_CHUNK_SIZE
+
+    parser = argparse.ArgumentParser(
+        description='Clipboard Sync - Sincronizador de portapapeles',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=EPILOG
     )
 
-    parser.add_argument('mode', choices=['server', 'client'],
-                       help='Modo de operación: server o client')
-    parser.add_argument('--host', default='0.0.0.0',
-                       help='IP del servidor (para cliente) o interfaz (para servidor)')
-    parser.add_argument('--port', type=int, default=5555,
-                       help='Puerto a usar (default: 5555)')
+    # Opciones comunes de los modos servidor y cliente
+    sync_options = argparse.ArgumentParser(add_help=False)
+    sync_options.add_argument('--host', default='0.0.0.0',
+                              help='IP del servidor (para cliente) o interfaz (para servidor)')
+    sync_options.add_argument('--port', type=int, default=5555,
+                              help='Puerto a usar (default: 5555)')
+    sync_options.add_argument('--engine', default='threads', choices=['threads', 'asyncio'],
+                              help='Motor del servidor: un hilo por cliente o asyncio en un '
+                                   'solo hilo para muchos clientes (default: threads)')
+    sync_options.add_argument('--clipboard', default='auto', choices=['auto', 'helper', 'pyperclip'],
+                              help='Acceso al portapapeles: proceso auxiliar persistente (X11) '
+                                   'o pyperclip (default: auto, pyperclip como respaldo)')
+    sync_options.add_argument('--watcher', default='auto',
+                              choices=['auto', 'xfixes', 'wayland', 'windows', 'polling'],
+                              help='Detección de cambios del portapapeles (default: auto, '
+                                   'polling solo como respaldo)')
+    sync_options.add_argument('--poll-min', type=float, default=DEFAULT_POLL_MIN,
+                              help='Polling: segundos entre lecturas tras un cambio '
+                                   f'(default: {DEFAULT_POLL_MIN:g})')
+    sync_options.add_argument('--poll-max', type=float, default=DEFAULT_POLL_MAX,
+                              help='Polling: segundos entre lecturas como máximo sin cambios '
+                                   f'(default: {DEFAULT_POLL_MAX:g})')
+    sync_options.add_argument('--compression', default='auto',
+                              choices=['auto', 'none'] + available_codecs(),
+                              help='Códec de compresión; se usa solo si el otro extremo lo '
+                                   'soporta (default: auto)')
+    sync_options.add_argument('--compression-threshold', type=int, default=DEFAULT_THRESHOLD,
+                              help=f'Tamaño mínimo en bytes para comprimir (default: {DEFAULT_THRESHOLD})')
+    sync_options.add_argument('--link-mbps', type=float, default=DEFAULT_LINK_MBPS,
+                              help='Velocidad del enlace en Mbit/s para estimar el tiempo '
+                                   f'ahorrado por la compresión (default: {DEFAULT_LINK_MBPS:g})')
+    sync_options.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                              help='Tramas pendientes por peer como máximo '
+                                   f'(default: {DEFAULT_QUEUE_SIZE})')
+    sync_options.add_argument('--slow-policy', default=DEFAULT_POLICY, choices=POLICIES,
+                              help='Qué hacer con un peer lento cuando su cola se llena: '
+                                   'descartar la trama más antigua, conservar solo el último '
+                                   f'portapapeles o desconectarlo (default: {DEFAULT_POLICY})')
+    sync_options.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                              help='Los contenidos mayores se envían por trozos de este tamaño '
+                                   f'en bytes (default: {DEFAULT_CHUNK_SIZE}, '
+                                   f'máximo: {MAX_CHUNK_SIZE})')
+    sync_options.add_argument('--max-transfer-mb', type=int,
+                              default=DEFAULT_MAX_TRANSFER_SIZE // (1024 * 1024),
+                              help='Tamaño máximo en MiB de un contenido recibido por trozos '
+                                   f'(default: {DEFAULT_MAX_TRANSFER_SIZE // (1024 * 1024)})')
+    sync_options.add_argument('--no-delta', action='store_true',
+                              help='Enviar siempre el contenido completo en lugar de solo '
+                                   'los cambios respecto al anterior')
+    sync_options.add_argument('--lazy-mb', type=float,
+                              help='Anunciar los contenidos de al menos N MiB en lugar de '
+                                   'enviarlos; el otro extremo los descarga cuando los pide')
+    sync_options.add_argument('--manual-pull', action='store_true',
+                              help="No descargar automáticamente lo anunciado por el otro "
+                                   "extremo; se pide escribiendo 'pull' en la consola")
+    sync_options.add_argument('--pull-idle', type=float, default=DEFAULT_PULL_IDLE,
+                              help='Segundos de inactividad antes de descargar lo anunciado '
+                                   f'(default: {DEFAULT_PULL_IDLE:g})')
+    sync_options.add_argument('--no-reconnect', action='store_true',
+                              help='Cliente: terminar al perder la conexión en lugar de reconectar')
+    sync_options.add_argument('--reconnect-max', type=float, default=DEFAULT_RECONNECT_MAX,
+                              help=f'Espera máxima entre reintentos de conexión, en segundos '
+                                   f'(default: {DEFAULT_RECONNECT_MAX:g})')
+    sync_options.add_argument('--heartbeat', type=float, default=DEFAULT_HEARTBEAT_INTERVAL,
+                              help=f'Segundos entre latidos para medir el RTT, 0 = sin latidos '
+                                   f'(default: {DEFAULT_HEARTBEAT_INTERVAL:g})')
+    sync_options.add_argument('--heartbeat-misses', type=int, default=DEFAULT_HEARTBEAT_MISSES,
+                              help=f'Intervalos sin recibir nada antes de desconectar a un peer '
+                                   f'(default: {DEFAULT_HEARTBEAT_MISSES})')
+    sync_options.add_argument('--relay', action='store_true',
+                              help='Modo hub (servidor): reenviar lo que copia cada cliente '
+                                   'a todos los demás')
+    sync_options.add_argument('--metrics-port', type=int, default=0,
+                              help='Servir métricas de Prometheus en 127.0.0.1 y este puerto, '
+                                   f'0 = sin endpoint (p. ej. {DEFAULT_METRICS_PORT})')
+    sync_options.add_argument('--text-only', action='store_true',
+                              help='Sincronizar solo texto (sin imágenes ni HTML)')
+    sync_options.add_argument('--no-history', action='store_true',
+                              help='No guardar los contenidos sincronizados en el historial')
+    add_history_db_argument(sync_options)
+    sync_options.add_argument('--history-max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                              help=f'Entradas máximas del historial (default: {DEFAULT_MAX_ENTRIES})')
+    sync_options.add_argument('--history-max-mb', type=int,
+                              default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                              help='Tamaño máximo del historial en MiB '
+                                   f'(default: {DEFAULT_MAX_BYTES // (1024 * 1024)})')
+
+    subparsers = parser.add_subparsers(dest='mode', required=True,
+                                       help='Modo de operación')
+    subparsers.add_parser('server', parents=[sync_options], help='Modo servidor')
+    subparsers.add_parser('client', parents=[sync_options], help='Modo cliente')
+
+    history_parser = subparsers.add_parser('history', help='Buscar en el historial del portapapeles')
+    history_parser.add_argument('query', nargs='*',
+                               help='Texto a buscar (sin texto: últimas entradas)')
+    history_parser.add_argument('--limit', type=int, default=20,
+                               help='Resultados como máximo (default: 20)')
+    history_parser.add_argument('--show', type=int, metavar='ID',
+                               help='Muestra el contenido completo de una entrada')
+    history_parser.add_argument('--copy', type=int, metavar='ID',
+                               help='Copia una entrada al portapapeles')
+    history_parser.add_argument('--delete', type=int, metavar='ID',
+                               help='Elimina una entrada')
+    history_parser.add_argument('--stats', action='store_true',
+                               help='Muestra el tamaño del historial')
+    history_parser.add_argument('--clear', action='store_true',
+                               help='Borra todo el historial')
+    add_history_db_argument(history_parser)
+
+    stats_parser = subparsers.add_parser('stats', help='Muestra las métricas de un proceso en marcha')
+    stats_parser.add_argument('--metrics-port', type=int, default=DEFAULT_METRICS_PORT,
+                              help=f'Puerto del endpoint de métricas (default: {DEFAULT_METRICS_PORT})')
+    stats_parser.add_argument('--host', default='127.0.0.1',
+                              help='Equipo del endpoint de métricas (default: 127.0.0.1)')
+    stats_parser.add_argument('--raw', action='store_true',
+                              help='Muestra el texto de Prometheus sin procesar')
+
+    daemon_parser = subparsers.add_parser('daemon', help='Servicio sin interfaz, controlado por '
+                                                         'un socket local (interfaz gráfica, ctl)')
+    add_control_argument(daemon_parser)
+    daemon_parser.add_argument('--autostart', action='store_true',
+                               help='Iniciar la sincronización con el archivo de configuración')
+    add_config_argument(daemon_parser)
+
+    ctl_parser = subparsers.add_parser('ctl', help='Envía una orden al servicio')
+    ctl_parser.add_argument('command', choices=['status', 'start', 'stop', 'pull', 'stats',
+                                                'logs', 'shutdown'],
+                            help='start usa el archivo de configuración; logs muestra el '
+                                 'registro hasta Ctrl+C')
+    add_control_argument(ctl_parser)
+    add_config_argument(ctl_parser)
 
     args = parser.parse_args()
 
+    if args.mode == 'daemon':
+        from daemon import run_daemon
+        return run_daemon(args.control, load_config(args.config) if args.autostart else None)
+    if args.mode == 'ctl':
+        return run_ctl(args)
+    if args.mode == 'history':
+        return run_history(args)
+    if args.mode == 'stats':
+        return run_stats(args)
+
     print("=" * 60)
     print("  Clipboard Sync - Sincronizador de Portapapeles")
     print("=" * 60)
     print()
 
-    sync = ClipboardSync(args.mode, args.host, args.port)
+    history = None
+    if not args.no_history:
+        from history_store import HistoryStore
+        history = HistoryStore(args.history_db, max_entries=args.history_max_entries,
+                               max_bytes=args.history_max_mb * 1024 * 1024)
+
+    sync = ClipboardSync(args.mode, args.host, args.port, clipboard=args.clipboard,
+                         watcher=args.watcher, poll_min=args.poll_min, poll_max=args.poll_max,
+                         engine=args.engine, compression=args.compression,
+                         compression_threshold=args.compression_threshold,
+                         link_mbps=args.link_mbps, queue_size=args.queue_size,
+                         slow_policy=args.slow_policy, chunk_size=args.chunk_size,
+                         max_transfer_size=args.max_transfer_mb * 1024 * 1024,
+                         delta=not args.no_delta, history=history,
+                         rich=not args.text_only,
+                         lazy_threshold=int(args.lazy_mb * 1024 * 1024) if args.lazy_mb else None,
+                         auto_pull=not args.manual_pull, pull_idle=args.pull_idle,
+                         relay=args.relay, reconnect=not args.no_reconnect,
+                         reconnect_max=args.reconnect_max, heartbeat_interval=args.heartbeat,
+                         heartbeat_misses=args.heartbeat_misses)
+
+    if args.metrics_port:
+        from metrics import start_metrics_server
+        try:
+            start_metrics_server(args.metrics_port)
+            print(f"[*] Métricas en http://127.0.0.1:{args.metrics_port}/metrics")
+        except OSError as e:
+            print(f"[!] No se pudo abrir el endpoint de métricas: {e}")
+
+    # Órdenes por consola: 'pull' (con --manual-pull) y 'stats' (RTT, colas...)
+    if sys.stdin.isatty():
+        threading.Thread(target=read_console_commands, args=(sync,), daemon=True).start()
 
     if args.mode == 'server':
         sync.run_server()
@@ -260,4 +1720,4 @@ Ejemplos de uso:
         sync.run_client()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
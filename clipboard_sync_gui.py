@@ -2,20 +2,71 @@
 """
 Clipboard Sync GUI - Interfaz gráfica para sincronizador de portapapeles
 Soporta Windows y Linux (Kali)
+La sincronización la hace el servicio (daemon.py): la interfaz lo lanza si
+no está en marcha, le envía órdenes y muestra su estado y su registro
 """
 
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import socket
 import threading
-import time
-import pyperclip
 import json
 import os
+import sys
+import time
+from collections import deque
 from datetime import datetime
-import pystray
-from PIL import Image, ImageDraw
-from kvm_sync import KVMSync
+from daemon import (DEFAULT_CONFIG_PATH, LOG_SUMMARY_INTERVAL, DaemonClient, LogLimiter,
+                    daemon_command)
+
+# pystray, PIL, el historial y el acceso al portapapeles se importan al
+# usarlos: la ventana aparece antes y el KVM (pynput) vive en el servicio
+
+
+# Segundos entre intentos de volver a conectar con el servicio
+DAEMON_RETRY = 2.0
+
+# Líneas que se muestran en el registro (las más antiguas se borran)
+LOG_MAX_LINES = 1000
+
+# Cada cuántos ms se vuelcan en la ventana los mensajes de otros hilos, y
+# cuántas líneas como máximo en cada vuelco
+LOG_DRAIN_MS = 100
+LOG_BATCH = 200
+
+# Filtro del registro: texto del desplegable -> nivel mínimo
+LOG_FILTERS = {'Todo': 'info', 'Avisos y errores': 'warning', 'Solo errores': 'error'}
+LOG_LEVELS = {'info': 0, 'success': 0, 'warning': 1, 'error': 2}
+
+# El icono de la bandeja se crea cuando la ventana ya se ha dibujado
+TRAY_DELAY_MS = 500
+
+# Icono de la bandeja pre-renderizado (junto al script o dentro del ejecutable)
+TRAY_ICON_FILE = "clipboard_sync_tray.png"
+
+
+def render_tray_icon():
+    """Dibuja el icono de la bandeja (64x64)"""
+    from PIL import Image, ImageDraw
+
+    # Crear una imagen de 64x64 con un círculo
+    width = 64
+    height = 64
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+
+    # Dibujar un círculo azul con una "C" estilizada
+    draw.ellipse([8, 8, 56, 56], fill='#2196F3', outline='#1976D2', width=2)
+
+    # Dibujar texto "C" en el centro
+    draw.text((22, 16), "C", fill='white')
+
+    return image
+
+
+def tray_icon_path():
+    base = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base, TRAY_ICON_FILE)
 
 
 class ClipboardSyncGUI:
@@ -26,7 +77,7 @@ class ClipboardSyncGUI:
         self.root.resizable(False, False)
 
         # Archivo de configuración
-        self.config_file = "clipboard_sync_config.json"
+        self.config_file = DEFAULT_CONFIG_PATH
 
         # Variables
         self.running = False
@@ -35,11 +86,24 @@ class ClipboardSyncGUI:
         self.port_var = tk.StringVar(value="")
         self.status_var = tk.StringVar(value="Detenido")
 
-        # Variables de sincronización
-        self.last_clipboard = ""
-        self.connections = []
-        self.client_socket = None
-        self.server_socket = None
+        # Registro: los hilos solo encolan; la ventana lo vuelca cada
+        # LOG_DRAIN_MS (Tk no se puede tocar desde otros hilos)
+        self.log_queue = deque(maxlen=LOG_MAX_LINES)
+        self.log_lines = deque(maxlen=LOG_MAX_LINES)
+        self.log_limiter = LogLimiter()
+        self.log_level = 'info'
+        self.log_stale = False
+        self.next_log_summary = 0.0
+        self.ui_calls = deque()
+
+        # Servicio que sincroniza (conexión de control) y backend del
+        # portapapeles para copiar desde el historial
+        self.daemon = DaemonClient()
+        self.clipboard = None
+
+        # Historial persistente del portapapeles (se abre al usarlo)
+        self.history = None
+        self.history_window = None
 
         # System tray
         self.tray_icon = None
@@ -47,22 +111,36 @@ class ClipboardSyncGUI:
 
         # KVM (Keyboard/Mouse sharing)
         self.kvm_enabled = tk.BooleanVar(value=False)
-        self.kvm_sync = None
         self.control_status_var = tk.StringVar(value="Sin control")
+        self.kvm_move_rate = None  # Movimientos de mouse por segundo (None = por defecto)
+
+        # Contenidos de al menos estos MiB solo se anuncian (None = enviar todo)
+        self.lazy_mb = None
+
+        # Modo hub: el servidor reenvía lo que copia cada cliente a los demás
+        self.relay = False
+
+        # Puerto del endpoint de métricas del servicio (solo en el archivo de
+        # configuración; None = sin endpoint)
+        self.metrics_port = None
 
         # Cargar configuración previa
         self.load_config()
 
         self.create_widgets()
         self.update_interface()
+        self.root.after(LOG_DRAIN_MS, self.drain_ui)
 
-        # Configurar system tray
-        self.setup_tray()
+        # Configurar system tray (cuando la ventana ya está a la vista)
+        self.root.after(TRAY_DELAY_MS, self.setup_tray)
 
         # Configurar comportamiento de cierre/minimizar
         self.root.protocol("WM_DELETE_WINDOW", self.hide_window)
         self.root.bind("<Unmap>", self.on_minimize)
 
+        # Estado y registro del servicio, si ya está en marcha
+        threading.Thread(target=self.follow_daemon, daemon=True).start()
+
     def load_config(self):
         """Carga la configuración desde el archivo JSON"""
         try:
@@ -72,50 +150,73 @@ class ClipboardSyncGUI:
                     self.mode.set(config.get('mode', 'server'))
                     self.host_var.set(config.get('host', ''))
                     self.port_var.set(config.get('port', ''))
+                    self.kvm_move_rate = config.get('kvm_move_rate')
+                    self.lazy_mb = config.get('lazy_mb')
+                    self.relay = config.get('relay', False)
+                    self.metrics_port = config.get('metrics_port')
+                    if config.get('log_level') in LOG_LEVELS:
+                        self.log_level = config['log_level']
         except Exception as e:
             print(f"Error cargando configuración: {e}")
 
+    def current_config(self):
+        """Configuración de la interfaz, la misma que recibe el servicio"""
+        return {
+            'mode': self.mode.get(),
+            'host': self.host_var.get(),
+            'port': self.port_var.get(),
+            'kvm_move_rate': self.kvm_move_rate,
+            'lazy_mb': self.lazy_mb,
+            'relay': self.relay,
+            'metrics_port': self.metrics_port,
+            'log_level': self.log_level
+        }
+
     def save_config(self):
         """Guarda la configuración actual en el archivo JSON"""
         try:
-            config = {
-                'mode': self.mode.get(),
-                'host': self.host_var.get(),
-                'port': self.port_var.get()
-            }
             with open(self.config_file, 'w') as f:
-                json.dump(config, f, indent=4)
+                json.dump(self.current_config(), f, indent=4)
         except Exception as e:
             print(f"Error guardando configuración: {e}")
 
     def create_tray_icon(self):
-        """Crea un ícono simple para el system tray"""
-        # Crear una imagen de 64x64 con un círculo
-        width = 64
-        height = 64
-        image = Image.new('RGB', (width, height), 'white')
-        draw = ImageDraw.Draw(image)
-
-        # Dibujar un círculo azul con una "C" estilizada
-        draw.ellipse([8, 8, 56, 56], fill='#2196F3', outline='#1976D2', width=2)
-
-        # Dibujar texto "C" en el centro
-        draw.text((22, 16), "C", fill='white')
+        """Icono del system tray: el pre-renderizado o, si no está, lo dibuja y lo guarda"""
+        from PIL import Image
 
+        path = tray_icon_path()
+        try:
+            image = Image.open(path)
+            image.load()
+            return image
+        except OSError:
+            pass
+        image = render_tray_icon()
+        try:
+            image.save(path)
+        except OSError:
+            pass
         return image
 
     def setup_tray(self):
         """Configura el ícono del system tray"""
-        icon_image = self.create_tray_icon()
+        if self.tray_icon is not None:
+            return
+        try:
+            import pystray
+            icon_image = self.create_tray_icon()
+        except Exception as e:
+            self.log(f"Bandeja del sistema no disponible: {e}", "warning")
+            return
 
         # Crear el menú del tray
         menu = pystray.Menu(
-            pystray.MenuItem("Mostrar", self.show_window, default=True),
-            pystray.MenuItem("Ocultar", self.hide_window),
+            pystray.MenuItem("Mostrar", self.from_tray(self.show_window), default=True),
+            pystray.MenuItem("Ocultar", self.from_tray(self.hide_window)),
             pystray.Menu.SEPARATOR,
-            pystray.MenuItem("Estado", self.show_status),
+            pystray.MenuItem("Estado", self.from_tray(self.show_status)),
             pystray.Menu.SEPARATOR,
-            pystray.MenuItem("Salir", self.quit_app)
+            pystray.MenuItem("Salir", self.from_tray(self.quit_app))
         )
 
         # Crear el ícono del tray
@@ -124,15 +225,28 @@ class ClipboardSyncGUI:
         # Ejecutar el tray en un hilo separado
         threading.Thread(target=self.tray_icon.run, daemon=True).start()
 
+    def from_tray(self, action):
+        """Acción del menú del tray (su propio hilo) ejecutada en el de Tk"""
+        return lambda icon, item: self.call_in_ui(action)
+
     def show_window(self, icon=None, item=None):
         """Muestra la ventana principal"""
         self.is_hidden = False
+        if self.log_stale:
+            self.redraw_log()
         self.root.deiconify()
         self.root.lift()
         self.root.focus_force()
 
     def hide_window(self, icon=None, item=None):
         """Oculta la ventana al system tray"""
+        # Si se cierra antes de que exista el icono, se crea ya
+        self.setup_tray()
+        if self.tray_icon is None:
+            # Sin bandeja no habría forma de volver a mostrarla
+            if self.root.state() != 'iconic':
+                self.root.iconify()
+            return
         self.is_hidden = True
         self.root.withdraw()
 
@@ -151,17 +265,27 @@ class ClipboardSyncGUI:
             pass
 
     def quit_app(self, icon=None, item=None):
-        """Cierra completamente la aplicación"""
+        """Cierra la interfaz y, si se pide, también el servicio"""
+        stop_daemon = True
         if self.running:
-            response = messagebox.askokcancel(
+            response = messagebox.askyesnocancel(
                 "Salir",
-                "La sincronización está activa. ¿Deseas detenerla y salir?",
+                "La sincronización está activa. ¿Deseas detenerla también?\n\n"
+                "Si eliges No, seguirá sincronizando en segundo plano.",
                 parent=self.root if not self.is_hidden else None
             )
-            if not response:
+            if response is None:
                 return
+            stop_daemon = response
 
-        self.stop_sync()
+        if stop_daemon:
+            try:
+                self.daemon.request('shutdown')
+            except (OSError, RuntimeError):
+                pass
+
+        if self.history:
+            self.history.close()
 
         # Detener el tray icon
         if self.tray_icon:
@@ -294,13 +418,33 @@ class ClipboardSyncGUI:
                                      command=self.stop_sync, width=15, state=tk.DISABLED)
         self.stop_button.grid(row=0, column=1, padx=5)
 
+        self.history_button = ttk.Button(control_frame, text="Historial",
+                                         command=self.show_history, width=15)
+        self.history_button.grid(row=0, column=2, padx=5)
+
+        # Descarga del contenido grande anunciado por el otro equipo
+        self.pull_button = ttk.Button(control_frame, text="Descargar",
+                                      command=self.pull_content, width=15, state=tk.DISABLED)
+        self.pull_button.grid(row=0, column=3, padx=5)
+
         # Log
         log_frame = ttk.LabelFrame(main_frame, text="Registro de Actividad", padding="10")
         log_frame.grid(row=6, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
 
-        self.log_text = scrolledtext.ScrolledText(log_frame, height=15, width=70,
+        filter_frame = ttk.Frame(log_frame)
+        filter_frame.grid(row=0, column=0, sticky=tk.E, pady=(0, 5))
+        ttk.Label(filter_frame, text="Mostrar:").grid(row=0, column=0, padx=5)
+        level_names = {level: name for name, level in LOG_FILTERS.items()}
+        self.log_filter_var = tk.StringVar(value=level_names[self.log_level]
+                                           if self.log_level in level_names else 'Todo')
+        log_filter = ttk.Combobox(filter_frame, textvariable=self.log_filter_var,
+                                  values=list(LOG_FILTERS), state="readonly", width=16)
+        log_filter.grid(row=0, column=1)
+        log_filter.bind("<<ComboboxSelected>>", self.on_log_filter)
+
+        self.log_text = scrolledtext.ScrolledText(log_frame, height=14, width=70,
                                                   state=tk.DISABLED, wrap=tk.WORD)
-        self.log_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.log_text.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
 
         # Configurar tags para colores
         self.log_text.tag_config("info", foreground="blue")
@@ -329,14 +473,82 @@ class ClipboardSyncGUI:
         except Exception as e:
             self.log(f"Error obteniendo IP: {e}", "error")
 
-    def log(self, message, tag="info"):
-        """Agrega un mensaje al log"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
+    def log(self, message, tag="info", when=None):
+        """
+        Agrega un mensaje al log desde cualquier hilo (`when`: hora del
+        servicio, por defecto ahora). Se muestra en el siguiente vuelco.
+        """
+        if self.log_limiter.allow(message, tag):
+            self.log_queue.append((when or time.time(), message, tag))
+
+    def call_in_ui(self, func, *args):
+        """Ejecuta func(*args) en el hilo de Tk en el siguiente vuelco"""
+        self.ui_calls.append((func, args))
+
+    def drain_ui(self):
+        """Vuelca en la ventana lo encolado por otros hilos (cada LOG_DRAIN_MS)"""
+        try:
+            while self.ui_calls:
+                func, args = self.ui_calls.popleft()
+                func(*args)
+
+            now = time.monotonic()
+            if now >= self.next_log_summary:
+                self.next_log_summary = now + LOG_SUMMARY_INTERVAL
+                for message, tag in self.log_limiter.flush():
+                    self.log_queue.append((time.time(), message, tag))
+
+            self.flush_log()
+        except tk.TclError:
+            # La ventana se está cerrando
+            return
+        self.root.after(LOG_DRAIN_MS, self.drain_ui)
+
+    def flush_log(self):
+        lines = []
+        while self.log_queue and len(lines) < LOG_BATCH:
+            when, message, tag = self.log_queue.popleft()
+            timestamp = datetime.fromtimestamp(when).strftime("%H:%M:%S")
+            lines.append((f"[{timestamp}] {message}\n", tag))
+        if not lines:
+            return
+        self.log_lines.extend(lines)
+        if self.is_hidden:
+            # Oculta no se redibuja: se rehace al volver a mostrarla
+            self.log_stale = True
+            return
+        self.insert_log(lines)
+
+    def insert_log(self, lines):
+        """Añade las líneas que pasan el filtro y recorta a LOG_MAX_LINES"""
+        minimum = LOG_LEVELS[self.log_level]
+        args = []
+        for text, tag in lines:
+            if LOG_LEVELS.get(tag, 0) >= minimum:
+                args += (text, tag)
+        if not args:
+            return
         self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n", tag)
+        self.log_text.insert(tk.END, *args)
+        excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+        if excess > 0:
+            self.log_text.delete('1.0', f'{excess + 1}.0')
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
 
+    def redraw_log(self):
+        """Rehace el registro visible a partir de las últimas líneas guardadas"""
+        self.log_stale = False
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.delete('1.0', tk.END)
+        self.log_text.config(state=tk.DISABLED)
+        self.insert_log(self.log_lines)
+
+    def on_log_filter(self, event=None):
+        self.log_level = LOG_FILTERS[self.log_filter_var.get()]
+        self.redraw_log()
+        self.save_config()
+
     # === FUNCIONES KVM ===
 
     def toggle_kvm(self):
@@ -349,75 +561,170 @@ class ClipboardSyncGUI:
             self.kvm_enabled.set(False)
             return
 
-        if self.kvm_enabled.get():
-            # Activar KVM
-            self.start_kvm()
-        else:
-            # Desactivar KVM
-            self.stop_kvm()
+        # El servicio captura y reproduce los eventos; la casilla sigue su estado
+        self.send_command('kvm', enabled=self.kvm_enabled.get())
 
-    def start_kvm(self):
-        """Inicia el sistema KVM"""
-        try:
-            if self.kvm_sync is None:
-                self.kvm_sync = KVMSync(
-                    send_callback=self.send_kvm_event,
-                    log_callback=self.log
-                )
-
-            self.kvm_sync.start()
-            self.control_status_var.set("TIENES EL CONTROL (Ctrl+Alt+Shift+S para cambiar)")
-            self.log("KVM activado - Compartiendo mouse/teclado", "success")
-        except Exception as e:
-            self.log(f"Error iniciando KVM: {e}", "error")
-            self.kvm_enabled.set(False)
+    # === FIN FUNCIONES KVM ===
 
-    def stop_kvm(self):
-        """Detiene el sistema KVM"""
-        if self.kvm_sync:
-            self.kvm_sync.stop()
-            self.control_status_var.set("Sin control")
-            self.log("KVM desactivado", "info")
+    def pull_content(self):
+        """Descarga el contenido grande anunciado por el otro equipo"""
+        self.send_command('pull')
 
-    def send_kvm_event(self, event_data):
-        """Envia un evento KVM al dispositivo remoto"""
-        try:
-            # Crear un mensaje con protocolo
-            message = {
-                'protocol': 'kvm',
-                'data': event_data
-            }
-            msg_json = json.dumps(message)
-            msg_bytes = msg_json.encode('utf-8')
-            msg_size = len(msg_bytes).to_bytes(4, byteorder='big')
-
-            # Enviar segun el modo
-            if self.mode.get() == "server":
-                # Servidor: enviar a todos los clientes
-                for conn in self.connections[:]:
-                    try:
-                        conn.sendall(msg_size + msg_bytes)
-                    except:
-                        pass
-            else:
-                # Cliente: enviar al servidor
-                if self.client_socket:
-                    try:
-                        self.client_socket.sendall(msg_size + msg_bytes)
-                    except:
-                        pass
-        except Exception as e:
-            self.log(f"Error enviando evento KVM: {e}", "error")
+    # === SERVICIO ===
 
-    def handle_kvm_message(self, data):
-        """Maneja un mensaje KVM recibido"""
-        try:
-            if self.kvm_sync and self.kvm_enabled.get():
-                self.kvm_sync.handle_remote_event(data)
-        except Exception as e:
-            self.log(f"Error manejando mensaje KVM: {e}", "error")
+    def send_command(self, cmd, **fields):
+        """Envía una orden al servicio sin bloquear la interfaz"""
+        def send():
+            try:
+                self.daemon.request(cmd, **fields)
+            except (OSError, RuntimeError) as e:
+                self.log(f"Error del servicio: {e}", "error")
+        threading.Thread(target=send, daemon=True).start()
+
+    def follow_daemon(self):
+        """
+        Sigue el estado y el registro del servicio (hilo de fondo). Si el
+        servicio no está o se cae, lo vuelve a intentar periódicamente.
+        """
+        connected = False
+        while True:
+            try:
+                state, events = self.daemon.subscribe()
+            except OSError:
+                time.sleep(DAEMON_RETRY)
+                continue
+            if not connected:
+                # Registro anterior del servicio (p. ej. al reabrir la interfaz)
+                for event in state['logs']:
+                    self.log(event['message'], event['level'], event['time'])
+            connected = True
+            self.call_in_ui(self.apply_state, state)
+            try:
+                for event in events:
+                    if event['event'] == 'log':
+                        self.log(event['message'], event['level'], event['time'])
+                    elif event['event'] == 'status':
+                        self.call_in_ui(self.status_var.set, event['status'])
+                    elif event['event'] == 'state':
+                        self.call_in_ui(self.apply_state, event)
+            except (OSError, ValueError):
+                pass
+            self.log("Conexión con el servicio perdida", "warning")
+            self.call_in_ui(self.apply_state,
+                            {'running': False, 'kvm': False, 'status': "Servicio detenido"})
+
+    def apply_state(self, state):
+        """Refleja en la interfaz el estado del servicio"""
+        self.running = state['running']
+        self.status_var.set(state['status'])
+        self.kvm_enabled.set(state['kvm'])
+        self.control_status_var.set("TIENES EL CONTROL (Ctrl+Alt+Shift+S para cambiar)"
+                                    if state['kvm'] else "Sin control")
+        self.start_button.config(state=tk.DISABLED if self.running else tk.NORMAL)
+        self.stop_button.config(state=tk.NORMAL if self.running else tk.DISABLED)
+        self.pull_button.config(state=tk.NORMAL if self.running else tk.DISABLED)
+
+    # === HISTORIAL ===
+
+    def open_history(self):
+        """Abre el historial la primera vez que se necesita (None si falla)"""
+        if self.history is None:
+            from history_store import DEFAULT_HISTORY_PATH, HistoryStore
+            try:
+                self.history = HistoryStore(DEFAULT_HISTORY_PATH)
+            except Exception as e:
+                self.log(f"Error abriendo el historial: {e}", "error")
+        return self.history
 
-    # === FIN FUNCIONES KVM ===
+    def show_history(self):
+        """Ventana de búsqueda en el historial del portapapeles"""
+        if self.open_history() is None:
+            return
+        if self.history_window and self.history_window.winfo_exists():
+            self.history_window.lift()
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Historial del portapapeles")
+        window.geometry("600x400")
+        self.history_window = window
+
+        frame = ttk.Frame(window, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        search_var = tk.StringVar()
+        search_entry = ttk.Entry(frame, textvariable=search_var)
+        search_entry.pack(fill=tk.X, pady=(0, 5))
+        search_entry.focus_set()
+
+        listbox = tk.Listbox(frame, height=15, activestyle='none')
+        listbox.pack(fill=tk.BOTH, expand=True)
+
+        info_var = tk.StringVar()
+        ttk.Label(frame, textvariable=info_var, foreground="gray").pack(anchor=tk.W, pady=2)
+
+        entries = []
+        pending = [None]
+
+        def refresh():
+            pending[0] = None
+            try:
+                entries[:] = self.history.search(search_var.get(), limit=200)
+            except Exception as e:
+                info_var.set(f"Error buscando: {e}")
+                return
+            listbox.delete(0, tk.END)
+            for entry in entries:
+                when = datetime.fromtimestamp(entry.last_used).strftime("%d/%m %H:%M")
+                listbox.insert(tk.END, f"{when}  {' '.join(entry.preview.split())[:120]}")
+            stats = self.history.stats()
+            info_var.set(f"{len(entries)} resultado(s) de {stats['entries']} entradas")
+
+        def on_search(*args):
+            # Se busca al dejar de escribir, no con cada tecla
+            if pending[0]:
+                window.after_cancel(pending[0])
+            pending[0] = window.after(150, refresh)
+
+        def selected():
+            selection = listbox.curselection()
+            return entries[selection[0]] if selection else None
+
+        def copy_selected(event=None):
+            entry = selected()
+            if entry is None:
+                return
+            content = self.history.get(entry.id)
+            if content is None:
+                return
+            try:
+                if self.clipboard is None:
+                    from clipboard_backends import create_backend
+                    self.clipboard = create_backend()
+                self.clipboard.copy(content)
+                self.log(f"Copiado del historial ({len(content)} caracteres)", "success")
+            except Exception as e:
+                self.log(f"Error copiando del historial: {e}", "error")
+
+        def delete_selected():
+            entry = selected()
+            if entry is not None:
+                self.history.delete(entry.id)
+                refresh()
+
+        search_var.trace_add('write', on_search)
+        listbox.bind('<Double-Button-1>', copy_selected)
+        listbox.bind('<Return>', copy_selected)
+
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(buttons, text="Copiar", command=copy_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Eliminar", command=delete_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Cerrar", command=window.destroy).pack(side=tk.RIGHT, padx=5)
+
+        refresh()
+
+    # === FIN HISTORIAL ===
 
     def start_sync(self):
         """Inicia la sincronización"""
@@ -445,301 +752,38 @@ class ClipboardSyncGUI:
         # Guardar configuración
         self.save_config()
 
-        self.running = True
         self.start_button.config(state=tk.DISABLED)
-        self.stop_button.config(state=tk.NORMAL)
-
-        # Iniciar en hilo separado
-        if self.mode.get() == "server":
-            threading.Thread(target=self.run_server, daemon=True).start()
-        else:
-            threading.Thread(target=self.run_client, daemon=True).start()
-
-    def stop_sync(self):
-        """Detiene la sincronización"""
-        self.running = False
-        self.status_var.set("Deteniendo...")
-        self.log("Deteniendo sincronización...", "warning")
-
-        # Detener KVM si está activo
-        if self.kvm_enabled.get():
-            self.stop_kvm()
-            self.kvm_enabled.set(False)
-
-        # Cerrar conexiones
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-            except:
-                pass
-
-        if self.client_socket:
-            try:
-                self.client_socket.close()
-            except:
-                pass
-
-        for conn in self.connections[:]:
-            try:
-                conn.close()
-            except:
-                pass
-        self.connections.clear()
+        self.status_var.set("Iniciando...")
+        threading.Thread(target=self.request_start, args=(self.current_config(),),
+                         daemon=True).start()
 
+    def request_start(self, config):
+        """Lanza el servicio si hace falta y le pide iniciar (hilo de fondo)"""
+        try:
+            if not self.daemon.spawn(daemon_command()):
+                raise RuntimeError("No se pudo iniciar el servicio de sincronización")
+            self.daemon.request('start', config=config)
+        except (OSError, RuntimeError) as e:
+            self.call_in_ui(self.start_failed, str(e))
+
+    def start_failed(self, error):
+        """El servicio no pudo iniciar la sincronización"""
         self.start_button.config(state=tk.NORMAL)
-        self.stop_button.config(state=tk.DISABLED)
         self.status_var.set("Detenido")
-        self.log("Sincronización detenida", "info")
-
-    def monitor_clipboard(self, send_callback):
-        """Monitorea cambios en el portapapeles"""
-        self.log("Monitoreando portapapeles...", "info")
-        while self.running:
-            try:
-                current_clipboard = pyperclip.paste()
+        messagebox.showerror("Error", error)
 
-                if current_clipboard != self.last_clipboard and current_clipboard:
-                    self.log(f"Nuevo contenido detectado ({len(current_clipboard)} caracteres)", "success")
-                    self.last_clipboard = current_clipboard
-                    send_callback(current_clipboard)
-
-                time.sleep(0.5)
-            except Exception as e:
-                if self.running:
-                    self.log(f"Error monitoreando portapapeles: {e}", "error")
-                time.sleep(1)
-
-    def update_clipboard(self, content):
-        """Actualiza el portapapeles local"""
-        try:
-            if content != self.last_clipboard:
-                pyperclip.copy(content)
-                self.last_clipboard = content
-                self.log(f"Portapapeles actualizado ({len(content)} caracteres)", "success")
-        except Exception as e:
-            self.log(f"Error actualizando portapapeles: {e}", "error")
-
-    def handle_client(self, conn, addr):
-        """Maneja la conexión de un cliente"""
-        self.log(f"Cliente conectado desde {addr[0]}:{addr[1]}", "success")
-        self.connections.append(conn)
-        self.status_var.set(f"Servidor activo - {len(self.connections)} cliente(s)")
-
-        try:
-            while self.running:
-                size_data = conn.recv(4)
-                if not size_data:
-                    break
-
-                msg_size = int.from_bytes(size_data, byteorder='big')
-
-                data = b''
-                while len(data) < msg_size:
-                    packet = conn.recv(min(msg_size - len(data), 4096))
-                    if not packet:
-                        break
-                    data += packet
-
-                if data:
-                    content = data.decode('utf-8', errors='ignore')
-
-                    # Detectar tipo de mensaje
-                    try:
-                        message = json.loads(content)
-                        if isinstance(message, dict) and 'protocol' in message:
-                            # Mensaje con protocolo
-                            if message['protocol'] == 'kvm':
-                                self.handle_kvm_message(message['data'])
-                            elif message['protocol'] == 'clipboard':
-                                self.update_clipboard(message['data'])
-                        else:
-                            # Mensaje legacy (clipboard)
-                            self.update_clipboard(content)
-                    except json.JSONDecodeError:
-                        # No es JSON, asumir clipboard legacy
-                        self.update_clipboard(content)
-
-        except Exception as e:
-            if self.running:
-                self.log(f"Error con cliente {addr}: {e}", "error")
-        finally:
-            if conn in self.connections:
-                self.connections.remove(conn)
-            conn.close()
-            self.log(f"Cliente {addr[0]}:{addr[1]} desconectado", "warning")
-            self.status_var.set(f"Servidor activo - {len(self.connections)} cliente(s)")
-
-    def broadcast_to_clients(self, content):
-        """Envía contenido de clipboard a todos los clientes conectados"""
-        # Usar el nuevo protocolo
-        message = {
-            'protocol': 'clipboard',
-            'data': content
-        }
-        msg = json.dumps(message).encode('utf-8')
-        msg_size = len(msg).to_bytes(4, byteorder='big')
-
-        for conn in self.connections[:]:
-            try:
-                conn.sendall(msg_size + msg)
-            except Exception as e:
-                self.log(f"Error enviando a cliente: {e}", "error")
-                if conn in self.connections:
-                    self.connections.remove(conn)
-                conn.close()
-
-    def run_server(self):
-        """Ejecuta el modo servidor"""
-        try:
-            port = int(self.port_var.get())
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind(("0.0.0.0", port))
-            self.server_socket.listen(5)
-
-            self.log(f"Servidor escuchando en puerto {port}", "success")
-            self.status_var.set(f"Servidor activo - 0 clientes")
-
-            # Mostrar IP local
-            try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                s.connect(("8.8.8.8", 80))
-                local_ip = s.getsockname()[0]
-                s.close()
-                self.log(f"IP local: {local_ip}", "success")
-            except:
-                pass
-
-            # Iniciar monitoreo del portapapeles
-            clipboard_thread = threading.Thread(
-                target=self.monitor_clipboard,
-                args=(self.broadcast_to_clients,),
-                daemon=True
-            )
-            clipboard_thread.start()
-
-            # Aceptar conexiones
-            while self.running:
-                self.server_socket.settimeout(1.0)
-                try:
-                    conn, addr = self.server_socket.accept()
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(conn, addr),
-                        daemon=True
-                    )
-                    client_thread.start()
-                except socket.timeout:
-                    continue
-                except OSError:
-                    break
-
-        except Exception as e:
-            self.log(f"Error del servidor: {e}", "error")
-            self.status_var.set("Error")
-        finally:
-            if self.running:
-                self.stop_sync()
-
-    def send_to_server(self, content):
-        """Envía contenido de clipboard al servidor"""
-        if self.client_socket:
-            try:
-                # Usar el nuevo protocolo
-                message = {
-                    'protocol': 'clipboard',
-                    'data': content
-                }
-                msg = json.dumps(message).encode('utf-8')
-                msg_size = len(msg).to_bytes(4, byteorder='big')
-                self.client_socket.sendall(msg_size + msg)
-            except Exception as e:
-                self.log(f"Error enviando al servidor: {e}", "error")
-
-    def receive_from_server(self):
-        """Recibe contenido del servidor"""
-        try:
-            while self.running:
-                size_data = self.client_socket.recv(4)
-                if not size_data:
-                    break
-
-                msg_size = int.from_bytes(size_data, byteorder='big')
-
-                data = b''
-                while len(data) < msg_size:
-                    packet = self.client_socket.recv(min(msg_size - len(data), 4096))
-                    if not packet:
-                        break
-                    data += packet
-
-                if data:
-                    content = data.decode('utf-8', errors='ignore')
-
-                    # Detectar tipo de mensaje
-                    try:
-                        message = json.loads(content)
-                        if isinstance(message, dict) and 'protocol' in message:
-                            # Mensaje con protocolo
-                            if message['protocol'] == 'kvm':
-                                self.handle_kvm_message(message['data'])
-                            elif message['protocol'] == 'clipboard':
-                                self.update_clipboard(message['data'])
-                        else:
-                            # Mensaje legacy (clipboard)
-                            self.update_clipboard(content)
-                    except json.JSONDecodeError:
-                        # No es JSON, asumir clipboard legacy
-                        self.update_clipboard(content)
-
-        except Exception as e:
-            if self.running:
-                self.log(f"Error recibiendo del servidor: {e}", "error")
-        finally:
-            if self.running:
-                self.log("Conexión con servidor cerrada", "warning")
-                self.status_var.set("Desconectado")
-
-    def run_client(self):
-        """Ejecuta el modo cliente"""
-        try:
-            host = self.host_var.get()
-            port = int(self.port_var.get())
-
-            self.log(f"Conectando a {host}:{port}...", "info")
-            self.status_var.set("Conectando...")
-
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.connect((host, port))
-
-            self.log("Conectado al servidor", "success")
-            self.status_var.set("Conectado")
-
-            # Iniciar hilo para recibir del servidor
-            receive_thread = threading.Thread(target=self.receive_from_server, daemon=True)
-            receive_thread.start()
-
-            # Iniciar monitoreo del portapapeles
-            clipboard_thread = threading.Thread(
-                target=self.monitor_clipboard,
-                args=(self.send_to_server,),
-                daemon=True
-            )
-            clipboard_thread.start()
-
-            # Mantener el programa corriendo
-            while self.running:
-                time.sleep(1)
-
-        except Exception as e:
-            self.log(f"Error de conexión: {e}", "error")
-            self.status_var.set("Error de conexión")
-        finally:
-            if self.running:
-                self.stop_sync()
+    def stop_sync(self):
+        """Detiene la sincronización (el servicio sigue en marcha)"""
+        self.send_command('stop')
 
 
 def main():
+    # El ejecutable lanza su propio servicio con esta opción
+    if '--daemon' in sys.argv:
+        from daemon import run_daemon
+        control = sys.argv[sys.argv.index('--control') + 1] if '--control' in sys.argv else None
+        sys.exit(run_daemon(control))
+
     root = tk.Tk()
     app = ClipboardSyncGUI(root)
     root.mainloop()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Compression - Compresión negociada de los mensajes de portapapeles
+zlib y lzma siempre disponibles, zstd si está instalado (zstandard)
+"""
+
+import lzma
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Identificadores de códec: se guardan en los bits bajos de los flags de la trama
+CODEC_IDS = {'zlib': 1, 'lzma': 2, 'zstd': 3}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+# Por defecto solo se comprimen mensajes de al menos 1 KiB
+DEFAULT_THRESHOLD = 1024
+
+# Velocidad de enlace supuesta para estimar el tiempo ahorrado (Wi-Fi/VPN)
+DEFAULT_LINK_MBPS = 20.0
+
+
+def available_codecs():
+    """Códecs soportados por este equipo, en orden de preferencia"""
+    codecs = ['zlib', 'lzma']
+    if zstandard is not None:
+        codecs.insert(0, 'zstd')
+    return codecs
+
+
+def _compress(codec, data, level):
+    if codec == 'zlib':
+        return zlib.compress(data, 6 if level is None else level)
+    if codec == 'lzma':
+        return lzma.compress(data, preset=1 if level is None else level)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    raise ValueError(f"Códec desconocido: {codec}")
+
+
+def _decompress(codec, data, max_size):
+    if codec == 'zlib':
+        decompressor = zlib.decompressobj()
+        result = decompressor.decompress(data, max_size)
+        if decompressor.unconsumed_tail:
+            raise ValueError("Mensaje descomprimido demasiado grande")
+        return result
+    if codec == 'lzma':
+        decompressor = lzma.LZMADecompressor()
+        result = decompressor.decompress(data, max_size)
+        if not decompressor.eof:
+            raise ValueError("Mensaje descomprimido demasiado grande")
+        return result
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd no está instalado")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=max_size)
+    raise ValueError(f"Códec desconocido: {codec}")
+
+
+class CompressionStats:
+    """Acumula ratio de compresión y tiempo ahorrado estimado"""
+
+    def __init__(self, link_mbps=DEFAULT_LINK_MBPS):
+        self.link_bytes_per_s = link_mbps * 1000 * 1000 / 8
+        self.frames = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_time = 0.0
+        self.decompress_time = 0.0
+        self._lock = threading.Lock()
+
+    def record_compress(self, size_in, size_out, elapsed):
+        with self._lock:
+            self.frames += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+            self.compress_time += elapsed
+
+    def record_skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def record_decompress(self, elapsed):
+        with self._lock:
+            self.decompress_time += elapsed
+
+    @property
+    def ratio(self):
+        return self.bytes_in / self.bytes_out if self.bytes_out else 1.0
+
+    @property
+    def time_saved(self):
+        """Segundos de transferencia ahorrados menos el tiempo de CPU invertido"""
+        transfer_saved = (self.bytes_in - self.bytes_out) / self.link_bytes_per_s
+        return transfer_saved - self.compress_time - self.decompress_time
+
+    def summary(self):
+        return (f"{self.frames} mensajes comprimidos, {self.skipped} sin comprimir, "
+                f"{self.bytes_in} -> {self.bytes_out} bytes (ratio {self.ratio:.2f}x), "
+                f"CPU {self.compress_time * 1000:.0f} ms + "
+                f"{self.decompress_time * 1000:.0f} ms, "
+                f"tiempo ahorrado estimado {self.time_saved:.2f} s")
+
+
+class PayloadCompressor:
+    """
+    Comprime payloads por encima de un umbral con el mejor códec que
+    soporten ambos extremos. Si el resultado no es más pequeño, el
+    mensaje se envía sin comprimir.
+    """
+
+    def __init__(self, codec='auto', threshold=DEFAULT_THRESHOLD, level=None,
+                 link_mbps=DEFAULT_LINK_MBPS):
+        if codec not in ('auto', 'none') and codec not in available_codecs():
+            raise ValueError(f"Códec no disponible: {codec}")
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+        self.stats = CompressionStats(link_mbps)
+
+    def hello(self):
+        """Capacidades que este extremo anuncia al conectarse"""
+        return ','.join(available_codecs()).encode('ascii')
+
+    @staticmethod
+    def parse_hello(payload):
+        """Códecs anunciados por el otro extremo"""
+        return [name for name in bytes(payload).decode('ascii', 'ignore').split(',')
+                if name in CODEC_IDS]
+
+    def choose(self, peer_codecs):
+        """Códec a usar con un peer, o None si no hay ninguno común"""
+        if self.codec == 'none' or not peer_codecs:
+            return None
+        if self.codec != 'auto':
+            return self.codec if self.codec in peer_codecs else None
+        for name in available_codecs():
+            if name in peer_codecs:
+                return name
+        return None
+
+    def compress(self, payload, codec):
+        """Devuelve (flags, datos) listos para la trama"""
+        if codec is None or len(payload) < self.threshold:
+            return 0, payload
+        start = time.perf_counter()
+        compressed = _compress(codec, payload, self.level)
+        elapsed = time.perf_counter() - start
+        if len(compressed) >= len(payload):
+            self.stats.record_skip()
+            return 0, payload
+        self.stats.record_compress(len(payload), len(compressed), elapsed)
+        return CODEC_IDS[codec], compressed
+
+    def decompress(self, codec_id, payload, max_size):
+        """Descomprime un payload según el códec indicado en los flags"""
+        codec = CODEC_NAMES.get(codec_id)
+        if codec is None:
+            raise ValueError(f"Códec desconocido: {codec_id}")
+        start = time.perf_counter()
+        result = _decompress(codec, payload, max_size)
+        self.stats.record_decompress(time.perf_counter() - start)
+        return result
@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+"""
+Daemon - Motor de sincronización sin interfaz, controlado por un socket local
+El servicio es dueño de los sockets, el portapapeles y el KVM; la interfaz
+gráfica, el icono de la bandeja y la consola (ctl) solo le envían órdenes y
+reciben su estado y su registro. Cerrar o bloquear la interfaz no afecta a
+la sincronización.
+
+Protocolo de control: una línea JSON por mensaje. La primera lleva el
+secreto que el servicio escribe al arrancar en un fichero que solo puede
+leer el usuario ("token"). Cada petición ({"cmd": ...}) recibe una respuesta ({"ok": true, ...} o {"ok": false,
+"error": ...}); tras "subscribe" la conexión solo recibe eventos
+({"event": "log" | "status" | "state", ...}).
+"""
+
+import hmac
+import itertools
+import json
+import os
+import queue
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+from protocol import CHANNEL_KVM
+
+
+# Configuración compartida por la interfaz gráfica y el servicio
+DEFAULT_CONFIG_PATH = "clipboard_sync_config.json"
+
+# Sin sockets Unix (Windows antiguos) se escucha solo en loopback en este puerto
+DEFAULT_CONTROL_PORT = 5556
+
+# Líneas de registro que se guardan para quien se conecta más tarde
+LOG_HISTORY = 500
+
+# Eventos pendientes por suscriptor; si no lee, se descartan los nuevos
+SUBSCRIBER_QUEUE = 1000
+
+# Segundos que se espera a que arranque un servicio recién lanzado
+SPAWN_TIMEOUT = 10.0
+
+# Tamaño máximo de una línea de control
+MAX_LINE = 1024 * 1024
+
+# Líneas de registro por origen: ráfaga inicial y ritmo sostenido por segundo
+LOG_BURST = 20
+LOG_RATE = 5.0
+
+# Segundos entre resúmenes de las líneas descartadas por ese límite
+LOG_SUMMARY_INTERVAL = 5.0
+
+# Orígenes distintos que se siguen como máximo (al pasarse se empieza de cero)
+LOG_SOURCES = 256
+
+
+def default_control_path():
+    if not hasattr(socket, 'AF_UNIX'):
+        return str(DEFAULT_CONTROL_PORT)
+    user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    return os.path.join(tempfile.gettempdir(), f"clipboard_sync-{user}.sock")
+
+
+def control_address(control=None):
+    """
+    (familia, dirección) del socket de control: una ruta para un socket
+    Unix o un número de puerto de 127.0.0.1
+    """
+    control = control or default_control_path()
+    if control.isdigit() or not hasattr(socket, 'AF_UNIX'):
+        return socket.AF_INET, ('127.0.0.1', int(control))
+    return socket.AF_UNIX, control
+
+
+def control_token_path(control=None):
+    """Fichero con el secreto del socket de control"""
+    family, address = control_address(control)
+    if family == socket.AF_INET:
+        user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+        return os.path.join(tempfile.gettempdir(), f"clipboard_sync-{user}-{address[1]}.token")
+    return address + '.token'
+
+
+def write_control_token(path):
+    """
+    Genera un secreto nuevo y lo guarda en `path`, legible solo por el
+    usuario (en Windows el directorio temporal ya es del usuario)
+    """
+    token = secrets.token_hex(32)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    # O_EXCL: si otro usuario ha dejado un fichero con ese nombre, falla
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token
+
+
+def read_control_token(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def send_message(sock, message):
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def read_messages(sock):
+    """Mensajes JSON de una conexión, hasta que se cierra"""
+    reader = sock.makefile('rb')
+    for line in reader:
+        if len(line) > MAX_LINE:
+            raise ValueError("Línea de control demasiado larga")
+        if line.strip():
+            yield json.loads(line)
+
+
+def log_source(message):
+    """Origen de una línea de registro: el texto antes de los dos puntos"""
+    return message.split(':', 1)[0][:80]
+
+
+class LogLimiter:
+    """
+    Limita las líneas de registro de cada origen con un cubo de fichas, para
+    que un error que se repite en cada evento (p. ej. del KVM) no desplace al
+    resto del registro. Cuenta las descartadas para resumirlas después.
+    """
+
+    def __init__(self, burst=LOG_BURST, rate=LOG_RATE):
+        self.burst = burst
+        self.rate = rate
+        self.buckets = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def allow(self, message, level):
+        source = log_source(message)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(source)
+            if bucket is None:
+                if len(self.buckets) >= LOG_SOURCES:
+                    self.buckets.clear()
+                bucket = self.buckets[source] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return True
+            bucket[0] = tokens
+            key = (source, level)
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return False
+
+    def flush(self):
+        """Líneas de resumen [(mensaje, nivel)] de lo descartado desde la última vez"""
+        with self.lock:
+            suppressed, self.suppressed = self.suppressed, {}
+        return [(f"{source}: {count} mensajes parecidos omitidos", level)
+                for (source, level), count in suppressed.items()]
+
+
+class Subscriber:
+    """Conexión suscrita a los eventos, con su propia cola e hilo de envío"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.queue = queue.Queue(SUBSCRIBER_QUEUE)
+        self.dropped = 0
+        self.closed = False
+        threading.Thread(target=self.write_loop, daemon=True, name="daemon-subscriber").start()
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Una interfaz bloqueada no frena al motor: pierde eventos
+            self.dropped += 1
+
+    def write_loop(self):
+        try:
+            while not self.closed:
+                event = self.queue.get()
+                if event is None:
+                    break
+                send_message(self.conn, event)
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            # Despierta al hilo de envío
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            self.conn.close()
+        except:
+            pass
+
+
+class SyncDaemon:
+    """
+    Servicio de sincronización. Guarda la configuración con la que se
+    arrancó el motor, el último estado y las últimas líneas de registro,
+    para que una interfaz que se conecta tarde vea lo mismo que las demás.
+    """
+
+    def __init__(self, control=None):
+        self.family, self.address = control_address(control)
+        self.token_path = control_token_path(control)
+        self.token = None
+        self.sync = None
+        self.config = {}
+        self.status = "Detenido"
+        self.logs = deque(maxlen=LOG_HISTORY)
+        self.log_limiter = LogLimiter()
+        self.log_summary_timer = None
+        self.subscribers = []
+        self.kvm_sync = None
+        self.kvm_enabled = False
+        # Se crean una vez y se reutilizan en cada arranque del motor
+        self.clipboard = None
+        self.history = None
+        self.metrics_server = None
+        self.server_socket = None
+        self.shutdown_event = threading.Event()
+        self.lock = threading.RLock()
+
+    # === EVENTOS ===
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = [s for s in self.subscribers if not s.closed]
+            self.subscribers = subscribers
+        for subscriber in subscribers:
+            subscriber.push(event)
+
+    def log(self, message, level="info"):
+        if not self.log_limiter.allow(message, level):
+            self.schedule_log_summary()
+            return
+        self.emit_log(message, level)
+
+    def emit_log(self, message, level):
+        entry = {'event': 'log', 'time': time.time(), 'message': message, 'level': level}
+        self.logs.append(entry)
+        self.publish(entry)
+
+    def schedule_log_summary(self):
+        with self.lock:
+            if self.log_summary_timer is not None:
+                return
+            self.log_summary_timer = threading.Timer(LOG_SUMMARY_INTERVAL, self.log_summary)
+            self.log_summary_timer.daemon = True
+            self.log_summary_timer.start()
+
+    def log_summary(self):
+        with self.lock:
+            self.log_summary_timer = None
+        for message, level in self.log_limiter.flush():
+            self.emit_log(message, level)
+
+    def set_status(self, status):
+        self.status = status
+        self.publish({'event': 'status', 'status': status})
+
+    def state(self):
+        return {
+            'running': self.sync is not None,
+            'kvm': self.kvm_enabled,
+            'status': self.status,
+            'config': self.config,
+        }
+
+    def publish_state(self):
+        self.publish(dict(self.state(), event='state'))
+
+    # === MOTOR ===
+
+    def open_history(self):
+        if self.history is None:
+            from history_store import DEFAULT_HISTORY_PATH, HistoryStore
+            try:
+                self.history = HistoryStore(DEFAULT_HISTORY_PATH)
+            except Exception as e:
+                self.log(f"Error abriendo el historial: {e}", "error")
+        return self.history
+
+    def start_sync(self, config):
+        """Arranca el motor con la configuración de la interfaz"""
+        # El motor se carga al arrancarlo: la interfaz importa este módulo
+        # solo por DaemonClient y no debe pagar su importación
+        from clipboard_backends import create_backend
+        from clipboard_sync import ClipboardSync
+        from metrics import start_metrics_server
+
+        with self.lock:
+            if self.sync is not None:
+                raise RuntimeError("La sincronización ya está activa")
+            mode = config.get('mode', 'server')
+            port = int(config.get('port') or 0)
+            if not 1 <= port <= 65535:
+                raise ValueError("Puerto inválido. Debe ser un número entre 1 y 65535.")
+            host = config.get('host') if mode == 'client' else '0.0.0.0'
+            if not host:
+                raise ValueError("Debes ingresar la IP del servidor.")
+
+            metrics_port = config.get('metrics_port')
+            if metrics_port and self.metrics_server is None:
+                try:
+                    self.metrics_server = start_metrics_server(metrics_port)
+                    self.log(f"Métricas en http://127.0.0.1:{metrics_port}/metrics", "info")
+                except OSError as e:
+                    self.log(f"No se pudo abrir el endpoint de métricas: {e}", "error")
+
+            if self.clipboard is None:
+                try:
+                    self.clipboard = create_backend(log_callback=self.log)
+                except Exception as e:
+                    raise RuntimeError(f"No se pudo acceder al portapapeles: {e}")
+
+            lazy_mb = config.get('lazy_mb')
+            sync = ClipboardSync(
+                mode,
+                host,
+                port,
+                backend=self.clipboard,
+                history=self.open_history(),
+                lazy_threshold=int(lazy_mb * 1024 * 1024) if lazy_mb else None,
+                relay=config.get('relay', False),
+                log_callback=self.log,
+                status_callback=self.set_status
+            )
+            sync.handlers[CHANNEL_KVM] = self.handle_kvm_message
+            self.sync = sync
+            self.config = dict(config)
+
+        threading.Thread(target=self.run_sync, args=(sync,), daemon=True).start()
+        self.publish_state()
+
+    def run_sync(self, sync):
+        """Ejecuta el motor en modo servidor o cliente (hilo de fondo)"""
+        try:
+            if sync.mode == "server":
+                sync.run_server()
+            else:
+                sync.run_client()
+        except Exception as e:
+            self.log(f"Error del servidor: {e}", "error")
+            self.set_status("Error")
+        finally:
+            if sync is self.sync:
+                self.stop_sync()
+
+    def stop_sync(self):
+        with self.lock:
+            sync, self.sync = self.sync, None
+        if sync is None:
+            return
+        self.set_status("Deteniendo...")
+        self.log("Deteniendo sincronización...", "warning")
+        self.set_kvm(False)
+        sync.stop()
+        self.set_status("Detenido")
+        self.log("Sincronización detenida", "info")
+        self.publish_state()
+
+    # === KVM ===
+
+    def set_kvm(self, enabled):
+        """Activa o desactiva el KVM (pynput solo se carga al activarlo)"""
+        try:
+            if enabled:
+                if self.sync is None:
+                    raise RuntimeError("Debes iniciar la sincronizacion primero antes de activar KVM.")
+                if self.kvm_sync is None:
+                    from kvm_sync import DEFAULT_MOVE_RATE, KVMSync
+                    self.kvm_sync = KVMSync(
+                        send_callback=self.send_kvm_event,
+                        log_callback=self.log,
+                        move_rate=self.config.get('kvm_move_rate') or DEFAULT_MOVE_RATE
+                    )
+                self.kvm_sync.start()
+                self.kvm_enabled = True
+                self.log("KVM activado - Compartiendo mouse/teclado", "success")
+            elif self.kvm_enabled:
+                self.kvm_sync.stop()
+                self.kvm_enabled = False
+                self.log("KVM desactivado", "info")
+        finally:
+            # También si falla: la interfaz vuelve a mostrar el estado real
+            self.publish_state()
+
+    def send_kvm_event(self, event_data):
+        """Envia un evento KVM al dispositivo remoto por el canal KVM"""
+        try:
+            # Servidor: a todos los clientes; cliente: al servidor
+            sync = self.sync
+            if sync:
+                sync.send_channel(CHANNEL_KVM, event_data)
+        except Exception as e:
+            self.log(f"Error enviando evento KVM: {e}", "error")
+
+    def handle_kvm_message(self, data, peer=None):
+        """Maneja una trama KVM recibida"""
+        try:
+            if self.kvm_sync and self.kvm_enabled:
+                self.kvm_sync.handle_remote_event(data)
+                self.sync.observe_kvm(data, peer)
+        except Exception as e:
+            self.log(f"Error manejando mensaje KVM: {e}", "error")
+
+    # === CONTROL ===
+
+    def handle_command(self, request):
+        """Ejecuta una orden. Devuelve los campos de la respuesta"""
+        cmd = request.get('cmd')
+        if cmd == 'status':
+            state = self.state()
+            sync = self.sync
+            if sync:
+                state['peers'] = sync.peer_stats()
+            return state
+        if cmd == 'start':
+            self.start_sync(request.get('config') or {})
+            return {}
+        if cmd == 'stop':
+            self.stop_sync()
+            return {}
+        if cmd == 'pull':
+            sync = self.sync
+            return {'pulled': bool(sync and sync.pull())}
+        if cmd == 'stats':
+            sync = self.sync
+            if sync:
+                sync.print_stats()
+            return {}
+        if cmd == 'kvm':
+            self.set_kvm(bool(request.get('enabled')))
+            return {}
+        if cmd == 'shutdown':
+            self.shutdown_event.set()
+            return {}
+        raise ValueError(f"Orden desconocida: {cmd}")
+
+    def authorized(self, request):
+        token = request.get('token')
+        return isinstance(token, str) and hmac.compare_digest(token, self.token)
+
+    def handle_connection(self, conn):
+        try:
+            messages = read_messages(conn)
+            first = next(messages, None)
+            if first is None:
+                conn.close()
+                return
+            if not self.authorized(first):
+                # En loopback cualquier usuario del equipo puede conectarse
+                send_message(conn, {'ok': False, 'error': "Token de control no válido"})
+                conn.close()
+                return
+            for request in itertools.chain([first], messages):
+                if request.get('cmd') == 'subscribe':
+                    # Estado y registro reciente; después, solo eventos
+                    send_message(conn, dict(self.state(), ok=True, logs=list(self.logs)))
+                    with self.lock:
+                        self.subscribers.append(Subscriber(conn))
+                    return
+                try:
+                    reply = dict(self.handle_command(request), ok=True)
+                except Exception as e:
+                    reply = {'ok': False, 'error': str(e)}
+                send_message(conn, reply)
+        except (OSError, ValueError):
+            pass
+        conn.close()
+
+    def listen(self):
+        """Abre el socket de control. Falla si ya hay otro servicio escuchando"""
+        if self.family == getattr(socket, 'AF_UNIX', None) and os.path.exists(self.address):
+            try:
+                probe = socket.socket(self.family, socket.SOCK_STREAM)
+                probe.connect(self.address)
+                probe.close()
+                raise OSError(f"Ya hay un servicio escuchando en {self.address}")
+            except ConnectionRefusedError:
+                # Socket de un servicio anterior que terminó sin borrarlo
+                os.unlink(self.address)
+
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_UNIX:
+            # Solo el usuario puede controlar el servicio
+            old_umask = os.umask(0o177)
+            try:
+                sock.bind(self.address)
+            finally:
+                os.umask(old_umask)
+        else:
+            sock.bind(self.address)
+        try:
+            self.token = write_control_token(self.token_path)
+        except OSError:
+            sock.close()
+            raise
+        sock.listen(8)
+        self.server_socket = sock
+
+    def serve(self):
+        """Atiende conexiones de control hasta recibir 'shutdown'"""
+        def accept_loop():
+            while not self.shutdown_event.is_set():
+                try:
+                    conn, _ = self.server_socket.accept()
+                except OSError:
+                    break
+                threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+
+        threading.Thread(target=accept_loop, daemon=True, name="daemon-control").start()
+        try:
+            while not self.shutdown_event.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self.stop_sync()
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for subscriber in subscribers:
+            subscriber.close()
+        if self.server_socket:
+            self.server_socket.close()
+            if self.family == getattr(socket, 'AF_UNIX', None):
+                try:
+                    os.unlink(self.address)
+                except OSError:
+                    pass
+            try:
+                os.unlink(self.token_path)
+            except OSError:
+                pass
+        if self.history:
+            self.history.close()
+
+
+def run_daemon(control=None, config=None):
+    """Servicio en primer plano; `config` arranca la sincronización al empezar"""
+    daemon = SyncDaemon(control)
+    try:
+        daemon.listen()
+    except OSError as e:
+        print(f"[!] {e}")
+        return 1
+    print(f"[*] Servicio escuchando en {daemon.address}")
+    if config:
+        try:
+            daemon.start_sync(config)
+        except Exception as e:
+            print(f"[!] No se pudo iniciar la sincronización: {e}")
+    daemon.serve()
+    return 0
+
+
+# === CLIENTE ===
+
+class DaemonClient:
+    """Acceso al servicio desde la interfaz o la consola"""
+
+    def __init__(self, control=None):
+        self.control = control
+        self.family, self.address = control_address(control)
+        self.token_path = control_token_path(control)
+
+    def connect(self, timeout=5.0):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.address)
+        except:
+            sock.close()
+            raise
+        return sock
+
+    def request(self, cmd, **fields):
+        """Envía una orden y devuelve la respuesta. Lanza RuntimeError si falla"""
+        with self.connect() as sock:
+            # El secreto se lee en cada conexión: el servicio puede haberse reiniciado
+            send_message(sock, dict(fields, cmd=cmd, token=read_control_token(self.token_path)))
+            for reply in read_messages(sock):
+                if not reply.get('ok'):
+                    raise RuntimeError(reply.get('error', 'error desconocido'))
+                return reply
+        raise ConnectionError("El servicio cerró la conexión")
+
+    def available(self):
+        try:
+            self.request('status')
+            return True
+        except (OSError, RuntimeError):
+            return False
+
+    def subscribe(self):
+        """
+        Se suscribe a los eventos. Devuelve (estado inicial con el registro
+        reciente, iterador de eventos hasta que se cierre la conexión).
+        Lanza ConnectionError si el servicio cierra sin responder o rechaza
+        la suscripción (p. ej. aún no ha escrito su token)
+        """
+        sock = self.connect()
+        try:
+            sock.settimeout(None)
+            send_message(sock, {'cmd': 'subscribe', 'token': read_control_token(self.token_path)})
+            messages = read_messages(sock)
+            try:
+                reply = next(messages, None)
+            except ValueError as e:
+                raise ConnectionError(f"Respuesta no válida del servicio: {e}")
+            if reply is None:
+                raise ConnectionError("El servicio cerró la conexión")
+            if reply.get('ok') is False:
+                raise ConnectionError(reply.get('error', 'error desconocido'))
+        except:
+            sock.close()
+            raise
+        return reply, messages
+
+    def spawn(self, command):
+        """
+        Lanza el servicio en segundo plano con `command` si no responde y
+        espera a que lo haga. Devuelve True si está disponible.
+        """
+        if self.available():
+            return True
+        if self.control:
+            command = command + ['--control', self.control]
+        options = {}
+        if sys.platform == 'win32':
+            options['creationflags'] = subprocess.CREATE_NO_WINDOW
+        else:
+            options['start_new_session'] = True
+        subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, **options)
+        deadline = time.monotonic() + SPAWN_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.available():
+                return True
+            time.sleep(0.1)
+        return False
+
+
+def daemon_command():
+    """Orden para lanzar el servicio desde este mismo programa"""
+    if getattr(sys, 'frozen', False):
+        # Ejecutable: el propio ejecutable de la interfaz arranca el servicio
+        return [sys.executable, '--daemon']
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clipboard_sync.py')
+    return [sys.executable, script, 'daemon']
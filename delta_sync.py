@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Delta Sync - Envío diferencial de contenidos grandes que cambian poco
+Ambos extremos guardan el último contenido (la base); el emisor manda solo
+los bloques nuevos e instrucciones para copiar el resto de la base
+"""
+
+import hashlib
+import struct
+import threading
+
+from protocol import (CLIPBOARD_META, DIGEST_SIZE, ORIGIN_SIZE, ClipboardMessage,
+                      ContentDigest)
+
+
+# Tipo de mensaje del canal de deltas
+DELTA_PATCH = 1   # CLIPBOARD_META del contenido nuevo + base + operaciones
+DELTA_NACK = 2    # el receptor no tiene la base: pide el contenido completo
+
+DELTA_KIND = struct.Struct('>B')
+DELTA_BASE = struct.Struct('>16sQ')                    # hash y tamaño de la base
+DELTA_NACK_FORMAT = struct.Struct(f'>{ORIGIN_SIZE}sQ')  # origen e id del mensaje
+
+# Operaciones: copiar (offset, longitud) de la base o insertar bytes literales
+OP_COPY = 1
+OP_LITERAL = 2
+COPY_OP = struct.Struct('>BQQ')
+LITERAL_OP = struct.Struct('>BQ')
+
+# Tamaño máximo de bloque: las líneas más largas se cortan en trozos fijos
+DEFAULT_BLOCK_SIZE = 4096
+
+# Los contenidos menores se envían completos (el delta no compensa)
+MIN_DELTA_SIZE = 64 * 1024
+
+# Se manda el delta solo si ocupa como mucho esta fracción del contenido
+MAX_DELTA_RATIO = 0.5
+
+# Tamaño máximo de la base que se guarda en memoria
+MAX_BASE_SIZE = 64 * 1024 * 1024
+
+
+class DeltaBaseMismatch(Exception):
+    """El receptor no tiene la base del delta; hay que pedir el contenido completo"""
+
+    def __init__(self, origin, msg_id):
+        super().__init__("Base del delta desconocida")
+        self.origin = origin
+        self.msg_id = msg_id
+
+
+def iter_blocks(data, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Bloques definidos por el contenido: una línea por bloque (los finales
+    de línea resincronizan tras una inserción sin calcular un hash rodante
+    byte a byte en Python), y las líneas largas en trozos de block_size.
+    """
+    for line in bytes(data).splitlines(keepends=True):
+        if len(line) <= block_size:
+            yield line
+        else:
+            for start in range(0, len(line), block_size):
+                yield line[start:start + block_size]
+
+
+def make_delta(base, target, block_size=DEFAULT_BLOCK_SIZE, max_literal=None):
+    """
+    Calcula las operaciones que convierten `base` en `target` usando un
+    índice bloque -> offset de la base. Los bloques que no están en la base
+    van como literales. Devuelve una lista de (OP_COPY, offset, longitud) y
+    (OP_LITERAL, bytes), o None si los literales superan max_literal.
+    """
+    index = {}
+    offset = 0
+    for block in iter_blocks(base, block_size):
+        index.setdefault(block, offset)
+        offset += len(block)
+
+    ops = []
+    literal = []
+    literal_size = 0
+    copy_offset = copy_length = 0
+
+    for block in iter_blocks(target, block_size):
+        src = index.get(block)
+        if src is None:
+            if copy_length:
+                ops.append((OP_COPY, copy_offset, copy_length))
+                copy_length = 0
+            literal.append(block)
+            literal_size += len(block)
+            if max_literal is not None and literal_size > max_literal:
+                return None
+            continue
+
+        if literal:
+            ops.append((OP_LITERAL, b''.join(literal)))
+            literal = []
+        # Bloques consecutivos en la base se funden en una sola copia
+        if copy_length and copy_offset + copy_length == src:
+            copy_length += len(block)
+        else:
+            if copy_length:
+                ops.append((OP_COPY, copy_offset, copy_length))
+            copy_offset, copy_length = src, len(block)
+
+    if copy_length:
+        ops.append((OP_COPY, copy_offset, copy_length))
+    if literal:
+        ops.append((OP_LITERAL, b''.join(literal)))
+    return ops
+
+
+def encode_ops(ops):
+    parts = []
+    for op in ops:
+        if op[0] == OP_COPY:
+            parts.append(COPY_OP.pack(*op))
+        else:
+            parts.append(LITERAL_OP.pack(OP_LITERAL, len(op[1])))
+            parts.append(op[1])
+    return b''.join(parts)
+
+
+def apply_ops(base, ops_payload, size):
+    """Reconstruye el contenido aplicando las operaciones sobre la base"""
+    result = bytearray(size)
+    base = memoryview(base)
+    ops = memoryview(ops_payload)
+    pos = 0
+    out = 0
+    while pos < len(ops):
+        kind = ops[pos]
+        if kind == OP_COPY:
+            _, offset, length = COPY_OP.unpack_from(ops, pos)
+            pos += COPY_OP.size
+            if offset + length > len(base):
+                raise ValueError("Copia fuera de la base")
+            chunk = base[offset:offset + length]
+        elif kind == OP_LITERAL:
+            _, length = LITERAL_OP.unpack_from(ops, pos)
+            pos += LITERAL_OP.size
+            chunk = ops[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f"Operación de delta desconocida: {kind}")
+        if out + len(chunk) > size:
+            raise ValueError("El delta excede el tamaño anunciado")
+        result[out:out + len(chunk)] = chunk
+        out += len(chunk)
+    if out != size:
+        raise ValueError(f"Delta incompleto: {out} != {size}")
+    return result
+
+
+class DeltaStats:
+    """Deltas enviados, bytes ahorrados y envíos completos por falta de base"""
+
+    def __init__(self):
+        self.deltas = 0
+        self.fallbacks = 0
+        self.bytes_full = 0
+        self.bytes_delta = 0
+        self.nacks = 0
+        self._lock = threading.Lock()
+
+    def record_delta(self, full_size, delta_size):
+        with self._lock:
+            self.deltas += 1
+            self.bytes_full += full_size
+            self.bytes_delta += delta_size
+
+    def record_fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+
+    def record_nack(self):
+        with self._lock:
+            self.nacks += 1
+
+    def summary(self):
+        return (f"{self.deltas} deltas ({self.bytes_full} -> {self.bytes_delta} bytes, "
+                f"{self.bytes_full - self.bytes_delta} ahorrados), "
+                f"{self.fallbacks} envíos completos, {self.nacks} bases desconocidas")
+
+
+class DeltaSync:
+    """
+    Base compartida y codificación de deltas.
+
+    La base es el último contenido conocido en este extremo, local o
+    recibido. encode() calcula el delta de un mensaje local respecto a ella
+    y apply() reconstruye un mensaje recibido; si la base del otro extremo
+    no coincide se lanza DeltaBaseMismatch para pedir el envío completo.
+    """
+
+    def __init__(self, enabled=True, block_size=DEFAULT_BLOCK_SIZE,
+                 min_size=MIN_DELTA_SIZE, max_ratio=MAX_DELTA_RATIO,
+                 max_base_size=MAX_BASE_SIZE):
+        self.enabled = enabled
+        self.block_size = block_size
+        self.min_size = min_size
+        self.max_ratio = max_ratio
+        self.max_base_size = max_base_size
+        self.base = None
+        self.stats = DeltaStats()
+        self._lock = threading.Lock()
+
+    def remember(self, message):
+        """Pasa a usar `message` como base (si su tamaño lo justifica)"""
+        if not self.enabled:
+            return
+        size = len(message.data)
+        if self.min_size <= size <= self.max_base_size:
+            base = message._replace(data=bytes(message.data))
+        else:
+            base = None
+        with self._lock:
+            self.base = base
+
+    def encode(self, message):
+        """
+        Payload de delta para un mensaje local, o None si hay que enviarlo
+        completo. El mensaje pasa a ser la base en cualquier caso.
+        """
+        with self._lock:
+            base = self.base
+        self.remember(message)
+        if base is None or len(message.data) < self.min_size:
+            return None
+
+        size = len(message.data)
+        ops = make_delta(base.data, message.data, self.block_size,
+                         max_literal=int(size * self.max_ratio))
+        if ops is None:
+            self.stats.record_fallback()
+            return None
+
+        payload = b''.join((
+            DELTA_KIND.pack(DELTA_PATCH),
+            CLIPBOARD_META.pack(message.origin, message.msg_id,
+                                message.digest.hash, message.digest.size),
+            DELTA_BASE.pack(base.digest.hash, base.digest.size),
+            encode_ops(ops),
+        ))
+        if len(payload) > size * self.max_ratio:
+            self.stats.record_fallback()
+            return None
+        self.stats.record_delta(size, len(payload))
+        return payload
+
+    def apply(self, payload):
+        """Reconstruye el ClipboardMessage de un payload DELTA_PATCH"""
+        pos = DELTA_KIND.size
+        origin, msg_id, digest_hash, size = CLIPBOARD_META.unpack_from(payload, pos)
+        pos += CLIPBOARD_META.size
+        base_hash, base_size = DELTA_BASE.unpack_from(payload, pos)
+        pos += DELTA_BASE.size
+
+        with self._lock:
+            base = self.base
+        if base is None or base.digest != ContentDigest(base_hash, base_size):
+            self.stats.record_nack()
+            raise DeltaBaseMismatch(origin, msg_id)
+        if size > self.max_base_size:
+            # El tamaño lo dice el otro extremo: no se reserva sin límite.
+            # Con el NACK lo manda completo (por trozos, con su propio límite)
+            self.stats.record_nack()
+            raise DeltaBaseMismatch(origin, msg_id)
+
+        data = apply_ops(base.data, memoryview(payload)[pos:], size)
+        if hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest() != digest_hash:
+            raise ValueError("El contenido reconstruido no coincide con su digest")
+        return ClipboardMessage(origin, msg_id, ContentDigest(digest_hash, size), data)
+
+    @staticmethod
+    def nack(error):
+        """Payload DELTA_NACK para un DeltaBaseMismatch"""
+        return DELTA_KIND.pack(DELTA_NACK) + DELTA_NACK_FORMAT.pack(error.origin, error.msg_id)
+
+    @staticmethod
+    def parse_nack(payload):
+        """(origen, id) del mensaje que el otro extremo pide completo"""
+        return DELTA_NACK_FORMAT.unpack_from(payload, DELTA_KIND.size)
+
+    def last_message(self):
+        with self._lock:
+            return self.base
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Heartbeat - Latidos de aplicación, RTT y detección de peers caídos
+Cada extremo envía un latido periódico a sus peers y mide el tiempo de ida
+y vuelta con la respuesta; un peer del que no llega nada durante varios
+intervalos se da por caído aunque el socket siga abierto. La respuesta
+lleva además el reloj del peer, para estimar la diferencia entre relojes,
+y el mismo canal confirma los contenidos aplicados (latencia de extremo a
+extremo)
+"""
+
+import struct
+import threading
+import time
+from collections import deque
+
+from protocol import ORIGIN_SIZE
+
+
+# Tipo de latido: la respuesta devuelve el número y el instante del original
+HEARTBEAT_PING = 1
+HEARTBEAT_PONG = 2
+HEARTBEAT_APPLIED = 3   # confirmación de un contenido aplicado: origen, id
+
+HEARTBEAT_KIND = struct.Struct('>B')
+
+# tipo, número de latido, instante de envío (perf_counter_ns del emisor) y,
+# en la respuesta, la hora del que responde (time_ns, 0 en el latido)
+HEARTBEAT = struct.Struct('>BQQq')
+APPLIED = struct.Struct(f'>B{ORIGIN_SIZE}sQ')
+
+# Segundos entre latidos (0 = desactivados) e intervalos sin recibir nada
+# antes de dar al peer por caído
+DEFAULT_HEARTBEAT_INTERVAL = 5.0
+DEFAULT_HEARTBEAT_MISSES = 3
+
+# Muestras de RTT que se guardan por peer
+RTT_WINDOW = 32
+
+
+def encode_heartbeat(kind, seq, sent_ns, wall_ns=0):
+    return HEARTBEAT.pack(kind, seq, sent_ns, wall_ns)
+
+
+def decode_heartbeat(payload):
+    """(tipo, número, instante de envío en ns, hora del que responde en ns)"""
+    return HEARTBEAT.unpack_from(payload)
+
+
+def encode_applied(origin, msg_id):
+    return APPLIED.pack(HEARTBEAT_APPLIED, origin, msg_id)
+
+
+def decode_applied(payload):
+    """(origen, id) del mensaje aplicado"""
+    return APPLIED.unpack_from(payload)[1:]
+
+
+class PeerHeartbeat:
+    """
+    Actividad y RTT de un peer: ventana de muestras, jitter suavizado y
+    diferencia de relojes medida con la muestra de menor RTT (la que menos
+    error tiene, como en NTP)
+    """
+
+    def __init__(self):
+        self.last_activity = time.monotonic()
+        self.next_seq = 0
+        self.sent = 0
+        self.answered = 0
+        self.samples = deque(maxlen=RTT_WINDOW)
+        self.offsets = deque(maxlen=RTT_WINDOW)
+        self.jitter = 0.0
+
+    def record_rtt(self, rtt, offset_ns):
+        # Jitter como en RFC 3550: variación entre muestras seguidas, suavizada
+        if self.samples:
+            self.jitter += (abs(rtt - self.samples[-1]) - self.jitter) / 16
+        self.samples.append(rtt)
+        self.offsets.append(offset_ns)
+        self.answered += 1
+
+    def clock_offset(self):
+        """Reloj del peer menos el propio, en ns (None sin muestras)"""
+        if not self.samples:
+            return None
+        best = min(range(len(self.samples)), key=self.samples.__getitem__)
+        return self.offsets[best]
+
+    def stats(self):
+        """RTT de la ventana y jitter, en milisegundos"""
+        samples = self.samples
+        return {
+            'sent': self.sent,
+            'answered': self.answered,
+            'last_rtt_ms': samples[-1] * 1000 if samples else 0.0,
+            'avg_rtt_ms': sum(samples) / len(samples) * 1000 if samples else 0.0,
+            'min_rtt_ms': min(samples) * 1000 if samples else 0.0,
+            'max_rtt_ms': max(samples) * 1000 if samples else 0.0,
+            'jitter_ms': self.jitter * 1000,
+        }
+
+
+class HeartbeatMonitor:
+    """
+    Estado de los latidos de todos los peers.
+
+    Cualquier trama recibida cuenta como actividad. Solo se expulsa a los
+    peers que ya respondieron algún latido: uno de una versión anterior,
+    que no los conoce, no se desconecta por estar callado.
+    """
+
+    def __init__(self, interval=DEFAULT_HEARTBEAT_INTERVAL, misses=DEFAULT_HEARTBEAT_MISSES):
+        self.interval = interval
+        self.misses = misses
+        self.peers = {}
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.interval)
+
+    def _peer(self, peer):
+        state = self.peers.get(peer)
+        if state is None:
+            state = self.peers[peer] = PeerHeartbeat()
+        return state
+
+    def activity(self, peer):
+        """Se recibió algo de `peer`"""
+        with self._lock:
+            self._peer(peer).last_activity = time.monotonic()
+
+    def ping(self, peer):
+        """Payload del siguiente latido para `peer`"""
+        with self._lock:
+            state = self._peer(peer)
+            state.next_seq += 1
+            state.sent += 1
+            return encode_heartbeat(HEARTBEAT_PING, state.next_seq, time.perf_counter_ns())
+
+    def pong(self, peer, sent_ns, wall_ns):
+        """Registra una respuesta. Devuelve el RTT en segundos"""
+        rtt_ns = time.perf_counter_ns() - sent_ns
+        # El peer respondió, aproximadamente, a mitad del viaje de ida y vuelta
+        offset_ns = wall_ns - (time.time_ns() - rtt_ns // 2) if wall_ns else 0
+        with self._lock:
+            self._peer(peer).record_rtt(rtt_ns / 1e9, offset_ns)
+        return rtt_ns / 1e9
+
+    def clock_offset(self, peer):
+        """Reloj de `peer` menos el propio, en ns, o None si no se conoce"""
+        with self._lock:
+            state = self.peers.get(peer)
+            return state.clock_offset() if state else None
+
+    def rtt(self, peer):
+        """RTT medio de `peer` en segundos (0 si no hay muestras)"""
+        with self._lock:
+            state = self.peers.get(peer)
+            if not state or not state.samples:
+                return 0.0
+            return sum(state.samples) / len(state.samples)
+
+    def expired(self, peer):
+        """True si `peer` respondió latidos antes y lleva `misses` intervalos callado"""
+        with self._lock:
+            state = self._peer(peer)
+            silent = time.monotonic() - state.last_activity
+            if state.answered and silent > self.interval * self.misses:
+                self.evicted += 1
+                return True
+            return False
+
+    def forget(self, peer):
+        with self._lock:
+            self.peers.pop(peer, None)
+
+    def stats(self, peer):
+        with self._lock:
+            state = self.peers.get(peer)
+            return state.stats() if state else None
+
+    def average_rtt(self):
+        """RTT medio y jitter medio (ms) de los peers con muestras, o None"""
+        with self._lock:
+            measured = [state.stats() for state in self.peers.values() if state.samples]
+        if not measured:
+            return None
+        return (sum(stats['avg_rtt_ms'] for stats in measured) / len(measured),
+                sum(stats['jitter_ms'] for stats in measured) / len(measured))
+
+    def summary(self, peer):
+        stats = self.stats(peer)
+        if not stats or not stats['answered']:
+            return None
+        return (f"RTT {stats['avg_rtt_ms']:.1f} ms (mín {stats['min_rtt_ms']:.1f}, "
+                f"máx {stats['max_rtt_ms']:.1f}), jitter {stats['jitter_ms']:.1f} ms, "
+                f"{stats['answered']}/{stats['sent']} latidos respondidos")
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+History Store - Historial persistente y acotado del portapapeles
+SQLite en disco con deduplicación por digest, desalojo LRU por número de
+entradas y tamaño total, e índice FTS5 de trigramas para buscar subcadenas
+"""
+
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from protocol import content_digest
+
+
+DEFAULT_HISTORY_PATH = "clipboard_sync_history.db"
+
+# Límites del historial: al superarlos se desalojan las entradas usadas
+# hace más tiempo
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Contenidos mayores no se guardan (indexarlos por trigramas es caro)
+DEFAULT_MAX_ITEM_SIZE = 1024 * 1024
+
+# Caracteres de vista previa que devuelven las búsquedas
+PREVIEW_CHARS = 200
+
+# Entradas que se desalojan de una vez al superar un límite
+EVICT_BATCH = 64
+
+HistoryEntry = namedtuple('HistoryEntry', ['id', 'created', 'last_used', 'size',
+                                           'origin', 'uses', 'preview'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    digest BLOB NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 1,
+    origin TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_last_used ON items(last_used);
+"""
+
+# Número de entradas y bytes totales, mantenidos por triggers: la interfaz y
+# el servicio pueden escribir en la misma base y cada uno desaloja según los
+# totales reales, no según los que vio al abrirla. Una base anterior sin la
+# tabla se cuenta una vez, en la misma transacción que crea los triggers
+TOTALS_SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, entries, bytes)
+    SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM items;
+CREATE TRIGGER IF NOT EXISTS totals_ai AFTER INSERT ON items BEGIN
+    UPDATE totals SET entries = entries + 1, bytes = bytes + new.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS totals_ad AFTER DELETE ON items BEGIN
+    UPDATE totals SET entries = entries - 1, bytes = bytes - old.size WHERE id = 0;
+END;
+COMMIT;
+"""
+
+# Índice invertido de trigramas sobre el contenido (tabla de contenido externo)
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    content, content='items', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+    INSERT INTO items_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+    INSERT INTO items_fts(items_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+ENTRY_COLUMNS = (f"items.id, items.created, items.last_used, items.size, items.origin, "
+                 f"items.uses, substr(items.content, 1, {PREVIEW_CHARS})")
+
+
+class HistoryStore:
+    """
+    Historial del portapapeles en una base SQLite.
+
+    Nada se carga en memoria: las búsquedas usan el índice de trigramas
+    (subcadenas de 3 o más caracteres) y solo devuelven una vista previa;
+    el contenido completo se lee con get(). La caché de páginas de SQLite
+    está acotada y el fichero se lee mediante mmap.
+
+    Es seguro usarlo desde varios hilos (una conexión protegida con lock)
+    y desde varios procesos a la vez: cada escritura es una transacción
+    IMMEDIATE y los límites se comprueban con los totales de la base.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES, max_item_size=DEFAULT_MAX_ITEM_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_item_size = max_item_size
+        self._lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA cache_size=-4096")        # 4 MiB de caché
+        self.db.execute("PRAGMA mmap_size=67108864")      # 64 MiB mapeados
+        self.db.executescript(SCHEMA)
+        self.db.executescript(TOTALS_SCHEMA)
+
+        # FTS5 con trigramas requiere SQLite 3.34; si no, se busca con LIKE
+        try:
+            self.db.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+
+    def add(self, text, origin='local', digest=None):
+        """
+        Guarda un contenido. Si ya estaba (mismo digest) se mueve al frente
+        con un id nuevo, así el orden de los ids es el de uso y las búsquedas
+        recorren el índice de más reciente a más antiguo sin ordenar.
+        Devuelve el id de la entrada, o None si no se guardó.
+        """
+        data = text.encode('utf-8')
+        if not data or len(data) > self.max_item_size:
+            return None
+        digest_hash = digest.hash if digest else content_digest(data).hash
+        now = time.time()
+
+        with self._lock, self.db:
+            # Otro proceso puede estar escribiendo: se toma el lock de escritura
+            # antes de leer, así la búsqueda y los totales no quedan obsoletos
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute("SELECT id, created, uses FROM items WHERE digest = ?",
+                                  (digest_hash,)).fetchone()
+            created, uses = now, 1
+            if row:
+                self.db.execute("DELETE FROM items WHERE id = ?", (row[0],))
+                created, uses = row[1], row[2] + 1
+
+            cursor = self.db.execute(
+                "INSERT INTO items (digest, size, created, last_used, uses, origin, content) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest_hash, len(data), created, now, uses, origin, text))
+            self._evict()
+            return cursor.lastrowid
+
+    def _totals(self):
+        """(entradas, bytes) de la base, incluidas las escrituras de otros procesos"""
+        return self.db.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+
+    def _evict(self):
+        """
+        Desaloja las entradas usadas hace más tiempo hasta cumplir los
+        límites. Se llama dentro de la transacción de escritura
+        """
+        while True:
+            count, total_bytes = self._totals()
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            rows = self.db.execute(
+                "SELECT id FROM items ORDER BY last_used LIMIT ?",
+                (min(EVICT_BATCH, max(1, count - self.max_entries)),)).fetchall()
+            if not rows:
+                break
+            self.db.executemany("DELETE FROM items WHERE id = ?", rows)
+
+    def search(self, query, limit=50):
+        """
+        Entradas que contienen todas las palabras de `query`, de la copiada
+        más recientemente a la más antigua. Sin consulta devuelve las últimas.
+        """
+        terms = query.split()
+        if not terms:
+            return self.recent(limit)
+
+        if self.fts and all(len(term) >= 3 for term in terms):
+            match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+            sql = (f"SELECT {ENTRY_COLUMNS} FROM items_fts "
+                   f"JOIN items ON items.id = items_fts.rowid "
+                   f"WHERE items_fts MATCH ? ORDER BY items_fts.rowid DESC LIMIT ?")
+            params = (match, limit)
+        else:
+            # Términos de menos de 3 caracteres: recorrido secuencial con LIKE
+            where = ' AND '.join("items.content LIKE ? ESCAPE '\\'" for _ in terms)
+            sql = (f"SELECT {ENTRY_COLUMNS} FROM items WHERE {where} "
+                   f"ORDER BY items.id DESC LIMIT ?")
+            params = tuple('%' + term.replace('\\', '\\\\').replace('%', '\\%')
+                           .replace('_', '\\_') + '%' for term in terms) + (limit,)
+
+        with self._lock:
+            return [HistoryEntry(*row) for row in self.db.execute(sql, params)]
+
+    def recent(self, limit=50):
+        """Últimas entradas copiadas"""
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT {ENTRY_COLUMNS} FROM items ORDER BY id DESC LIMIT ?", (limit,))
+            return [HistoryEntry(*row) for row in rows]
+
+    def get(self, entry_id, touch=True):
+        """Contenido completo de una entrada (None si no existe)"""
+        with self._lock, self.db:
+            row = self.db.execute("SELECT content FROM items WHERE id = ?",
+                                  (entry_id,)).fetchone()
+            if row and touch:
+                self.db.execute("UPDATE items SET last_used = ? WHERE id = ?",
+                                (time.time(), entry_id))
+            return row[0] if row else None
+
+    def delete(self, entry_id):
+        with self._lock, self.db:
+            return self.db.execute("DELETE FROM items WHERE id = ?", (entry_id,)).rowcount > 0
+
+    def clear(self):
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM items")
+
+    def stats(self):
+        with self._lock:
+            count, total_bytes = self._totals()
+        return {
+            'entries': count,
+            'bytes': total_bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'fts': self.fts,
+        }
+
+    def close(self):
+        with self._lock:
+            self.db.close()
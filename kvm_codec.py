@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+KVM Codec - Codificación binaria de tamaño fijo para eventos de mouse/teclado
+Un byte de tipo seguido de campos empaquetados con struct
+"""
+
+import struct
+import time
+
+
+# Tipos de evento (primer byte del payload)
+EVENT_MOUSE_MOVE = 1
+EVENT_MOUSE_CLICK = 2
+EVENT_MOUSE_SCROLL = 3
+EVENT_KEY_PRESS = 4
+EVENT_KEY_RELEASE = 5
+EVENT_CONTROL_CHANGE = 6
+
+# Formatos: tipo + campos, little-endian y sin relleno
+MOUSE_MOVE = struct.Struct('<Bff')      # x, y relativos (0-1) en float32
+MOUSE_CLICK = struct.Struct('<BBB')     # código de botón, presionado
+MOUSE_SCROLL = struct.Struct('<Bhh')    # dx, dy en int16
+KEY_EVENT = struct.Struct('<BBI')       # clase de tecla, código
+CONTROL_CHANGE = struct.Struct('<BB')   # el receptor pasa a controlar
+
+# Hora de captura (time_ns del emisor) añadida al final de cada evento, para
+# medir la latencia hasta que se reproduce. Los receptores anteriores la
+# ignoran porque solo leen los campos de su formato.
+EVENT_TIMESTAMP = struct.Struct('<q')
+
+# Clases de tecla
+KEY_CHAR = 0      # código = punto de código Unicode del carácter
+KEY_SPECIAL = 1   # código = índice en KEY_NAMES
+KEY_VK = 2        # código = virtual key code (teclas sin carácter ni nombre)
+
+# Botones del mouse por código. El orden es parte del protocolo:
+# solo se pueden añadir nombres al final.
+BUTTON_NAMES = ('unknown', 'left', 'middle', 'right', 'x1', 'x2',
+                'button8', 'button9', 'scroll_down', 'scroll_up',
+                'scroll_left', 'scroll_right')
+BUTTON_CODES = {name: code for code, name in enumerate(BUTTON_NAMES)}
+
+# Teclas especiales de pynput (Key.<nombre>) por código. El orden es parte
+# del protocolo: solo se pueden añadir nombres al final.
+KEY_NAMES = (
+    'alt', 'alt_l', 'alt_r', 'alt_gr', 'backspace', 'caps_lock',
+    'cmd', 'cmd_l', 'cmd_r', 'ctrl', 'ctrl_l', 'ctrl_r',
+    'delete', 'down', 'end', 'enter', 'esc',
+    'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8', 'f9', 'f10',
+    'f11', 'f12', 'f13', 'f14', 'f15', 'f16', 'f17', 'f18', 'f19', 'f20',
+    'home', 'left', 'page_down', 'page_up', 'right',
+    'shift', 'shift_l', 'shift_r', 'space', 'tab', 'up',
+    'media_play_pause', 'media_volume_mute', 'media_volume_down',
+    'media_volume_up', 'media_previous', 'media_next',
+    'insert', 'menu', 'num_lock', 'pause', 'print_screen', 'scroll_lock',
+)
+KEY_CODES = {name: code for code, name in enumerate(KEY_NAMES)}
+
+
+def encode_mouse_move(x, y):
+    return MOUSE_MOVE.pack(EVENT_MOUSE_MOVE, x, y)
+
+
+def encode_mouse_click(button_code, pressed):
+    return MOUSE_CLICK.pack(EVENT_MOUSE_CLICK, button_code, 1 if pressed else 0)
+
+
+def _clamp_int16(value):
+    return max(-32768, min(32767, int(value)))
+
+
+def encode_mouse_scroll(dx, dy):
+    return MOUSE_SCROLL.pack(EVENT_MOUSE_SCROLL, _clamp_int16(dx), _clamp_int16(dy))
+
+
+def encode_key(event_type, kind, code):
+    return KEY_EVENT.pack(event_type, kind, code)
+
+
+def encode_control_change(controlling):
+    return CONTROL_CHANGE.pack(EVENT_CONTROL_CHANGE, 1 if controlling else 0)
+
+
+def stamp_event(payload):
+    """Añade la hora de captura a un evento codificado"""
+    return payload + EVENT_TIMESTAMP.pack(time.time_ns())
+
+
+def event_timestamp(payload):
+    """Hora de captura de un evento (ns del emisor), o None si no la lleva"""
+    fmt = FORMATS.get(payload[0]) if payload else None
+    if fmt is None or len(payload) != fmt.size + EVENT_TIMESTAMP.size:
+        return None
+    return EVENT_TIMESTAMP.unpack_from(payload, fmt.size)[0]
+
+
+def decode_event(payload):
+    """
+    Decodifica un evento. Devuelve una tupla cuyo primer elemento es el
+    tipo de evento, seguida de sus campos en el orden del formato.
+    """
+    event_type = payload[0]
+    fmt = FORMATS.get(event_type)
+    if fmt is None:
+        raise ValueError(f"Tipo de evento desconocido: {event_type}")
+    return fmt.unpack_from(payload)
+
+
+FORMATS = {
+    EVENT_MOUSE_MOVE: MOUSE_MOVE,
+    EVENT_MOUSE_CLICK: MOUSE_CLICK,
+    EVENT_MOUSE_SCROLL: MOUSE_SCROLL,
+    EVENT_KEY_PRESS: KEY_EVENT,
+    EVENT_KEY_RELEASE: KEY_EVENT,
+    EVENT_CONTROL_CHANGE: CONTROL_CHANGE,
+}
@@ -3,26 +3,52 @@
 KVM Sync - Modulo para compartir mouse y teclado entre dispositivos
 """
 
-import json
 import threading
 import time
 from pynput import mouse, keyboard
 from pynput.mouse import Controller as MouseController, Button
 from pynput.keyboard import Controller as KeyboardController, Key
+from kvm_codec import (BUTTON_NAMES, EVENT_CONTROL_CHANGE, EVENT_KEY_PRESS, EVENT_KEY_RELEASE,
+                       EVENT_MOUSE_CLICK, EVENT_MOUSE_MOVE, EVENT_MOUSE_SCROLL, KEY_CHAR,
+                       KEY_NAMES, KEY_SPECIAL, KEY_VK, decode_event, encode_control_change,
+                       encode_key, encode_mouse_click, encode_mouse_move, encode_mouse_scroll,
+                       stamp_event)
+from screen_geometry import ScreenGeometry
+
+
+# Movimientos de mouse enviados por segundo como maximo
+DEFAULT_MOVE_RATE = 120
 
 
 class KVMSync:
-    def __init__(self, send_callback, log_callback=None):
+    def __init__(self, send_callback, log_callback=None, move_rate=DEFAULT_MOVE_RATE,
+                 geometry=None):
         """
         Inicializa el sincronizador de mouse/teclado
 
         Args:
-            send_callback: Funcion para enviar eventos al dispositivo remoto
+            send_callback: Funcion para enviar eventos (bytes) al dispositivo remoto
             log_callback: Funcion opcional para logging
+            move_rate: Maximo de movimientos de mouse enviados por segundo
+                       (p. ej. la frecuencia de refresco de la pantalla remota)
+            geometry: ScreenGeometry opcional (por defecto se crea una)
         """
         self.send_callback = send_callback
         self.log_callback = log_callback
 
+        # Tamaño de pantalla en caché para convertir coordenadas
+        self.geometry = geometry or ScreenGeometry(log_callback=log_callback)
+
+        # Agrupacion de movimientos: solo se envia la ultima posicion
+        self.move_rate = move_rate
+        self.pending_move = None
+        self.move_lock = threading.Lock()
+        self.move_ready = threading.Event()
+        self.flush_thread = None
+        self.moves_captured = 0
+        self.moves_sent = 0
+        self.moves_coalesced = 0
+
         # Estado
         self.enabled = False
         self.controlling = True  # True = este dispositivo controla, False = dispositivo remoto controla
@@ -43,6 +69,24 @@ class KVMSync:
         # Evitar loops infinitos
         self.block_events = False
 
+        # Tablas precalculadas codigo <-> tecla/boton de pynput
+        self.special_keys = [getattr(Key, name, None) for name in KEY_NAMES]
+        self.special_codes = {key: code for code, key in enumerate(self.special_keys)
+                              if key is not None}
+        self.buttons = [getattr(Button, name, None) for name in BUTTON_NAMES]
+        self.button_codes = {button: code for code, button in enumerate(self.buttons)
+                             if button is not None}
+
+        # Reproduccion de eventos remotos por tipo
+        self.replay_handlers = {
+            EVENT_MOUSE_MOVE: self.replay_mouse_move,
+            EVENT_MOUSE_CLICK: self.replay_mouse_click,
+            EVENT_MOUSE_SCROLL: self.replay_mouse_scroll,
+            EVENT_KEY_PRESS: self.replay_key_press,
+            EVENT_KEY_RELEASE: self.replay_key_release,
+            EVENT_CONTROL_CHANGE: self.replay_control_change,
+        }
+
     def log(self, message, level="info"):
         """Helper para logging"""
         if self.log_callback:
@@ -78,6 +122,14 @@ class KVMSync:
         )
         self.hotkey_listener.start()
 
+        # Refresco periodico del tamaño de pantalla (cambios de resolucion)
+        self.geometry.start()
+
+        # Hilo que envia el ultimo movimiento pendiente a ritmo fijo
+        if self.flush_thread is None or not self.flush_thread.is_alive():
+            self.flush_thread = threading.Thread(target=self.flush_moves_loop, daemon=True)
+            self.flush_thread.start()
+
         self.log("KVM iniciado - Tienes el control (Ctrl+Alt+Shift+S para cambiar)", "success")
 
     def stop(self):
@@ -94,7 +146,9 @@ class KVMSync:
         if self.hotkey_listener:
             self.hotkey_listener.stop()
 
-        self.log("KVM detenido", "info")
+        self.geometry.stop()
+        self.move_ready.set()
+        self.log(f"KVM detenido - {self.coalescing_summary()}", "info")
 
     def toggle_control(self):
         """Cambia el control entre este dispositivo y el remoto"""
@@ -105,86 +159,91 @@ class KVMSync:
         else:
             self.log("Control transferido al dispositivo REMOTO", "warning")
 
-        # Notificar al otro dispositivo
-        self.send_event({
-            'type': 'control_change',
-            'controlling': not self.controlling  # El otro dispositivo recibe el estado opuesto
-        })
+        # Notificar al otro dispositivo (recibe el estado opuesto)
+        self.flush_pending_move()
+        self.send_event(encode_control_change(not self.controlling))
 
     # === CAPTURA DE EVENTOS ===
 
     def on_mouse_move(self, x, y):
-        """Captura movimiento del mouse"""
+        """Captura movimiento del mouse (solo guarda la ultima posicion)"""
         if not self.enabled or not self.controlling or self.block_events:
             return
 
-        # Obtener tamaño de pantalla para coordenadas relativas
-        from tkinter import Tk
-        try:
-            root = Tk()
-            screen_width = root.winfo_screenwidth()
-            screen_height = root.winfo_screenheight()
-            root.destroy()
+        with self.move_lock:
+            self.moves_captured += 1
+            if self.pending_move is not None:
+                self.moves_coalesced += 1
+            self.pending_move = (x, y)
+        self.move_ready.set()
+
+    def flush_moves_loop(self):
+        """Envia el movimiento pendiente como mucho `move_rate` veces por segundo"""
+        interval = 1.0 / self.move_rate
+        while self.enabled:
+            self.move_ready.wait()
+            self.move_ready.clear()
+            if not self.enabled:
+                break
+            self.flush_pending_move()
+            time.sleep(interval)
+
+    def flush_pending_move(self):
+        """
+        Envia el movimiento pendiente, si lo hay. Clicks, scroll y teclas lo
+        llaman antes de enviarse para conservar el orden de los eventos.
+        """
+        with self.move_lock:
+            if self.pending_move is None:
+                return
+            x, y = self.pending_move
+            self.pending_move = None
 
             # Convertir a coordenadas relativas (0-1)
-            rel_x = x / screen_width
-            rel_y = y / screen_height
-
-            self.send_event({
-                'type': 'mouse_move',
-                'x': rel_x,
-                'y': rel_y
-            })
-        except:
-            pass
+            rel_x, rel_y = self.geometry.to_relative(x, y)
+            self.send_event(encode_mouse_move(rel_x, rel_y))
+            self.moves_sent += 1
+
+    def coalescing_summary(self):
+        """Resumen de los contadores de agrupacion de movimientos"""
+        return (f"movimientos capturados: {self.moves_captured}, "
+                f"enviados: {self.moves_sent}, agrupados: {self.moves_coalesced}")
 
     def on_mouse_click(self, x, y, button, pressed):
         """Captura clicks del mouse"""
         if not self.enabled or not self.controlling or self.block_events:
             return
 
-        button_name = button.name if hasattr(button, 'name') else str(button)
-
-        self.send_event({
-            'type': 'mouse_click',
-            'button': button_name,
-            'pressed': pressed
-        })
+        self.flush_pending_move()
+        self.send_event(encode_mouse_click(self.button_codes.get(button, 0), pressed))
 
     def on_mouse_scroll(self, x, y, dx, dy):
         """Captura scroll del mouse"""
         if not self.enabled or not self.controlling or self.block_events:
             return
 
-        self.send_event({
-            'type': 'mouse_scroll',
-            'dx': dx,
-            'dy': dy
-        })
+        self.flush_pending_move()
+        self.send_event(encode_mouse_scroll(dx, dy))
 
     def on_key_press(self, key):
         """Captura teclas presionadas"""
         if not self.enabled or not self.controlling or self.block_events:
             return
 
-        key_data = self.serialize_key(key)
-        if key_data:
-            self.send_event({
-                'type': 'key_press',
-                'key': key_data
-            })
+        payload = self.encode_key_event(EVENT_KEY_PRESS, key)
+        if payload:
+            self.flush_pending_move()
+            self.send_event(payload)
 
     def on_key_release(self, key):
         """Captura teclas liberadas"""
         if not self.enabled or not self.controlling or self.block_events:
             return
 
-        key_data = self.serialize_key(key)
-        if key_data:
-            self.send_event({
-                'type': 'key_release',
-                'key': key_data
-            })
+        payload = self.encode_key_event(EVENT_KEY_RELEASE, key)
+        if payload:
+            self.flush_pending_move()
+            self.send_event(payload)
 
     # === HOTKEY PARA CAMBIAR CONTROL ===
 
@@ -214,28 +273,12 @@ class KVMSync:
             return
 
         try:
-            event = json.loads(event_data) if isinstance(event_data, str) else event_data
-            event_type = event.get('type')
+            event = decode_event(event_data)
 
             # Bloquear captura temporal para evitar loops
             self.block_events = True
 
-            if event_type == 'mouse_move':
-                self.replay_mouse_move(event)
-            elif event_type == 'mouse_click':
-                self.replay_mouse_click(event)
-            elif event_type == 'mouse_scroll':
-                self.replay_mouse_scroll(event)
-            elif event_type == 'key_press':
-                self.replay_key_press(event)
-            elif event_type == 'key_release':
-                self.replay_key_release(event)
-            elif event_type == 'control_change':
-                self.controlling = event.get('controlling', False)
-                if self.controlling:
-                    self.log("Ahora TIENES el control del mouse/teclado", "success")
-                else:
-                    self.log("Control transferido al dispositivo REMOTO", "warning")
+            self.replay_handlers[event[0]](event)
 
             # Desbloquear captura
             time.sleep(0.001)  # Pequeno delay para evitar race conditions
@@ -245,30 +288,32 @@ class KVMSync:
             self.block_events = False
             self.log(f"Error procesando evento remoto: {e}", "error")
 
+    def replay_control_change(self, event):
+        """Aplica un cambio de control enviado por el otro dispositivo"""
+        self.controlling = bool(event[1])
+        if self.controlling:
+            self.log("Ahora TIENES el control del mouse/teclado", "success")
+        else:
+            self.log("Control transferido al dispositivo REMOTO", "warning")
+
     def replay_mouse_move(self, event):
         """Reproduce movimiento de mouse"""
         try:
-            from tkinter import Tk
-            root = Tk()
-            screen_width = root.winfo_screenwidth()
-            screen_height = root.winfo_screenheight()
-            root.destroy()
-
             # Convertir de relativo a absoluto
-            x = int(event['x'] * screen_width)
-            y = int(event['y'] * screen_height)
-
-            self.mouse_controller.position = (x, y)
+            self.mouse_controller.position = self.geometry.to_absolute(event[1], event[2])
         except Exception as e:
             self.log(f"Error moviendo mouse: {e}", "error")
 
     def replay_mouse_click(self, event):
         """Reproduce click de mouse"""
         try:
-            button_name = event['button']
-            pressed = event['pressed']
+            _, button_code, pressed = event
 
-            button = getattr(Button, button_name, Button.left)
+            button = None
+            if button_code < len(self.buttons):
+                button = self.buttons[button_code]
+            if button is None:
+                button = Button.left
 
             if pressed:
                 self.mouse_controller.press(button)
@@ -280,8 +325,7 @@ class KVMSync:
     def replay_mouse_scroll(self, event):
         """Reproduce scroll de mouse"""
         try:
-            dx = event['dx']
-            dy = event['dy']
+            _, dx, dy = event
             self.mouse_controller.scroll(dx, dy)
         except Exception as e:
             self.log(f"Error reproduciendo scroll: {e}", "error")
@@ -289,7 +333,7 @@ class KVMSync:
     def replay_key_press(self, event):
         """Reproduce presion de tecla"""
         try:
-            key = self.deserialize_key(event['key'])
+            key = self.decode_key(event[1], event[2])
             if key:
                 self.keyboard_controller.press(key)
         except Exception as e:
@@ -298,7 +342,7 @@ class KVMSync:
     def replay_key_release(self, event):
         """Reproduce liberacion de tecla"""
         try:
-            key = self.deserialize_key(event['key'])
+            key = self.decode_key(event[1], event[2])
             if key:
                 self.keyboard_controller.release(key)
         except Exception as e:
@@ -306,36 +350,38 @@ class KVMSync:
 
     # === UTILIDADES ===
 
-    def send_event(self, event):
-        """Envia un evento al dispositivo remoto"""
+    def send_event(self, payload):
+        """Envia un evento codificado al dispositivo remoto, con su hora de captura"""
         try:
-            event_json = json.dumps(event)
-            self.send_callback(event_json)
+            self.send_callback(stamp_event(payload))
         except Exception as e:
             self.log(f"Error enviando evento: {e}", "error")
 
-    def serialize_key(self, key):
-        """Convierte una tecla a formato serializable"""
+    def encode_key_event(self, event_type, key):
+        """Codifica una tecla usando la tabla precalculada de teclas especiales"""
         try:
-            if hasattr(key, 'char') and key.char is not None:
-                return {'type': 'char', 'value': key.char}
-            elif hasattr(key, 'name'):
-                return {'type': 'special', 'value': key.name}
-            else:
-                return {'type': 'special', 'value': str(key)}
-        except:
-            return None
+            code = self.special_codes.get(key)
+            if code is not None:
+                return encode_key(event_type, KEY_SPECIAL, code)
+            char = getattr(key, 'char', None)
+            if char is not None and len(char) == 1:
+                return encode_key(event_type, KEY_CHAR, ord(char))
+            vk = getattr(key, 'vk', None)
+            if vk is not None:
+                return encode_key(event_type, KEY_VK, vk)
+        except Exception:
+            pass
+        return None
 
-    def deserialize_key(self, key_data):
-        """Convierte datos serializados de vuelta a una tecla"""
+    def decode_key(self, kind, code):
+        """Convierte (clase, codigo) de vuelta a una tecla de pynput"""
         try:
-            if key_data['type'] == 'char':
-                return keyboard.KeyCode.from_char(key_data['value'])
-            elif key_data['type'] == 'special':
-                # Intentar obtener la tecla especial por nombre
-                try:
-                    return getattr(Key, key_data['value'])
-                except:
-                    return None
-        except:
-            return None
+            if kind == KEY_SPECIAL:
+                return self.special_keys[code] if code < len(self.special_keys) else None
+            if kind == KEY_CHAR:
+                return keyboard.KeyCode.from_char(chr(code))
+            if kind == KEY_VK:
+                return keyboard.KeyCode.from_vk(code)
+        except Exception:
+            pass
+        return None
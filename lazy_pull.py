@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Lazy Pull - Anuncio de contenidos grandes y descarga bajo demanda
+Por encima de un tamaño solo se envía un descriptor (digest, tamaño,
+formatos); el otro extremo pide el contenido cuando lo necesita, y los
+contenidos ya recibidos se guardan en una caché por digest
+"""
+
+import struct
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from clipboard_formats import FORMAT_TEXT, decode_formats
+from protocol import CLIPBOARD_META, CONTENT_FORMATS, CONTENT_KIND, DIGEST_SIZE, ContentDigest
+
+
+# Tipo de mensaje del canal de descargas
+PULL_ANNOUNCE = 1   # CLIPBOARD_META + tipo de contenido + formatos separados por comas
+PULL_REQUEST = 2    # hash del contenido que se pide
+PULL_MISSING = 3    # el emisor ya no tiene ese contenido
+
+PULL_KIND = struct.Struct('>B')
+PULL_HASH = struct.Struct(f'>{DIGEST_SIZE}s')
+
+# Los contenidos de al menos este tamaño se anuncian en lugar de enviarse
+DEFAULT_LAZY_THRESHOLD = 8 * 1024 * 1024
+
+# Segundos sin anuncios nuevos ni tráfico antes de descargar automáticamente
+DEFAULT_PULL_IDLE = 2.0
+
+# Memoria máxima de la caché de contenidos por digest
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+Announcement = namedtuple('Announcement', ['peer', 'origin', 'msg_id', 'digest', 'kind',
+                                           'formats', 'received_at'])
+
+
+def message_formats(message):
+    """Formatos de un mensaje, para el descriptor"""
+    if message.kind == CONTENT_FORMATS:
+        return tuple(decode_formats(message.data))
+    return (FORMAT_TEXT,)
+
+
+def encode_announce(message):
+    formats = ','.join(message_formats(message)).encode('ascii')
+    return b''.join((
+        PULL_KIND.pack(PULL_ANNOUNCE),
+        CLIPBOARD_META.pack(message.origin, message.msg_id,
+                            message.digest.hash, message.digest.size),
+        CONTENT_KIND.pack(message.kind),
+        formats,
+    ))
+
+
+def decode_announce(payload, peer):
+    pos = PULL_KIND.size
+    origin, msg_id, digest_hash, size = CLIPBOARD_META.unpack_from(payload, pos)
+    pos += CLIPBOARD_META.size
+    (kind,) = CONTENT_KIND.unpack_from(payload, pos)
+    pos += CONTENT_KIND.size
+    formats = tuple(bytes(payload[pos:]).decode('ascii', 'ignore').split(','))
+    return Announcement(peer, origin, msg_id, ContentDigest(digest_hash, size), kind,
+                        formats, time.monotonic())
+
+
+def encode_hash(kind, digest_hash):
+    """Payload PULL_REQUEST o PULL_MISSING para un contenido"""
+    return PULL_KIND.pack(kind) + PULL_HASH.pack(digest_hash)
+
+
+def decode_hash(payload):
+    return PULL_HASH.unpack_from(payload, PULL_KIND.size)[0]
+
+
+class ContentCache:
+    """
+    Contenidos grandes por digest (LRU acotada en bytes). Guarda tanto los
+    contenidos anunciados por este extremo, que sirve cuando se los piden,
+    como los descargados, para no volver a descargarlos si se vuelven a
+    copiar en el otro equipo.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def put(self, message):
+        # Copia propia: los datos recibidos pueden ser vistas de un buffer
+        message = message._replace(data=bytes(message.data))
+        if len(message.data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self.items.pop(message.digest.hash, None)
+            if old:
+                self.size -= len(old.data)
+            self.items[message.digest.hash] = message
+            self.size += len(message.data)
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted.data)
+
+    def get(self, digest_hash):
+        """Mensaje con ese contenido, o None si no está"""
+        with self._lock:
+            item = self.items.get(digest_hash)
+            if item:
+                self.items.move_to_end(digest_hash)
+            return item
+
+
+class PullStats:
+    """Anuncios, descargas y bytes que no hubo que transferir"""
+
+    def __init__(self):
+        self.announced = 0
+        self.received = 0
+        self.pulled = 0
+        self.cache_hits = 0
+        self.bytes_pulled = 0
+        self.bytes_avoided = 0
+        self._lock = threading.Lock()
+
+    def record(self, field, size=0):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            if field == 'pulled':
+                self.bytes_pulled += size
+            elif field == 'cache_hits':
+                self.bytes_avoided += size
+
+    def summary(self):
+        return (f"{self.announced} anunciados, {self.received} recibidos, "
+                f"{self.pulled} descargados ({self.bytes_pulled} bytes), "
+                f"{self.cache_hits} desde caché ({self.bytes_avoided} bytes evitados)")
+
+
+class LazyPull:
+    """
+    Estado de los anuncios y descargas de un extremo.
+
+    Como emisor, decide qué mensajes se anuncian (threshold en bytes, None
+    = enviar todo) y los guarda en la caché para servirlos. Como receptor,
+    recuerda el último anuncio pendiente; se descarga con take_pending()
+    desde la GUI, la consola o automáticamente al quedar inactivo.
+    """
+
+    def __init__(self, threshold=None, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.threshold = threshold
+        self.cache = ContentCache(cache_bytes)
+        self.pending = None
+        self.requested = set()
+        self.stats = PullStats()
+        self._lock = threading.Lock()
+
+    def should_announce(self, message):
+        return self.announces(len(message.data))
+
+    def announces(self, size):
+        """True si un contenido de `size` bytes se anuncia en lugar de enviarse"""
+        return self.threshold is not None and size >= self.threshold
+
+    def announce(self, message):
+        """Payload de anuncio para un mensaje local, que queda en la caché"""
+        self.cache.put(message)
+        self.stats.record('announced')
+        return encode_announce(message)
+
+    def remember(self, message):
+        """Guarda en la caché un contenido recibido que se había pedido"""
+        with self._lock:
+            if message.digest.hash not in self.requested:
+                return
+            self.requested.discard(message.digest.hash)
+        self.cache.put(message)
+
+    def receive(self, payload, peer):
+        """
+        Procesa un anuncio. Devuelve el mensaje si el contenido ya está en
+        la caché, o None y lo deja pendiente de descarga.
+        """
+        announcement = decode_announce(payload, peer)
+        self.stats.record('received')
+        cached = self.cache.get(announcement.digest.hash)
+        if cached:
+            self.stats.record('cache_hits', len(cached.data))
+            return cached._replace(origin=announcement.origin, msg_id=announcement.msg_id)
+        with self._lock:
+            self.pending = announcement
+        return None
+
+    def take_pending(self, announcement=None):
+        """
+        Saca el anuncio pendiente para pedirlo (solo si sigue siendo
+        `announcement`, cuando se indica). Devuelve None si no hay.
+        """
+        with self._lock:
+            pending = self.pending
+            if pending is None or (announcement is not None and pending is not announcement):
+                return None
+            self.pending = None
+            self.requested.add(pending.digest.hash)
+        self.stats.record('pulled', pending.digest.size)
+        return pending
+
+    def discard(self, peer=None, digest_hash=None):
+        """Olvida el anuncio pendiente (solo el de `peer` o con ese hash, si se indican)"""
+        with self._lock:
+            pending = self.pending
+            if pending and (peer is None or pending.peer == peer) and \
+                    (digest_hash is None or pending.digest.hash == digest_hash):
+                self.pending = None
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Metrics - Contadores e histogramas del proceso y endpoint HTTP local
+Las métricas viven siempre en memoria (incrementar cuesta un lock y una
+suma) y se exponen en formato de texto de Prometheus solo si se pide
+"""
+
+import bisect
+import threading
+
+from protocol import CHANNEL_NAMES
+
+
+DEFAULT_METRICS_PORT = 9464
+
+# Límites de los histogramas de latencia, en segundos
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts = self.counts[:]
+            total, count = self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append((name + '_bucket', labels + (('le', le),), cumulative))
+        samples.append((name + '_sum', labels, total))
+        samples.append((name + '_count', labels, count))
+        return samples
+
+
+class Metric:
+    """
+    Métrica con nombre, ayuda y etiquetas. labels(*valores) devuelve la
+    serie de esos valores (se crea la primera vez); sin etiquetas, la
+    métrica se usa directamente (inc, set, observe).
+    """
+
+    def __init__(self, kind, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        if self.kind == 'histogram':
+            return _HistogramChild(self.buckets)
+        return _CounterChild()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self.children.items()):
+            labels = tuple(zip(self.labelnames, values))
+            for name, sample_labels, value in child.samples(self.name, labels):
+                lines.append(f"{name}{_format_labels(sample_labels)} {_format_value(value)}")
+        return lines
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """Conjunto de métricas del proceso, en el orden en que se registraron"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Metric('counter', name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Metric('gauge', name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Metric('histogram', name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Todas las métricas en formato de texto de Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+FRAMES_RECEIVED = REGISTRY.counter('clipboard_sync_frames_received_total',
+                                   'Tramas recibidas por canal', ('channel',))
+BYTES_RECEIVED = REGISTRY.counter('clipboard_sync_bytes_received_total',
+                                  'Bytes recibidos por canal (con cabecera)', ('channel',))
+FRAMES_SENT = REGISTRY.counter('clipboard_sync_frames_sent_total',
+                               'Tramas escritas en el socket por canal', ('channel',))
+BYTES_SENT = REGISTRY.counter('clipboard_sync_bytes_sent_total',
+                              'Bytes escritos en el socket por canal (con cabecera)', ('channel',))
+FRAMES_DROPPED = REGISTRY.counter('clipboard_sync_frames_dropped_total',
+                                  'Tramas descartadas por colas de salida llenas')
+RECONNECTS = REGISTRY.counter('clipboard_sync_reconnects_total',
+                              'Sesiones reanudadas tras perder la conexión')
+EVICTIONS = REGISTRY.counter('clipboard_sync_evictions_total',
+                             'Peers desconectados por no responder a los latidos')
+PEERS = REGISTRY.gauge('clipboard_sync_peers', 'Peers conectados')
+RTT = REGISTRY.gauge('clipboard_sync_rtt_seconds', 'RTT medio de los latidos')
+COPY_TO_APPLY = REGISTRY.histogram('clipboard_sync_copy_to_apply_seconds',
+                                   'Desde que se detecta una copia hasta que el peer la aplica')
+KVM_CAPTURE_TO_REPLAY = REGISTRY.histogram('clipboard_sync_kvm_capture_to_replay_seconds',
+                                           'Desde que se captura un evento KVM hasta que '
+                                           'el otro equipo lo reproduce')
+BACKEND_DURATION = REGISTRY.histogram('clipboard_sync_backend_seconds',
+                                      'Duración de las operaciones del portapapeles',
+                                      ('operation',))
+
+
+def count_received(channel, size):
+    """Una trama de `size` bytes recibida por `channel`"""
+    name = CHANNEL_NAMES.get(channel, str(channel))
+    FRAMES_RECEIVED.labels(name).inc()
+    BYTES_RECEIVED.labels(name).inc(size)
+
+
+def count_sent(channel, size):
+    """Una trama de `size` bytes escrita en el socket por `channel`"""
+    name = CHANNEL_NAMES.get(channel, str(channel))
+    FRAMES_SENT.labels(name).inc()
+    BYTES_SENT.labels(name).inc(size)
+
+
+def start_metrics_server(port=DEFAULT_METRICS_PORT, host='127.0.0.1', registry=REGISTRY):
+    """Sirve /metrics en un hilo propio. Devuelve el servidor (shutdown() lo para)"""
+    # http.server solo se carga si se pide el endpoint (alarga el arranque)
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server
+
+
+def parse_metrics(text):
+    """
+    Lee el formato de texto de Prometheus. Devuelve
+    {nombre: [(etiquetas como dict, valor)]}, sin las líneas de ayuda.
+    """
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, _, value = line.rpartition(' ')
+        name, _, labels = series.partition('{')
+        parsed = {}
+        for pair in labels.rstrip('}').split(','):
+            if '=' in pair:
+                key, _, label_value = pair.partition('=')
+                parsed[key] = label_value.strip('"')
+        samples.setdefault(name, []).append((parsed, float(value)))
+    return samples
+
+
+def histogram_quantile(buckets, q):
+    """
+    Cuantil q (0-1) estimado a partir de [(límite, cuenta acumulada)],
+    interpolando dentro del bucket como hace Prometheus. None si no hay datos.
+    """
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0
+    for bound, cumulative in buckets:
+        if cumulative >= rank:
+            if bound == float('inf'):
+                return lower
+            inside = cumulative - below
+            return lower + (bound - lower) * ((rank - below) / inside if inside else 0)
+        lower, below = bound, cumulative
+    return lower
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Outbound - Colas de salida acotadas por peer
+Cada peer tiene su propia cola y su propio escritor, así un cliente lento
+no retrasa a los demás ni bloquea la detección de cambios
+"""
+
+import threading
+import time
+from collections import deque
+
+from kvm_codec import EVENT_MOUSE_MOVE
+from metrics import FRAMES_DROPPED, count_sent
+from protocol import (CHANNEL_CLIPBOARD, CHANNEL_DELTA, CHANNEL_FORMATS, CHANNEL_HEARTBEAT,
+                      CHANNEL_KVM, CHANNEL_SESSION, CHANNEL_TRANSFER, FLAG_CODEC_MASK, FRAME_HEADER)
+
+
+# Políticas para consumidores lentos (cola llena)
+POLICY_DROP_OLDEST = 'drop-oldest'   # se descarta la trama más antigua que se puede perder
+POLICY_LATEST = 'latest'             # solo se conserva el último portapapeles
+POLICY_DISCONNECT = 'disconnect'     # se desconecta al peer
+POLICIES = (POLICY_DROP_OLDEST, POLICY_LATEST, POLICY_DISCONNECT)
+
+DEFAULT_POLICY = POLICY_DROP_OLDEST
+
+# Tramas pendientes por peer como máximo
+DEFAULT_QUEUE_SIZE = 64
+
+# Canales que llevan contenido del portapapeles (un contenido nuevo deja
+# obsoletos los anteriores)
+CONTENT_CHANNELS = (CHANNEL_CLIPBOARD, CHANNEL_TRANSFER, CHANNEL_FORMATS)
+
+# Canales que se adelantan al resto de la cola y no cuentan para su límite
+# ni para la latencia: los latidos miden la red, no la cola
+PRIORITY_CHANNELS = (CHANNEL_HEARTBEAT,)
+
+# Canales que no adelantan a la transferencia activa: el número de secuencia
+# de un contenido no puede llegar antes que su último trozo, o el cliente lo
+# daría por recibido y al reanudar tras un corte no se le reenviaría
+AFTER_STREAM_CHANNELS = (CHANNEL_SESSION,)
+
+# Canales cuyas tramas puede descartar la cola llena si hay otra más nueva
+# del mismo tipo detrás: el receptor solo necesita el último contenido
+SUPERSEDED_CHANNELS = CONTENT_CHANNELS + (CHANNEL_DELTA,)
+
+# Eventos KVM que se pueden descartar: cada posición del puntero deja
+# obsoleta la anterior. Pulsar y soltar teclas o botones, la rueda y los
+# cambios de control nunca se descartan (un botón sin soltar se queda pulsado)
+DROPPABLE_KVM_EVENTS = (EVENT_MOUSE_MOVE,)
+
+
+def droppable_kvm(channel, frame):
+    """True si la trama es un evento KVM que se puede perder"""
+    if channel != CHANNEL_KVM or len(frame) <= FRAME_HEADER.size:
+        return False
+    # Comprimida no se puede mirar el tipo: se conserva
+    if FRAME_HEADER.unpack_from(frame)[2] & FLAG_CODEC_MASK:
+        return False
+    return frame[FRAME_HEADER.size] in DROPPABLE_KVM_EVENTS
+
+
+class OutboundQueue:
+    """
+    Cola acotada de tramas pendientes de un peer.
+
+    No tiene lock propio: la protege quien la usa (PeerWriter con su
+    Condition, o el event loop en el motor asyncio). Además de aplicar la
+    política, mide la latencia de envío de cada trama: desde que se encola
+    hasta que termina de escribirse en el socket.
+
+    Las tramas reenviadas en modo hub se encolan con el instante en que
+    llegaron al hub, así su latencia es la del reenvío completo (fan-out)
+    y se contabiliza aparte.
+
+    Un elemento puede ser una trama (bytes) o una transferencia por trozos
+    (transfer.OutgoingTransfer), que ocupa un solo hueco en la cola: el
+    escritor la convierte en su stream activo y la envía trozo a trozo,
+    intercalando las tramas que se encolen mientras tanto.
+    """
+
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE, policy=DEFAULT_POLICY):
+        if policy not in POLICIES:
+            raise ValueError(f"Política desconocida: {policy}")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.items = deque()
+        self.stream = None
+        self.deferred = []
+        self.stream_queued_at = 0.0
+        self.stream_bytes = 0
+        self.stream_relayed = False
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.relayed = 0
+        self.max_relay_latency = 0.0
+        self.total_relay_latency = 0.0
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, channel, frame, received_at=None):
+        """
+        Encola una trama (o una reenviada por el hub, llegada en
+        received_at). Devuelve False si la política pide desconectar
+        """
+        if channel in PRIORITY_CHANNELS:
+            self.items.appendleft((channel, frame, None, False))
+            return True
+
+        if self.policy == POLICY_LATEST and channel in CONTENT_CHANNELS:
+            # Un portapapeles nuevo deja obsoletos los que aún no salieron
+            pending = len(self.items)
+            self.items = deque(item for item in self.items
+                               if item[0] not in CONTENT_CHANNELS)
+            self.dropped += pending - len(self.items)
+            FRAMES_DROPPED.inc(pending - len(self.items))
+
+        if len(self.items) >= self.maxsize:
+            if self.policy == POLICY_DISCONNECT:
+                return False
+            if not self.drop_one(channel):
+                if not droppable_kvm(channel, frame):
+                    # Solo quedan tramas que no se pueden perder
+                    return False
+                # Se descarta el movimiento nuevo: ya hay otros pendientes
+                self.dropped += 1
+                FRAMES_DROPPED.inc()
+                return True
+
+        if received_at is None:
+            self.items.append((channel, frame, time.perf_counter(), False))
+        else:
+            self.items.append((channel, frame, received_at, True))
+        return True
+
+    def drop_one(self, channel):
+        """
+        Descarta la trama más antigua que se puede perder: un movimiento
+        del puntero o un contenido que deja obsoleto otro posterior (o el
+        que se encola, de `channel`). False si no hay ninguna
+        """
+        superseded = len(self.items) if channel in SUPERSEDED_CHANNELS else max(
+            (index for index, item in enumerate(self.items) if item[0] in SUPERSEDED_CHANNELS),
+            default=0)
+        for index, item in enumerate(self.items):
+            if ((item[0] in SUPERSEDED_CHANNELS and index < superseded)
+                    or (isinstance(item[1], (bytes, bytearray)) and droppable_kvm(item[0], item[1]))):
+                del self.items[index]
+                self.dropped += 1
+                FRAMES_DROPPED.inc()
+                return True
+        return False
+
+    def pop(self):
+        """
+        Saca la trama más antigua: (canal, trama, instante en que se encoló
+        o llegó al hub, si es reenviada). None si es de AFTER_STREAM_CHANNELS
+        y hay una transferencia a medias: se aparta hasta que termine y el
+        escritor sigue con el siguiente trozo
+        """
+        item = self.items.popleft()
+        if self.stream is not None and item[0] in AFTER_STREAM_CHANNELS:
+            self.deferred.append(item)
+            return None
+        return item
+
+    def pending(self):
+        """True si hay tramas encoladas o una transferencia a medio enviar"""
+        return bool(self.items) or self.stream is not None
+
+    def start_stream(self, transfer, peer, queued_at, relayed=False):
+        """
+        Convierte una transferencia sacada de la cola en el stream activo.
+        Si había otra a medias se abandona: el START nuevo la reemplaza
+        también en el receptor.
+        """
+        self.stream = transfer.frames(peer)
+        self.stream_queued_at = queued_at
+        self.stream_bytes = 0
+        self.stream_relayed = relayed
+
+    def end_stream(self):
+        self.stream = None
+        # Lo apartado sale antes que lo encolado después
+        self.items.extendleft(reversed(self.deferred))
+        self.deferred = []
+        self.record_sent(self.stream_bytes, self.stream_queued_at, self.stream_relayed)
+
+    def record_chunk(self, size):
+        """Un trozo de la transferencia activa escrito en el socket"""
+        self.stream_bytes += size
+        count_sent(CHANNEL_TRANSFER, size)
+
+    def record_sent(self, size, queued_at, relayed=False, channel=None):
+        """
+        Una trama (o una transferencia completa, sin canal: sus trozos ya
+        se contaron) escrita en el socket
+        """
+        if channel is not None:
+            count_sent(channel, size)
+        if queued_at is None:
+            # Trama prioritaria: solo cuenta el volumen
+            self.bytes_sent += size
+            return
+        latency = time.perf_counter() - queued_at
+        self.sent += 1
+        self.bytes_sent += size
+        if relayed:
+            self.relayed += 1
+            self.total_relay_latency += latency
+            if latency > self.max_relay_latency:
+                self.max_relay_latency = latency
+            return
+        self.last_latency = latency
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def stats(self):
+        """Profundidad de la cola y latencias de envío y reenvío (en milisegundos)"""
+        own = self.sent - self.relayed
+        return {
+            'depth': len(self.items),
+            'streaming': self.stream is not None,
+            'maxsize': self.maxsize,
+            'policy': self.policy,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'bytes_sent': self.bytes_sent,
+            'last_latency_ms': self.last_latency * 1000,
+            'avg_latency_ms': self.total_latency / own * 1000 if own else 0.0,
+            'max_latency_ms': self.max_latency * 1000,
+            'relayed': self.relayed,
+            'avg_relay_ms': (self.total_relay_latency / self.relayed * 1000
+                             if self.relayed else 0.0),
+            'max_relay_ms': self.max_relay_latency * 1000,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        summary = (f"cola {stats['depth']}/{stats['maxsize']}, {stats['sent']} enviadas, "
+                   f"{stats['dropped']} descartadas, latencia media "
+                   f"{stats['avg_latency_ms']:.1f} ms (máx {stats['max_latency_ms']:.1f} ms)")
+        if stats['relayed']:
+            summary += (f", {stats['relayed']} reenviadas en {stats['avg_relay_ms']:.1f} ms "
+                        f"de media (máx {stats['max_relay_ms']:.1f} ms)")
+        return summary
+
+
+class PeerWriter:
+    """
+    Escritor de un peer para el motor de hilos: un hilo propio vacía la
+    OutboundQueue con sendall. Si el envío falla se llama a on_error(peer, e)
+    y el hilo termina.
+    """
+
+    def __init__(self, conn, name, maxsize=DEFAULT_QUEUE_SIZE, policy=DEFAULT_POLICY,
+                 on_error=None):
+        self.conn = conn
+        self.name = name
+        self.queue = OutboundQueue(maxsize, policy)
+        self.on_error = on_error
+        self.closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"writer-{name}")
+        self._thread.start()
+
+    def send(self, channel, frame, received_at=None):
+        """Encola una trama sin bloquear. Devuelve False si hay que desconectar"""
+        with self._cond:
+            if self.closed:
+                return False
+            if not self.queue.push(channel, frame, received_at):
+                return False
+            self._cond.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self.queue.pending() and not self.closed:
+                    self._cond.wait()
+                if self.closed:
+                    return
+                # Las tramas encoladas van antes que el siguiente trozo
+                item = self.queue.pop() if self.queue else None
+
+            try:
+                if item is None:
+                    self._send_chunk()
+                    continue
+
+                channel, frame, queued_at, relayed = item
+                if not isinstance(frame, (bytes, bytearray)):
+                    with self._cond:
+                        self.queue.start_stream(frame, self.conn, queued_at, relayed)
+                    continue
+
+                self.conn.sendall(frame)
+            except Exception as e:
+                if not self.closed and self.on_error:
+                    self.on_error(self, e)
+                return
+
+            with self._cond:
+                self.queue.record_sent(len(frame), queued_at, relayed, channel)
+
+    def _send_chunk(self):
+        """Envía el siguiente trozo de la transferencia activa"""
+        frame = next(self.queue.stream, None)
+        if frame is not None:
+            self.conn.sendall(frame)
+            self.queue.record_chunk(len(frame))
+            return
+        with self._cond:
+            self.queue.end_stream()
+
+    def close(self):
+        """Detiene el hilo escritor; las tramas pendientes se descartan"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
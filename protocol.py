@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Protocol - Formato de las tramas y de los mensajes de portapapeles
+Cabecera binaria multiplexada por canal, lectura de tramas sin copias,
+digests de contenido, origen e ID de mensaje para suprimir ecos
+"""
+
+import hashlib
+import os
+import struct
+import threading
+from collections import deque, namedtuple
+
+
+# Cabecera de trama: versión, canal, flags y longitud del payload
+FRAME_HEADER = struct.Struct('>BBHI')
+PROTOCOL_VERSION = 1
+
+# Canales: cada trama lleva el suyo y se despacha con una tabla
+CHANNEL_HELLO = 0       # Capacidades del extremo (códecs soportados)
+CHANNEL_CLIPBOARD = 1   # Contenido del portapapeles, en binario sin escapar
+CHANNEL_KVM = 2         # Eventos de mouse/teclado
+CHANNEL_TRANSFER = 3    # Contenidos grandes enviados por trozos (ver transfer.py)
+CHANNEL_DELTA = 4       # Deltas respecto al contenido anterior (ver delta_sync.py)
+CHANNEL_FORMATS = 5     # Contenido en varios formatos: texto, HTML, imagen (ver clipboard_formats.py)
+CHANNEL_PULL = 6        # Anuncios de contenidos grandes y descargas bajo demanda (ver lazy_pull.py)
+CHANNEL_SESSION = 7     # Reanudación de sesión y números de secuencia (ver session.py)
+CHANNEL_HEARTBEAT = 8   # Latidos y medida del RTT (ver heartbeat.py)
+
+# Nombres de los canales para logs y métricas
+CHANNEL_NAMES = {
+    CHANNEL_HELLO: 'hello',
+    CHANNEL_CLIPBOARD: 'clipboard',
+    CHANNEL_KVM: 'kvm',
+    CHANNEL_TRANSFER: 'transfer',
+    CHANNEL_DELTA: 'delta',
+    CHANNEL_FORMATS: 'formats',
+    CHANNEL_PULL: 'pull',
+    CHANNEL_SESSION: 'session',
+    CHANNEL_HEARTBEAT: 'heartbeat',
+}
+
+# Flags: los dos bits bajos indican el códec de compresión (0 = ninguno)
+FLAG_CODEC_MASK = 0x0003
+
+# Tamaño máximo de un mensaje, también una vez descomprimido
+MAX_PAYLOAD_SIZE = 256 * 1024 * 1024
+
+# Tamaño de cada recv_into y del buffer reutilizable entre tramas
+RECV_CHUNK_SIZE = 1024 * 1024
+REUSABLE_BUFFER_SIZE = 4 * 1024 * 1024
+
+DIGEST_SIZE = 16
+ORIGIN_SIZE = 8
+
+# origen, id de mensaje, hash del contenido, tamaño del contenido
+CLIPBOARD_META = struct.Struct('>8sQ16sQ')
+
+# Tipo de contenido de un mensaje: texto UTF-8 o paquete de formatos
+CONTENT_TEXT = 0
+CONTENT_FORMATS = 1
+CONTENT_KIND = struct.Struct('>B')
+
+ContentDigest = namedtuple('ContentDigest', ['hash', 'size'])
+ClipboardMessage = namedtuple('ClipboardMessage', ['origin', 'msg_id', 'digest', 'data', 'kind'],
+                              defaults=(CONTENT_TEXT,))
+
+
+def content_digest(data):
+    """Calcula el digest (hash + longitud) de un contenido en bytes"""
+    return ContentDigest(hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest(), len(data))
+
+
+Frame = namedtuple('Frame', ['channel', 'flags', 'payload'])
+
+
+def pack_frame(channel, payload, flags=0):
+    """Antepone la cabecera de trama a un payload"""
+    return FRAME_HEADER.pack(PROTOCOL_VERSION, channel, flags, len(payload)) + payload
+
+
+def encode_clipboard(message):
+    """Serializa un ClipboardMessage: cabecera fija seguida del contenido"""
+    meta = CLIPBOARD_META.pack(message.origin, message.msg_id,
+                               message.digest.hash, message.digest.size)
+    return meta + message.data
+
+
+def decode_clipboard(payload, kind=CONTENT_TEXT):
+    """
+    Deserializa un mensaje de portapapeles. El contenido se devuelve como
+    una vista del payload, sin copiarlo.
+    """
+    if len(payload) < CLIPBOARD_META.size:
+        raise ValueError("Mensaje de portapapeles truncado")
+    origin, msg_id, digest_hash, size = CLIPBOARD_META.unpack_from(payload)
+    data = memoryview(payload)[CLIPBOARD_META.size:]
+    if len(data) != size:
+        raise ValueError(f"Tamaño inconsistente: {len(data)} != {size}")
+    return ClipboardMessage(origin, msg_id, ContentDigest(digest_hash, size), data, kind)
+
+
+class FrameReader:
+    """
+    Lee tramas con prefijo de longitud de un socket.
+
+    La cabecera se lee completa (aunque llegue en varios trozos) y el
+    payload se escribe directamente en un bytearray preasignado con
+    recv_into, en bloques grandes. read_frame() devuelve un Frame cuyo
+    payload es una memoryview sobre ese buffer: es válida hasta la
+    siguiente llamada, así que quien necesite conservar los datos debe
+    copiarlos.
+
+    Las tramas pequeñas reutilizan siempre el mismo buffer; las mayores
+    que REUSABLE_BUFFER_SIZE reciben uno propio que se libera cuando el
+    consumidor suelta la vista.
+    """
+
+    def __init__(self, sock, chunk_size=RECV_CHUNK_SIZE, max_size=MAX_PAYLOAD_SIZE):
+        self.sock = sock
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self._header = bytearray(FRAME_HEADER.size)
+        self._buffer = bytearray(64 * 1024)
+
+    def _fill(self, view):
+        """Llena `view` por completo. Devuelve los bytes leídos si hay EOF"""
+        received = 0
+        total = len(view)
+        while received < total:
+            n = self.sock.recv_into(view[received:], min(total - received, self.chunk_size))
+            if n == 0:
+                return received
+            received += n
+        return total
+
+    def read_frame(self):
+        """Devuelve la siguiente trama (Frame), o None si se cerró la conexión"""
+        received = self._fill(memoryview(self._header))
+        if received == 0:
+            return None
+        if received < FRAME_HEADER.size:
+            raise ConnectionError("Conexión cerrada a mitad de la cabecera")
+
+        version, channel, flags, size = FRAME_HEADER.unpack(self._header)
+        if version != PROTOCOL_VERSION:
+            raise ValueError(f"Versión de protocolo no soportada: {version}")
+        if self.max_size is not None and size > self.max_size:
+            raise ValueError(f"Trama demasiado grande ({size} bytes)")
+
+        if size > REUSABLE_BUFFER_SIZE:
+            buffer = bytearray(size)
+        else:
+            if size > len(self._buffer):
+                self._buffer = bytearray(REUSABLE_BUFFER_SIZE)
+            buffer = self._buffer
+
+        view = memoryview(buffer)[:size]
+        if self._fill(view) < size:
+            raise ConnectionError("Conexión cerrada a mitad del mensaje")
+        return Frame(channel, flags, view)
+
+
+class ClipboardState:
+    """
+    Estado del portapapeles compartido entre el hilo monitor y los hilos
+    de recepción. Solo guarda el digest del último contenido, nunca el
+    contenido, y recuerda los últimos (origen, id) vistos para descartar
+    duplicados y ecos en O(1).
+    """
+
+    def __init__(self, origin=None, history=256):
+        self.origin = origin or os.urandom(ORIGIN_SIZE)
+        self.last_digest = None
+        self._next_id = 0
+        self._seen = set()
+        self._seen_order = deque()
+        self._history = history
+        self._lock = threading.Lock()
+
+    def new_message(self, data, kind=CONTENT_TEXT):
+        """
+        Crea un mensaje local para `data` o devuelve None si el contenido
+        es el mismo que el último conocido (local o recibido).
+        """
+        digest = content_digest(data)
+        with self._lock:
+            if digest == self.last_digest:
+                return None
+            self.last_digest = digest
+            self._next_id += 1
+            return ClipboardMessage(self.origin, self._next_id, digest, data, kind)
+
+    def accept(self, message):
+        """
+        Decide si un mensaje recibido debe aplicarse. Descarta nuestros
+        propios mensajes rebotados, los ya vistos y los que coinciden con
+        el contenido actual. Si se acepta, pasa a ser el último digest.
+        """
+        with self._lock:
+            if message.origin == self.origin:
+                return False
+            # msg_id 0: mensaje sin identificador
+            if message.msg_id:
+                key = (message.origin, message.msg_id)
+                if key in self._seen:
+                    return False
+                self._seen.add(key)
+                self._seen_order.append(key)
+                if len(self._seen_order) > self._history:
+                    self._seen.discard(self._seen_order.popleft())
+            if message.digest == self.last_digest:
+                return False
+            self.last_digest = message.digest
+            return True
+
+    def seen(self, origin, msg_id):
+        """True si el mensaje (origen, id) ya se recibió (o es un id 0)"""
+        with self._lock:
+            return not msg_id or (origin, msg_id) in self._seen
+
+    def settle(self, digest):
+        """
+        Fija el último digest tras aplicar un contenido que el sistema guarda
+        transformado (p. ej. una imagen recodificada), para que al releerlo
+        no se tome por un cambio local
+        """
+        with self._lock:
+            self.last_digest = digest
+
+    def forget(self, digest):
+        """Olvida el último digest si no se pudo aplicar el contenido"""
+        with self._lock:
+            if self.last_digest == digest:
+                self.last_digest = None
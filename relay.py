@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Relay - Modo hub: el servidor reenvía lo que copia cada cliente a los demás
+Evita bucles recordando los mensajes ya reenviados y el origen de cada peer
+"""
+
+import threading
+from collections import deque
+
+from protocol import CHANNEL_CLIPBOARD, CHANNEL_DELTA
+
+
+# Canales cuyas tramas se reenvían tal cual llegan, sin decodificarlas de
+# nuevo (texto en una sola trama). Los formatos y las transferencias se
+# reenvían como mensaje completo para respetar lo que acepta cada peer
+CUT_THROUGH_CHANNELS = (CHANNEL_CLIPBOARD, CHANNEL_DELTA)
+
+# Mensajes (origen, id) recordados para no reenviarlos dos veces
+RELAY_HISTORY = 1024
+
+
+class RelayTracker:
+    """
+    Decide qué mensajes reenviar y a quién.
+
+    Un mensaje (origen, id) se reenvía una sola vez aunque vuelva a llegar
+    por otro camino, nunca al peer del que llegó y nunca a un peer cuyo
+    origen es el del mensaje (p. ej. el mismo cliente reconectado).
+    """
+
+    def __init__(self, history=RELAY_HISTORY):
+        self.peer_origins = {}
+        self._seen = set()
+        self._seen_order = deque()
+        self._history = history
+        self._lock = threading.Lock()
+
+    def should_relay(self, origin, msg_id, source):
+        """Registra el mensaje; False si ya se reenvió"""
+        with self._lock:
+            self.peer_origins[source] = origin
+            key = (origin, msg_id)
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            self._seen_order.append(key)
+            if len(self._seen_order) > self._history:
+                self._seen.discard(self._seen_order.popleft())
+            return True
+
+    def targets(self, peers, source, origin):
+        """Peers a los que reenviar un mensaje de `origin` llegado de `source`"""
+        with self._lock:
+            return [peer for peer in peers
+                    if peer is not source and self.peer_origins.get(peer) != origin]
+
+    def forget(self, peer):
+        with self._lock:
+            self.peer_origins.pop(peer, None)
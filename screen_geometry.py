@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Screen Geometry - Tamaño de pantalla en caché para convertir coordenadas
+Se calcula una vez y se refresca en segundo plano con un temporizador lento
+"""
+
+import ctypes
+import ctypes.util
+import sys
+import threading
+
+
+# Cada cuántos segundos se vuelve a consultar el tamaño de pantalla
+DEFAULT_REFRESH_INTERVAL = 10.0
+
+
+def probe_windows():
+    """Tamaño de la pantalla principal con GetSystemMetrics"""
+    user32 = ctypes.windll.user32
+    return user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+
+
+def probe_x11():
+    """Tamaño de la pantalla X por defecto (abarca todos los monitores)"""
+    path = ctypes.util.find_library("X11")
+    if not path:
+        raise OSError("libX11 no disponible")
+    xlib = ctypes.cdll.LoadLibrary(path)
+    xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    xlib.XOpenDisplay.restype = ctypes.c_void_p
+    xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+    xlib.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    xlib.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+
+    # Conexión nueva en cada consulta: una abierta no ve cambios de resolución
+    display = xlib.XOpenDisplay(None)
+    if not display:
+        raise OSError("No se pudo abrir el display X11")
+    try:
+        screen = xlib.XDefaultScreen(display)
+        return xlib.XDisplayWidth(display, screen), xlib.XDisplayHeight(display, screen)
+    finally:
+        xlib.XCloseDisplay(display)
+
+
+def probe_tk():
+    """Respaldo: pregunta a Tk (lento, por eso solo se usa al refrescar)"""
+    from tkinter import Tk
+    root = Tk()
+    try:
+        return root.winfo_screenwidth(), root.winfo_screenheight()
+    finally:
+        root.destroy()
+
+
+def default_probes():
+    if sys.platform == 'win32':
+        return [probe_windows, probe_tk]
+    return [probe_x11, probe_tk]
+
+
+class ScreenGeometry:
+    """
+    Proveedor del tamaño de pantalla para KVM.
+
+    El tamaño se calcula al crear el objeto y luego un hilo lo vuelve a
+    consultar cada `refresh_interval` segundos (o al llamar a refresh()),
+    de modo que capturar y reproducir eventos es solo aritmética.
+    """
+
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL, probes=None,
+                 log_callback=None):
+        self.refresh_interval = refresh_interval
+        self.probes = probes or default_probes()
+        self.log_callback = log_callback
+        self.width = 1
+        self.height = 1
+        self._stop = threading.Event()
+        self._thread = None
+        self.refresh()
+
+    def log(self, message, level="info"):
+        if self.log_callback:
+            self.log_callback(message, level)
+
+    def refresh(self):
+        """Consulta el tamaño de pantalla; devuelve True si cambió"""
+        for probe in self.probes:
+            try:
+                width, height = probe()
+                break
+            except Exception:
+                continue
+        else:
+            return False
+
+        if width <= 0 or height <= 0 or (width, height) == (self.width, self.height):
+            return False
+        self.width, self.height = width, height
+        self.log(f"Tamaño de pantalla: {width}x{height}", "info")
+        return True
+
+    def start(self):
+        """Inicia el refresco periódico en segundo plano"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+    def to_relative(self, x, y):
+        """Coordenadas absolutas -> relativas (0-1)"""
+        return x / self.width, y / self.height
+
+    def to_absolute(self, rel_x, rel_y):
+        """Coordenadas relativas (0-1) -> absolutas"""
+        return int(rel_x * self.width), int(rel_y * self.height)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Session - Reconexión de clientes con reanudación de sesión
+El cliente se reconecta con espera exponencial y jitter, y al volver
+presenta su token y el último número de secuencia que recibió: el servidor
+solo le reenvía el último estado si se perdió algún cambio
+"""
+
+import os
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from protocol import ORIGIN_SIZE
+
+
+# Tipo de mensaje del canal de sesión
+SESSION_RESUME = 1    # cliente -> servidor: token, origen, último seq recibido, último id local
+SESSION_RESUMED = 2   # servidor -> cliente: seq actual, si reenvió el estado, si vio el id local
+SESSION_SEQ = 3       # servidor -> clientes: seq actual, tras cada cambio del portapapeles
+
+SESSION_KIND = struct.Struct('>B')
+TOKEN_SIZE = 16
+RESUME = struct.Struct(f'>{TOKEN_SIZE}s{ORIGIN_SIZE}sQQ')
+RESUMED = struct.Struct('>Q??')
+SEQ = struct.Struct('>Q')
+
+# Tiempo máximo para abrir la conexión con el servidor
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+# Espera entre intentos de reconexión: se duplica hasta el máximo
+DEFAULT_RECONNECT_INITIAL = 0.2
+DEFAULT_RECONNECT_MAX = 30.0
+
+# Sesiones que recuerda el servidor (las más antiguas se olvidan)
+DEFAULT_MAX_SESSIONS = 1024
+
+
+def encode_resume(token, origin, last_seq, local_id):
+    return SESSION_KIND.pack(SESSION_RESUME) + RESUME.pack(token, origin, last_seq, local_id)
+
+
+def decode_resume(payload):
+    """(token, origen, último seq recibido, id del último mensaje local)"""
+    return RESUME.unpack_from(payload, SESSION_KIND.size)
+
+
+def encode_resumed(seq, replayed, seen):
+    return SESSION_KIND.pack(SESSION_RESUMED) + RESUMED.pack(seq, replayed, seen)
+
+
+def decode_resumed(payload):
+    """(seq actual, estado reenviado, mensaje local ya visto)"""
+    return RESUMED.unpack_from(payload, SESSION_KIND.size)
+
+
+def encode_seq(seq):
+    return SESSION_KIND.pack(SESSION_SEQ) + SEQ.pack(seq)
+
+
+def decode_seq(payload):
+    return SEQ.unpack_from(payload, SESSION_KIND.size)[0]
+
+
+class Backoff:
+    """
+    Espera exponencial con jitter: cada intento duplica la espera hasta
+    `maximum`, y se duerme un valor al azar entre la mitad y el total para
+    que muchos clientes caídos a la vez no vuelvan todos en el mismo instante
+    """
+
+    def __init__(self, initial=DEFAULT_RECONNECT_INITIAL, maximum=DEFAULT_RECONNECT_MAX):
+        self.initial = initial
+        self.maximum = maximum
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.maximum, self.initial * (2 ** self.attempts))
+        self.attempts += 1
+        return random.uniform(delay / 2, delay)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class SessionRegistry:
+    """
+    Lado servidor: número de secuencia del estado del portapapeles, último
+    mensaje (para reenviarlo a quien se lo perdió) y tokens de las sesiones
+    conocidas. Se usa desde el hilo emisor.
+    """
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.seq = 0
+        self.latest = None
+        self.sessions = OrderedDict()
+        self.max_sessions = max_sessions
+        self.resumed = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+
+    def advance(self, message):
+        """Registra un cambio del portapapeles. Devuelve el nuevo seq"""
+        with self._lock:
+            self.seq += 1
+            self.latest = message
+            return self.seq
+
+    def resume(self, token, origin, last_seq):
+        """
+        Registra la sesión de un cliente que se (re)conecta. Devuelve
+        (mensaje a reenviar o None, seq actual). Un token desconocido con
+        seq 0 es un cliente nuevo; con seq distinto de 0 viene de antes de
+        reiniciar el servidor y se le reenvía el estado actual.
+        """
+        with self._lock:
+            known = token in self.sessions
+            self.sessions[token] = time.time()
+            self.sessions.move_to_end(token)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+            missed = last_seq < self.seq if known else last_seq > 0
+            replay = None
+            if missed and self.latest is not None and self.latest.origin != origin:
+                replay = self.latest
+            if known or last_seq:
+                self.resumed += 1
+            if replay is not None:
+                self.replayed += 1
+            return replay, self.seq
+
+    def summary(self):
+        return (f"{len(self.sessions)} sesiones, {self.resumed} reanudadas, "
+                f"{self.replayed} con el último estado reenviado")
+
+
+class ClientSession:
+    """
+    Lado cliente: token de la sesión (fijo mientras viva el proceso),
+    último seq recibido, último mensaje local (para reenviarlo si el
+    servidor no llegó a verlo) y tiempos de recuperación tras una caída.
+    """
+
+    def __init__(self):
+        self.token = os.urandom(TOKEN_SIZE)
+        self.last_seq = 0
+        self.local = None
+        self.lost_at = None
+        self.reconnects = 0
+        self.last_recovery = 0.0
+        self.max_recovery = 0.0
+        self.total_recovery = 0.0
+        self._lock = threading.Lock()
+
+    def set_local(self, message):
+        """El último estado es un mensaje local (None si es uno recibido)"""
+        with self._lock:
+            self.local = message
+
+    def resume_payload(self, origin):
+        with self._lock:
+            local_id = self.local.msg_id if self.local else 0
+            return encode_resume(self.token, origin, self.last_seq, local_id)
+
+    def connection_lost(self):
+        if self.lost_at is None:
+            self.lost_at = time.perf_counter()
+
+    def resumed(self, seq):
+        """
+        Registra la respuesta del servidor. Devuelve el tiempo de recuperación
+        en segundos desde que se perdió la conexión, o None si no la hubo.
+        """
+        self.last_seq = seq
+        if self.lost_at is None:
+            return None
+        elapsed = time.perf_counter() - self.lost_at
+        self.lost_at = None
+        self.reconnects += 1
+        self.last_recovery = elapsed
+        self.max_recovery = max(self.max_recovery, elapsed)
+        self.total_recovery += elapsed
+        return elapsed
+
+    def stats(self):
+        avg = self.total_recovery / self.reconnects if self.reconnects else 0.0
+        return {
+            'reconnects': self.reconnects,
+            'last_recovery_ms': self.last_recovery * 1000,
+            'avg_recovery_ms': avg * 1000,
+            'max_recovery_ms': self.max_recovery * 1000,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"{stats['reconnects']} reconexiones, recuperación media "
+                f"{stats['avg_recovery_ms']:.0f} ms (máx {stats['max_recovery_ms']:.0f} ms)")
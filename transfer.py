@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Transfer - Envío por trozos de contenidos grandes del portapapeles
+Cada transferencia tiene un ID; el receptor la ensambla a medida que llega
+y el emisor la cancela si un contenido más nuevo la deja obsoleta
+"""
+
+import hashlib
+import struct
+import threading
+
+from protocol import (CHANNEL_TRANSFER, CLIPBOARD_META, CONTENT_KIND, CONTENT_TEXT, DIGEST_SIZE,
+                      ClipboardMessage, ContentDigest)
+
+
+# Tipo de trama de transferencia e ID de la transferencia
+TRANSFER_HEADER = struct.Struct('>BQ')
+
+TRANSFER_START = 1    # seguido de CLIPBOARD_META (origen, id, digest, tamaño total)
+                      # y del tipo de contenido si no es texto
+TRANSFER_DATA = 2     # seguido del siguiente trozo del contenido
+TRANSFER_CANCEL = 3   # el emisor abandona la transferencia
+
+# Los contenidos mayores que un trozo se envían como transferencia
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+# Tamaño máximo de un trozo: ninguna trama de contenido lo supera (con su
+# cabecera), así el receptor puede acotar lo que lee de cada trama
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Tamaño máximo que acepta el receptor para una transferencia
+DEFAULT_MAX_TRANSFER_SIZE = 1024 * 1024 * 1024
+
+
+class OutgoingTransfer:
+    """
+    Transferencia saliente de un mensaje de portapapeles.
+
+    frames(peer) genera las tramas para un peer bajo demanda: el escritor
+    de cada peer pide el siguiente trozo solo cuando ha enviado el anterior,
+    así que la memoria por peer es de un trozo sea cual sea el tamaño. Cada
+    trozo se comprime por separado con build_frame(canal, payload, peer).
+    """
+
+    def __init__(self, transfer_id, message, build_frame, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.transfer_id = transfer_id
+        self.message = message
+        self.build_frame = build_frame
+        self.chunk_size = chunk_size
+        self.cancelled = False
+
+    def cancel(self):
+        """Marca la transferencia como obsoleta; los escritores envían CANCEL"""
+        self.cancelled = True
+
+    def frames(self, peer):
+        message = self.message
+        header = TRANSFER_HEADER.pack(TRANSFER_START, self.transfer_id)
+        meta = CLIPBOARD_META.pack(message.origin, message.msg_id,
+                                   message.digest.hash, message.digest.size)
+        if message.kind != CONTENT_TEXT:
+            meta += CONTENT_KIND.pack(message.kind)
+        if self.cancelled:
+            return
+        yield self.build_frame(CHANNEL_TRANSFER, header + meta, peer)
+
+        data_header = TRANSFER_HEADER.pack(TRANSFER_DATA, self.transfer_id)
+        view = memoryview(message.data)
+        for offset in range(0, len(view), self.chunk_size):
+            if self.cancelled:
+                cancel = TRANSFER_HEADER.pack(TRANSFER_CANCEL, self.transfer_id)
+                yield self.build_frame(CHANNEL_TRANSFER, cancel, peer)
+                return
+            yield self.build_frame(CHANNEL_TRANSFER,
+                                   data_header + view[offset:offset + self.chunk_size], peer)
+
+
+class IncomingTransfer:
+    """
+    Transferencia entrante. Los trozos se añaden directamente al buffer
+    final y el hash se calcula a medida que llegan, así que no hay una
+    segunda copia del contenido. El buffer crece con lo recibido y no se
+    reserva con el tamaño anunciado: un START de pocos bytes no puede hacer
+    que el receptor (el hub, con miles de peers) reserve un GiB de golpe.
+    """
+
+    def __init__(self, transfer_id, meta, max_size=DEFAULT_MAX_TRANSFER_SIZE):
+        if len(meta) < CLIPBOARD_META.size:
+            raise ValueError("Inicio de transferencia truncado")
+        origin, msg_id, digest_hash, size = CLIPBOARD_META.unpack_from(meta)
+        if size > max_size:
+            raise ValueError(f"Transferencia demasiado grande ({size} bytes)")
+        self.transfer_id = transfer_id
+        self.origin = origin
+        self.msg_id = msg_id
+        self.digest = ContentDigest(digest_hash, size)
+        self.kind = CONTENT_TEXT
+        if len(meta) > CLIPBOARD_META.size:
+            (self.kind,) = CONTENT_KIND.unpack_from(meta, CLIPBOARD_META.size)
+        self.buffer = bytearray()
+        self.received = 0
+        self._hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+    @property
+    def complete(self):
+        return self.received == self.digest.size
+
+    def write(self, chunk):
+        end = self.received + len(chunk)
+        if end > self.digest.size:
+            raise ValueError("La transferencia excede el tamaño anunciado")
+        self.buffer += chunk
+        self._hasher.update(chunk)
+        self.received = end
+
+    def message(self):
+        """Mensaje ensamblado; comprueba que el hash coincide con el anunciado"""
+        if self._hasher.digest() != self.digest.hash:
+            raise ValueError("El contenido recibido no coincide con su digest")
+        return ClipboardMessage(self.origin, self.msg_id, self.digest, memoryview(self.buffer),
+                                self.kind)
+
+
+class TransferReceiver:
+    """
+    Transferencias entrantes en curso, una por peer (TCP mantiene el orden,
+    así que un START nuevo de un peer reemplaza a la anterior).
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_TRANSFER_SIZE):
+        self.max_size = max_size
+        self.transfers = {}
+        self._lock = threading.Lock()
+
+    def feed(self, payload, peer):
+        """
+        Procesa una trama de transferencia. Devuelve el ClipboardMessage
+        cuando la transferencia se completa, o None mientras tanto.
+        """
+        if len(payload) < TRANSFER_HEADER.size:
+            raise ValueError("Trama de transferencia truncada")
+        kind, transfer_id = TRANSFER_HEADER.unpack_from(payload)
+        body = memoryview(payload)[TRANSFER_HEADER.size:]
+
+        with self._lock:
+            if kind == TRANSFER_START:
+                self.transfers[peer] = IncomingTransfer(transfer_id, body, self.max_size)
+                transfer = self.transfers[peer]
+            else:
+                transfer = self.transfers.get(peer)
+                if transfer is None or transfer.transfer_id != transfer_id:
+                    return None
+                if kind == TRANSFER_CANCEL:
+                    del self.transfers[peer]
+                    return None
+                if kind != TRANSFER_DATA:
+                    return None
+
+                try:
+                    transfer.write(body)
+                except ValueError:
+                    del self.transfers[peer]
+                    raise
+
+            if not transfer.complete:
+                return None
+            del self.transfers[peer]
+
+        return transfer.message()
+
+    def active(self, peer):
+        """True si hay una transferencia de `peer` a medio recibir"""
+        with self._lock:
+            return peer in self.transfers
+
+    def discard(self, peer):
+        """Olvida la transferencia en curso de un peer desconectado"""
+        with self._lock:
+            self.transfers.pop(peer, None)